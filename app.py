@@ -1,12 +1,22 @@
 import os
 import logging
-import requests
+import hashlib
+import json
+import mimetypes
+from functools import wraps
 from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash, Response, stream_with_context, session
 from werkzeug.middleware.proxy_fix import ProxyFix
 from youtube_service import YouTubeService
-from download_service import DownloadService
-from cache import Cache
+from http_client import upstream_client
+from download_service import DownloadService, DownloadQueueFull, url_ttl
+from event_bus import WatcherLimit, event_bus
+from stream_proxy import stream_proxy
+from storage_manager import StorageManager
+from cache import CacheRegistry
+from cache_backends import backend_from_env
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
@@ -50,20 +60,157 @@ def make_session_permanent():
     app.permanent_session_lifetime = 31536000  # 1 year
     session.permanent = True
 
-# Initialize services
-youtube_service = YouTubeService()
-download_service = DownloadService()
 
-# Initialize cache with specific settings
-search_cache = Cache(ttl_seconds=3600, max_size=100, prefix="search")
+# One namespace per kind of data so hot, short-lived entries (stream URLs)
+# and colder ones (search pages) never compete for the same slots.
+# CACHE_BACKEND_URL adds a store shared by all gunicorn workers behind them,
+# and CACHE_DISK_DIR a disk tier that keeps the caches warm across restarts.
+caches = CacheRegistry(
+    backend=backend_from_env(),
+    disk_dir=os.environ.get("CACHE_DISK_DIR"),
+    disk_max_bytes=int(os.environ.get("CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024))
+)
+# Search and channel pages are refreshed in the background for up to an
+# hour past their TTL instead of being dropped
+search_cache = caches.create(
+    "search",
+    ttl_seconds=3600,
+    hard_ttl_seconds=7200,
+    max_size=None,
+    max_bytes=int(os.environ.get("SEARCH_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+)
+channel_cache = caches.create(
+    "channel",
+    ttl_seconds=3600,
+    hard_ttl_seconds=7200,
+    max_size=None,
+    max_bytes=32 * 1024 * 1024
+)
+# googlevideo URLs expire upstream after a few hours and are re-requested on
+# every seek, so keep many of them with a short TTL and evict the least used.
+# No refresh-ahead: a refresh would read the same URL back from the
+# extraction cache, so entries simply expire with their URL.
+stream_url_cache = caches.create(
+    "stream_url",
+    ttl_seconds=1800,
+    max_size=5000,
+    refresh_ahead=None,
+    policy="lfu"
+)
+thumbnail_cache = caches.create(
+    "thumbnail",
+    ttl_seconds=86400,
+    max_size=None,
+    max_bytes=16 * 1024 * 1024,
+    refresh_ahead=None,
+    policy="fifo"
+)
+# Sanitized yt-dlp info dicts, shared by the options dialog, downloads and
+# streaming; each expires shortly before its signed format URLs do
+extraction_cache = caches.create(
+    "extraction",
+    ttl_seconds=1800,
+    max_size=None,
+    max_bytes=64 * 1024 * 1024,
+    refresh_ahead=None
+)
+
+# Top searches per period, read from the counter tables
+popular_search_cache = caches.create(
+    "popular_searches",
+    ttl_seconds=60,
+    max_size=16
+)
+
+# Per-user search totals for the history page, dropped when a user deletes searches
+search_stats_cache = caches.create(
+    "search_stats",
+    ttl_seconds=300,
+    max_size=10000,
+    refresh_ahead=None
+)
+
+# Which URL format (/c/, /channel/, /@, /user/) each channel ID resolved to
+channel_url_cache = caches.create(
+    "channel_url",
+    ttl_seconds=7 * 86400,
+    max_size=10000,
+    refresh_ahead=None
+)
+
+# Initialize services
+youtube_service = YouTubeService(channel_urls=channel_url_cache)
+download_service = DownloadService(info_cache=extraction_cache)
+# Open job event streams each hold a request thread, so they are capped
+event_watchers = WatcherLimit.from_env()
 
 # Import models after db initialization
 from models import User, SearchHistory, Video, UserVideo
+from pagination import keyset_page
+from schema import ensure_schema
+from search_index import SEARCH_MODES, SearchIndex
+from search_persistence import (
+    POPULAR_PERIODS, SearchWriteBuffer, backfill_search_counts, indexed_videos, newest_indexed_videos,
+    pending_search, popular_searches, search_history_page, search_history_stats, write_searches
+)
+
+def _write_searches(searches):
+    with app.app_context():
+        return write_searches(db.session, searches)
+
+# Search history is written behind the request, in batches
+search_writes = SearchWriteBuffer.from_env(_write_searches)
+
+# Stored videos searchable without YouTube. SEARCH_MODE decides how /search
+# uses them on a cache miss: "off" (the default) never, so no worker pays for
+# an index unless it is asked for; "prefill" answers at once with a
+# partial page the browser then replaces with the upstream one, "local"
+# answers outright when there are SEARCH_LOCAL_MIN_RESULTS matches, and
+# "offline" never contacts YouTube. Except with "off", local results also
+# stand in when the upstream scrape fails.
+search_index = SearchIndex.from_env()
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "off")
+if SEARCH_MODE not in SEARCH_MODES:
+    raise ValueError(f"SEARCH_MODE must be one of {', '.join(SEARCH_MODES)}, not {SEARCH_MODE!r}")
+SEARCH_LOCAL_MIN_RESULTS = int(os.environ.get("SEARCH_LOCAL_MIN_RESULTS", 10))
+
+def _load_indexed_videos(since, after_id, limit):
+    with app.app_context():
+        return indexed_videos(db.session, since, after_id, limit)
+
+def _load_newest_videos(limit):
+    with app.app_context():
+        return newest_indexed_videos(db.session, limit)
+
+def _pinned_downloads():
+    """Files referenced by saved videos; the storage manager never evicts these"""
+    with app.app_context():
+        rows = db.session.query(UserVideo.download_path).filter(UserVideo.download_path.isnot(None)).distinct().all()
+        return {os.path.abspath(path) for (path,) in rows}
+
+# Keeps static/downloads under DOWNLOADS_QUOTA_BYTES
+storage_manager = StorageManager.from_env(
+    download_service.download_folder,
+    pinned=_pinned_downloads,
+    on_evict=download_service.store.forget
+)
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+# Usernames allowed to see operational endpoints, e.g. ADMIN_USERS="alice,bob"
+ADMIN_USERS = {name.strip() for name in os.environ.get("ADMIN_USERS", "").split(",") if name.strip()}
+
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if current_user.username not in ADMIN_USERS:
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapped
+
 # Forms for authentication
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
@@ -95,61 +242,120 @@ with app.app_context():
         logger.error(f"Database connection error: {str(e)}")
         pass
 
+@app.cli.command("migrate")
+def migrate_command():
+    """Add columns and indexes models gained to an existing database
+
+    Run once per deploy before the workers start (``flask --app app migrate``);
+    the workers themselves only create missing tables. Also fills the search
+    counters from the history the first time they exist.
+    """
+    ensure_schema(db)
+    counted = backfill_search_counts(db.session)
+    if counted:
+        print(f"Search counters filled from {counted} searches")
+    print("Database schema is up to date")
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def _page_cache_key(base: str, cursor=None) -> str:
+    """Cache key for one page of results; continuation cursors are long, so hash them"""
+    if not cursor:
+        return base
+    return f"{base}:page:{hashlib.sha1(cursor.encode()).hexdigest()}"
+
+def _record_search(query, search_type, results):
+    """Queue a search and the videos it found for writing (needs a request context for current_user)"""
+    user_id = current_user.id if current_user.is_authenticated else None
+    search_writes.add(pending_search(query, search_type, results, user_id))
+
+def _index_results(results):
+    """Make freshly scraped videos searchable locally right away"""
+    if SEARCH_MODE != 'off' and results.get('search_type') == 'videos':
+        search_index.add(results.get('results', []))
+
+def _local_search(query, search_type, cursor=None):
+    """A results page from the local index, shaped like the upstream one"""
+    search_index.start(_load_indexed_videos, _load_newest_videos)
+    if SEARCH_MODE == 'offline':
+        # The first searches after a start would otherwise see an empty index
+        search_index.wait_loaded(timeout=5)
+    if search_type == 'channels':
+        channels = [] if cursor else search_index.search_channels(query)
+        return {'channels': channels, 'search_type': 'channels', 'total_results': len(channels),
+                'next_cursor': None, 'source': 'local'}
+    videos = [] if cursor else search_index.search(query)
+    return {'results': videos, 'search_type': 'videos', 'total_results': len(videos),
+            'next_cursor': None, 'source': 'local'}
+
+def _local_answer(query, search_type, cursor, upstream_requested):
+    """The local page to answer a cache miss with instead of scraping, per SEARCH_MODE, or None"""
+    if SEARCH_MODE == 'offline':
+        return _local_search(query, search_type, cursor)
+    if SEARCH_MODE == 'off' or cursor or upstream_requested:
+        return None
+    local = _local_search(query, search_type)
+    if SEARCH_MODE == 'local' and local['total_results'] >= SEARCH_LOCAL_MIN_RESULTS:
+        return local
+    if SEARCH_MODE == 'prefill' and local['total_results']:
+        # The browser asks again with upstream=1 for the full page
+        local['partial'] = True
+        return local
+    return None
+
+def _local_fallback(query, search_type, cursor):
+    """Local results to serve when the upstream scrape failed, or None"""
+    if SEARCH_MODE == 'off':
+        return None
+    local = _local_search(query, search_type, cursor)
+    return local if local['total_results'] else None
+
 @app.route('/search')
 def search():
     query = request.args.get('q', '')
     search_type = request.args.get('type', 'channels')
+    cursor = request.args.get('cursor') or None
+    upstream_requested = request.args.get('upstream') == '1'
     
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
 
-    cache_key = f"{search_type}:{query.lower()}"
-    cached_results = search_cache.get(cache_key)
+    cache_key = _page_cache_key(f"{search_type}:{query.lower()}", cursor)
+    fetched = []
 
-    if cached_results:
-        logger.debug(f"Cache hit for {search_type} search query: {query}")
-        return jsonify(cached_results)
+    def fetch_results():
+        fetched.append(True)
+        results = youtube_service.search(query, search_type=search_type, cursor=cursor)
+        _index_results(results)
+        return results
 
     try:
-        results = youtube_service.search(query, search_type=search_type)
-        search_cache.set(cache_key, results)
-        
-        try:
-            search_history = SearchHistory()
-            search_history.query_column=query
-            search_history.results_count=len(results.get('results', [])) if search_type == 'videos' else len(results.get('channels', []))
-            search_history.user_id=current_user.id if current_user.is_authenticated else None
-            
-            db.session.add(search_history)
-
-            if search_type == 'videos':
-                for video in results.get('results', []):
-                    try:
-                        existing_video = Video.query.get(video['id'])
-                        if not existing_video:
-                            db_video = Video()
-                            db_video.id=video['id']
-                            db_video.title=video['title']
-                            db_video.thumbnail_url=video['thumbnail']
-                            db_video.search_query_id=search_history.id
-                            db.session.add(db_video)
-                        else:
-                            existing_video.search_query_id = search_history.id
-                    except Exception:
-                        continue
+        results = search_cache.get(cache_key)
+        if results is None:
+            results = _local_answer(query, search_type, cursor, upstream_requested)
+            if results is not None:
+                if not cursor and not results.get('partial'):
+                    _record_search(query, search_type, results)
+                return jsonify(results)
+
+            # Concurrent misses for the same query share a single upstream scrape
+            results = search_cache.get_or_compute(cache_key, fetch_results)
+
+        if not fetched:
+            logger.debug(f"Cache hit for {search_type} search query: {query}")
+
+        # Only the first page is a new search; later pages are the same one scrolled
+        if not cursor:
+            _record_search(query, search_type, results)
 
-            db.session.commit()
-        except Exception as db_error:
-            logger.error(f"Database error: {str(db_error)}")
-            db.session.rollback()
-            
         return jsonify(results)
     except Exception as e:
         logger.error(f"Search error: {str(e)}")
+        local = _local_fallback(query, search_type, cursor)
+        if local is not None:
+            return jsonify(local)
         return jsonify({'error': 'Failed to fetch search results'}), 500
 
 @app.route('/channel/')
@@ -158,71 +364,59 @@ def channel(channel_id=None):
     if not channel_id or channel_id.strip() == '':
         return render_template('index.html', focus_channels=True)
 
+    cursor = request.args.get('cursor') or None
+    cache_key = _page_cache_key(channel_id, cursor)
+
     try:
-        channel_data = youtube_service.get_channel_videos(channel_id)
+        channel_data = channel_cache.get_or_compute(
+            cache_key,
+            lambda: youtube_service.get_channel_videos(channel_id, cursor=cursor),
+            cache_if=lambda data: not data.get('error')
+        )
+
+        # Further pages are fetched by the channel page's "Load more" button
+        if cursor:
+            if channel_data.get('error'):
+                return jsonify(channel_data), 404
+            return jsonify(channel_data)
+
         if channel_data.get('error'):
             return render_template('error.html', error=channel_data['error']), 404
         return render_template('channel.html', channel=channel_data)
     except Exception as e:
         logger.error(f"Channel fetch error: {str(e)}")
+        if cursor:
+            return jsonify({'error': 'Failed to fetch channel data'}), 500
         return render_template('error.html', error="Failed to fetch channel data"), 500
 
 @app.route('/video/stream/<video_id>')
 def stream_video(video_id):
     """Proxy the video stream from YouTube through our server with Range support"""
     try:
-        import yt_dlp
-        cache_key = f"stream_url:{video_id}"
-        url = search_cache.get(cache_key)
+        def extract_stream_format():
+            info = download_service.extract_info(video_id)
+            return download_service.stream_format(info) if info else None
+
+        # Reuses the extraction shared with downloads; concurrent viewers wait for one URL
+        stream = stream_url_cache.get_or_compute(
+            f"format:{video_id}", extract_stream_format, ttl=lambda fmt: url_ttl(fmt['url'])
+        )
+
+        # A finished download with audio and video, at least as good as the
+        # stream, is served from disk instead of proxied
+        stored = download_service.stored_stream(video_id, stream)
+        if stored:
+            mime_type = mimetypes.guess_type(stored['file_path'])[0]
+            return stream_proxy.serve_file(video_id, stored['file_path'], mime_type)
         
-        if not url:
-            ydl_opts = {
-                'format': 'best[ext=mp4]/best',
-                'quiet': True,
-                'no_warnings': True,
-                'cookiefile': download_service.cookies_path if os.path.exists(download_service.cookies_path) else None,
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-                url = info.get('url')
-                if url:
-                    search_cache.set(cache_key, url)
-        
-        if not url:
+        if not stream:
             return "Could not find stream URL", 404
         
+        # The signed URL is tied to the client that extracted it, so send its headers
         headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+            'User-Agent': stream['http_headers'].get('User-Agent') or 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         }
-        range_header = request.headers.get('Range')
-        if range_header and req and req.headers:
-            headers['Range'] = range_header
-            
-        req = requests.get(url, headers=headers, stream=True, timeout=15)
-        
-        if req and req.headers:
-            response_headers = {
-                'Accept-Ranges': 'bytes',
-                'Content-Type': req.headers.get('Content-Type', 'video/mp4'),
-            }
-            
-            for h in ['Content-Length', 'Content-Range', 'Accept-Ranges']:
-                if h in req.headers:
-                    response_headers[h] = req.headers[h]
-        else:
-            return "Failed to fetch stream metadata", 500
-            
-        def generate():
-            try:
-                for chunk in req.iter_content(chunk_size=128*1024):
-                    if chunk:
-                        yield chunk
-            except Exception as e:
-                logger.error(f"Stream generation error: {e}")
-                
-        return Response(stream_with_context(generate()), 
-                        status=req.status_code,
-                        headers=response_headers)
+        return stream_proxy.proxy_cached(video_id, stream.get('format_id'), stream['url'], headers)
     except Exception as e:
         logger.error(f"Streaming error: {str(e)}")
         return str(e), 500
@@ -231,54 +425,138 @@ def stream_video(video_id):
 def not_found_error(error):
     return render_template('error.html', error="Page not found"), 404
 
+def _get_available_streams(video_id):
+    # The extraction behind it is cached; listing its formats is cheap
+    return download_service.get_available_streams(video_id)
+
+def _fetch_thumbnail(url):
+    """Fetch thumbnail bytes, or None if upstream has none"""
+    response = upstream_client.get(url)
+    return response.content if response.ok else None
+
 @app.route('/video/download-options/<video_id>')
 def video_download_options(video_id):
     if not video_id:
         return jsonify({'error': 'Video ID is required'}), 400
     try:
-        streams_data = download_service.get_available_streams(video_id)
+        streams_data = _get_available_streams(video_id)
         return jsonify(streams_data)
     except Exception as e:
         return jsonify({'error': 'Failed to get download options'}), 500
 
+def _with_download_url(result):
+    """Add the /downloads URL for a result's file, so fetching it counts as an access"""
+    if result.get('success') and result.get('file_path'):
+        rel = os.path.relpath(os.path.abspath(result['file_path']), download_service.download_folder)
+        if not rel.startswith('..'):
+            result['download_url'] = '/downloads/' + rel.replace(os.sep, '/')
+    return result
+
+def _run_download(video_id, itag, progress=None):
+    """Serve the stored copy of a video and format, downloading it only once"""
+    result = download_service.store.get_or_create(
+        video_id, itag, lambda: _download_fresh(video_id, itag, progress)
+    )
+    # The new file may have pushed the folder over its quota
+    storage_manager.enforce()
+    return _with_download_url(result)
+
+def _download_fresh(video_id, itag, progress=None):
+    """Download a video, falling back to the best format and then to its thumbnail"""
+    streams_data = _get_available_streams(video_id)
+    result = download_service.download_video(video_id, itag, progress)
+    if not result['success'] or 'thumbnail' in result.get('file_path', '').lower():
+        result = download_service.direct_download(video_id, 'best', progress)
+    if not result['success'] and streams_data['success']:
+        title = streams_data.get('title', 'Unknown Video')
+        thumbnail_url = f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg"
+        thumbnail_path = os.path.join(download_service.download_folder, f"{video_id}_thumbnail.jpg")
+        try:
+            thumbnail = thumbnail_cache.get_or_compute(thumbnail_url, lambda: _fetch_thumbnail(thumbnail_url))
+            if thumbnail:
+                with open(thumbnail_path, 'wb') as f:
+                    f.write(thumbnail)
+            result = {
+                'success': True,
+                'title': title,
+                'file_path': os.path.join('static', 'downloads', f"{video_id}_thumbnail.jpg"),
+                'file_size': os.path.getsize(thumbnail_path) / (1024 * 1024),
+                'mime_type': 'image/jpeg',
+                'note': 'Could not download video due to YouTube restrictions. Downloaded thumbnail instead.'
+            }
+        except Exception:
+            return {'success': False, 'error': 'All download methods failed'}
+    return result
+
 @app.route('/video/download/<video_id>')
 def download_video(video_id):
+    """Queue a download; the client polls the returned status_url for the result"""
     if not video_id:
         return jsonify({'error': 'Video ID is required'}), 400
     itag = request.args.get('itag')
     if not itag:
         return jsonify({'error': 'Stream itag is required'}), 400
     try:
-        streams_data = download_service.get_available_streams(video_id)
-        result = download_service.download_video(video_id, itag)
-        if not result['success'] or 'thumbnail' in result.get('file_path', '').lower():
-            result = download_service.direct_download(video_id, 'best')
-        if not result['success'] and streams_data['success']:
-            title = streams_data.get('title', 'Unknown Video')
-            thumbnail_url = f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg"
-            thumbnail_path = os.path.join(download_service.download_folder, f"{video_id}_thumbnail.jpg")
-            try:
-                thumbnail_response = requests.get(thumbnail_url)
-                if thumbnail_response.ok:
-                    with open(thumbnail_path, 'wb') as f:
-                        f.write(thumbnail_response.content)
-                result = {
-                    'success': True,
-                    'title': title,
-                    'file_path': os.path.join('static', 'downloads', f"{video_id}_thumbnail.jpg"),
-                    'file_size': os.path.getsize(thumbnail_path) / (1024 * 1024),
-                    'mime_type': 'image/jpeg',
-                    'note': 'Could not download video due to YouTube restrictions. Downloaded thumbnail instead.'
-                }
-            except Exception:
-                return jsonify({'success': False, 'error': 'All download methods failed'}), 400
-        return jsonify(result)
+        # Someone already downloaded this video and format: hand it over right away
+        stored = download_service.store.lookup(video_id, itag)
+        if stored is not None:
+            return jsonify({'success': True, 'video_id': video_id, 'itag': itag, 'state': 'done',
+                            'result': _with_download_url(stored)})
+        job = download_service.submit_job(video_id, itag, lambda progress: _run_download(video_id, itag, progress))
+    except DownloadQueueFull:
+        return jsonify({'success': False, 'error': 'Too many downloads in progress, please try again shortly'}), 503, {'Retry-After': '10'}
     except Exception as e:
         return jsonify({'error': f'Failed to download video: {str(e)}'}), 500
+    return jsonify({
+        'success': True,
+        **job.to_dict(),
+        'status_url': url_for('download_job_status', job_id=job.id)
+    }), 202
+
+@app.route('/video/download/jobs/<job_id>')
+def download_job_status(job_id):
+    # Jobs run on the worker that queued them; the others read the journal
+    status = download_service.job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Download job not found'}), 404
+    return jsonify({'success': True, **status})
+
+@app.route('/video/download/jobs/<job_id>/events')
+def download_job_events(job_id):
+    """Stream a job's state changes and progress as Server-Sent Events"""
+    if download_service.job_status(job_id) is None and not event_bus.has_topic(job_id):
+        return jsonify({'success': False, 'error': 'Download job not found'}), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID') or 0)
+    except ValueError:
+        after = 0
+    if not event_watchers.acquire():
+        # EventSource gives up on a non-200 answer and the page polls instead
+        return jsonify({'success': False, 'error': 'Too many event streams open, poll the job status'}), 503, {'Retry-After': '5'}
+
+    def generate():
+        # Watchers on the job's own worker sleep on its condition until an
+        # event arrives, others poll the journal; the comment lines keep
+        # proxies from closing quiet connections
+        for seq, event in download_service.job_events(job_id, after=after):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs when the stream ends or the client goes away, started or not
+    response.call_on_close(event_watchers.release)
+    return response
 
 @app.route('/downloads/<path:filename>')
 def download_file(filename):
-    return send_from_directory(download_service.download_folder, filename)
+    response = send_from_directory(download_service.download_folder, filename)
+    storage_manager.record_access(filename)
+    return response
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -323,20 +601,65 @@ def logout():
 def profile():
     return render_template('profile.html')
 
+MY_VIDEOS_PAGE_SIZE = 48
+
 @app.route('/my-videos')
 @login_required
 def my_videos():
-    user_videos = current_user.user_videos
-    return render_template('my_videos.html', user_videos=user_videos)
+    before = request.args.get('before') or None
+    # The card shows each video's title and thumbnail, so load them in the same query
+    statement = select(UserVideo).options(joinedload(UserVideo.video)).where(UserVideo.user_id == current_user.id)
+    try:
+        user_videos, next_cursor = keyset_page(db.session, statement, UserVideo.created_at, UserVideo.id,
+                                               before, MY_VIDEOS_PAGE_SIZE)
+    except ValueError:
+        return redirect(url_for('my_videos'))
+    return render_template(
+        'my_videos.html',
+        user_videos=user_videos,
+        next_cursor=next_cursor,
+        paged=before is not None,
+        total_videos=UserVideo.query.filter_by(user_id=current_user.id).count()
+    )
+
+SEARCH_HISTORY_PAGE_SIZE = 50
+
+def _popular_searches(period):
+    """Top searches for a period; refreshed in the background, so the loader brings its own app context"""
+    def load():
+        with app.app_context():
+            return popular_searches(db.session, period)
+    return popular_search_cache.get_or_compute(period, load)
 
 @app.route('/search-history')
 @login_required
 def search_history():
-    user_searches = SearchHistory.query.filter_by(user_id=current_user.id).order_by(SearchHistory.timestamp.desc()).all()
-    popular_searches = SearchHistory.query.filter(
-        (SearchHistory.user_id != current_user.id) | (SearchHistory.user_id.is_(None))
-    ).group_by(SearchHistory.query_column).order_by(db.func.count(SearchHistory.id).desc()).limit(10).all()
-    return render_template('search_history.html', user_searches=user_searches, popular_searches=popular_searches)
+    before = request.args.get('before') or None
+    try:
+        user_searches, next_cursor = search_history_page(db.session, current_user.id, before, SEARCH_HISTORY_PAGE_SIZE)
+    except ValueError:
+        return redirect(url_for('search_history'))
+
+    if user_searches and not before:
+        last_search = user_searches[0]
+    else:
+        last_search = SearchHistory.query.filter_by(user_id=current_user.id).order_by(
+            SearchHistory.timestamp.desc().nulls_last(), SearchHistory.id.desc()
+        ).first()
+    # Counting and grouping every search the user made is the costly part of the page
+    stats = search_stats_cache.get_or_compute(
+        str(current_user.id), lambda: search_history_stats(db.session, current_user.id)
+    )
+    return render_template(
+        'search_history.html',
+        user_searches=user_searches,
+        next_cursor=next_cursor,
+        paged=before is not None,
+        total_searches=stats['total_searches'],
+        last_search=last_search,
+        most_searched=stats['most_searched'],
+        popular_searches={period: _popular_searches(period) for period in POPULAR_PERIODS}
+    )
 
 @app.route('/clear-search-history', methods=['POST'])
 @login_required
@@ -344,6 +667,7 @@ def clear_search_history():
     try:
         SearchHistory.query.filter_by(user_id=current_user.id).delete()
         db.session.commit()
+        search_stats_cache.delete(str(current_user.id))
         flash('Search history cleared successfully.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -360,12 +684,23 @@ def delete_search(search_id):
             return redirect(url_for('search_history'))
         db.session.delete(search)
         db.session.commit()
+        search_stats_cache.delete(str(current_user.id))
         flash('Search deleted successfully.', 'success')
     except Exception as e:
         db.session.rollback()
         flash('An error occurred while deleting the search.', 'danger')
     return redirect(url_for('search_history'))
 
+def _link_stored_download(user_video):
+    """Point a downloaded UserVideo at the shared stored file rather than a copy"""
+    quality = user_video.download_quality if user_video.download_quality not in (None, 'Unknown') else None
+    record = download_service.store.latest(user_video.video_id, quality) or \
+        download_service.store.latest(user_video.video_id)
+    if record:
+        user_video.download_path = record['file_path']
+        if not quality:
+            user_video.download_quality = record['format']
+
 @app.route('/save-video/<video_id>', methods=['POST'])
 @login_required
 def save_video(video_id):
@@ -390,6 +725,7 @@ def save_video(video_id):
                 user_video.downloaded = True
                 user_video.download_date = datetime.utcnow()
                 user_video.download_quality = video_data.get('download_quality', 'Unknown')
+                _link_stored_download(user_video)
             db.session.add(user_video)
             db.session.commit()
             return jsonify({'success': True, 'message': 'Video saved to your collection'})
@@ -399,6 +735,7 @@ def save_video(video_id):
                 existing.download_date = datetime.utcnow()
                 if video_data.get('download_quality'):
                     existing.download_quality = video_data.get('download_quality')
+                _link_stored_download(existing)
                 db.session.commit()
                 return jsonify({'success': True, 'message': 'Video marked as downloaded'})
             else:
@@ -433,6 +770,29 @@ def delete_video(user_video_id):
     db.session.commit()
     return jsonify({'success': True, 'message': 'Video removed from your collection'})
 
+@app.route('/admin/stats')
+@admin_required
+def admin_stats():
+    return jsonify({
+        'cache': caches.get_stats(),
+        'cache_backend': caches.backend.get_stats() if caches.backend else None,
+        'upstream': upstream_client.get_stats(),
+        # Set when the app is served through asgi.py
+        'async_upstream': app.extensions['async_upstream'].get_stats() if 'async_upstream' in app.extensions else None,
+        'downloads': download_service.get_job_stats(),
+        'download_store': download_service.store.get_stats(),
+        'events': event_bus.get_stats(),
+        'event_watchers': event_watchers.get_stats(),
+        'streams': stream_proxy.get_stats(),
+        'search_writes': search_writes.get_stats(),
+        'search_index': search_index.get_stats()
+    })
+
+@app.route('/admin/storage')
+@admin_required
+def admin_storage():
+    return jsonify(storage_manager.get_usage())
+
 @app.errorhandler(500)
 def internal_error(error):
     return render_template('error.html', error="Internal server error"), 500
@@ -0,0 +1,459 @@
+"""
+ASGI entry point: the upstream-bound routes run on asyncio, everything else
+is the Flask app. Run with e.g.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+/search, /channel/<id>?cursor=..., /video/stream/<id> and
+/video/download-options/<id> wait on YouTube through an httpx.AsyncClient,
+so a request in flight costs a coroutine rather than a worker thread.
+Blocking work (yt-dlp extraction, HTML parsing, cache tiers, the database)
+runs on bounded thread pools. Other routes, including the first page of
+/channel/<id> (a rendered template), are passed to Flask through a2wsgi.
+"""
+
+import os
+import asyncio
+import logging
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from a2wsgi import WSGIMiddleware
+from flask_login import current_user
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import (
+    app as flask_app, search_cache, channel_cache, stream_url_cache, download_service,
+    youtube_service, stream_proxy, search_writes, _page_cache_key,
+    _get_available_streams, _index_results, _local_answer, _local_fallback
+)
+from async_http import AsyncUpstreamClient
+from download_service import url_ttl
+from search_persistence import pending_search
+from segment_cache import INFLIGHT_WAIT_SECONDS, BlockLanding
+from stream_proxy import parse_range
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp extractions take seconds of mostly CPU and blocking I/O each
+extract_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASGI_EXTRACT_THREADS", 8)), thread_name_prefix="extract"
+)
+# Short blocking calls: page parsing, cache tiers, database writes
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASGI_BLOCKING_THREADS", 32)), thread_name_prefix="blocking"
+)
+
+# Cache loaders wait here for scrapes running on the event loop; they are kept
+# apart from the blocking pool so waiting loaders never starve the scrapes
+loader_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASGI_LOADER_THREADS", 32)), thread_name_prefix="loader"
+)
+
+STREAM_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+async def _run(executor: ThreadPoolExecutor, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args, **kwargs))
+
+def blocking(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Awaitable[Any]:
+    return _run(blocking_executor, fn, *args, **kwargs)
+
+def extracting(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Awaitable[Any]:
+    return _run(extract_executor, fn, *args, **kwargs)
+
+# Scrapes in progress, so concurrent misses for one page share a single fetch
+_inflight: Dict[str, asyncio.Task] = {}
+
+def _fetch_done(key: str, task: asyncio.Task) -> None:
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # Retrieved here in case every waiter went away
+
+async def coalesce(key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """Run ``fetch`` once for concurrent callers with the same key; returns (value, ran it)
+
+    The fetch runs as its own task, so a caller that disconnects does not
+    cancel it for the others.
+    """
+    task = _inflight.get(key)
+    ran = task is None
+    if ran:
+        task = asyncio.ensure_future(fetch())
+        _inflight[key] = task
+        task.add_done_callback(partial(_fetch_done, key))
+    return await asyncio.shield(task), ran
+
+async def cached(cache: Any, key: str, fetch: Callable[[], Awaitable[Any]], **kwargs: Any) -> Any:
+    """Cache.get_or_compute with a coroutine function as the loader
+
+    The loader handed to the cache runs ``fetch`` on this event loop and
+    waits for it, so misses share one computation with the Flask routes,
+    and refresh-ahead, which calls the loader again from a background
+    thread, refreshes through the async client too.
+    """
+    loop = asyncio.get_running_loop()
+
+    def load() -> Any:
+        return asyncio.run_coroutine_threadsafe(fetch(), loop).result()
+
+    return await _run(loader_executor, cache.get_or_compute, key, load, **kwargs)
+
+def upstream(request: Request) -> AsyncUpstreamClient:
+    return request.app.state.upstream
+
+# What flask-login needs to load a user: the session and remember cookies,
+# and the headers its session identifier is built from
+USER_HEADERS = ('Cookie', 'User-Agent', 'X-Forwarded-For')
+
+def _request_identity(request: Request) -> Tuple[Dict[str, str], str]:
+    headers = {name: request.headers[name] for name in USER_HEADERS if name in request.headers}
+    return headers, request.client.host if request.client else ''
+
+def _session_user_id(headers: Dict[str, str], remote_addr: str) -> Optional[int]:
+    """The logged-in user's ID, loaded by flask-login as the Flask routes would
+
+    A request context with the request's cookies, user agent and address
+    runs the app's before_request hooks and then the login manager itself,
+    so session protection compares the session's identifier with this
+    client's and treats a replayed cookie exactly as the Flask routes do.
+    """
+    with flask_app.test_request_context('/', headers=headers, environ_base={'REMOTE_ADDR': remote_addr}):
+        flask_app.preprocess_request()
+        return current_user.id if current_user.is_authenticated else None
+
+def _record_search_for(identity: Tuple[Dict[str, str], str], query: str, search_type: str,
+                       results: Dict[str, Any]) -> None:
+    """Queue a search for writing as the user the request belongs to"""
+    search_writes.add(pending_search(query, search_type, results, _session_user_id(*identity)))
+
+async def search(request: Request) -> Response:
+    query = request.query_params.get('q', '')
+    search_type = request.query_params.get('type', 'channels')
+    cursor = request.query_params.get('cursor') or None
+    upstream_requested = request.query_params.get('upstream') == '1'
+
+    if not query:
+        return JSONResponse({'error': 'Query parameter is required'}, status_code=400)
+
+    identity = _request_identity(request)
+
+    cache_key = _page_cache_key(f"{search_type}:{query.lower()}", cursor)
+    results = await blocking(search_cache.get, cache_key)
+    if results is not None:
+        logger.debug(f"Cache hit for {search_type} search query: {query}")
+
+    http = upstream(request)
+
+    async def scrape():
+        if cursor:
+            # Subsequent pages come from the continuation endpoint, not the HTML page
+            call = youtube_service.continuation_request('search', cursor)
+            response = await http.post(call.pop('url'), **call)
+            response.raise_for_status()
+            data = await blocking(response.json)
+        else:
+            call = youtube_service.search_request(query, search_type)
+            response = await http.get(call.pop('url'), **call)
+            response.raise_for_status()
+            data = await blocking(youtube_service.parse_search_page, response.text)
+        results = await blocking(youtube_service.search_results, data, search_type)
+        await blocking(_index_results, results)
+        return results
+
+    if results is None:
+        results = await blocking(_local_answer, query, search_type, cursor, upstream_requested)
+        if results is not None:
+            if not cursor and not results.get('partial'):
+                await blocking(_record_search_for, identity, query, search_type, results)
+            return JSONResponse(results)
+
+        try:
+            # Concurrent misses share one scrape, here and with the Flask routes
+            results, _ = await coalesce(f"search:{cache_key}", lambda: cached(search_cache, cache_key, scrape))
+        except Exception as e:
+            logger.error(f"Search error: {str(e)}")
+            local = await blocking(_local_fallback, query, search_type, cursor)
+            if local is not None:
+                return JSONResponse(local)
+            return JSONResponse({'error': 'Failed to fetch search results'}, status_code=500)
+
+    # Only the first page is a new search; later pages are the same one scrolled
+    if not cursor:
+        # Only queues the write, but loading the user may query the database
+        await blocking(_record_search_for, identity, query, search_type, results)
+    return JSONResponse(results)
+
+async def channel_page(request: Request, channel_id: str, cursor: str) -> Response:
+    """A further page of a channel's videos (JSON for the "Load more" button)"""
+    cache_key = _page_cache_key(channel_id, cursor)
+    channel_data = await blocking(channel_cache.get, cache_key)
+    if channel_data is None:
+        http = upstream(request)
+
+        async def fetch():
+            call = youtube_service.continuation_request('browse', cursor)
+            response = await http.post(call.pop('url'), **call)
+            response.raise_for_status()
+            data = await blocking(response.json)
+            return await blocking(youtube_service.channel_page_results, channel_id, data)
+
+        try:
+            channel_data, _ = await coalesce(f"channel:{cache_key}", lambda: cached(
+                channel_cache, cache_key, fetch, cache_if=lambda data: not data.get('error')
+            ))
+        except Exception as e:
+            logger.error(f"Channel fetch error: {str(e)}")
+            return JSONResponse({'error': 'Failed to fetch channel data'}, status_code=500)
+    if channel_data.get('error'):
+        return JSONResponse(channel_data, status_code=404)
+    return JSONResponse(channel_data)
+
+class ChannelRoute:
+    """Continuation pages are served here; the first page is a template, so Flask renders it"""
+
+    def __init__(self, fallback: Callable):
+        self.fallback = fallback
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        request = Request(scope, receive)
+        cursor = request.query_params.get('cursor')
+        if not cursor:
+            await self.fallback(scope, receive, send)
+            return
+        response = await channel_page(request, request.path_params['channel_id'], cursor)
+        await response(scope, receive, send)
+
+async def download_options(request: Request) -> Response:
+    video_id = request.path_params['video_id']
+    try:
+        return JSONResponse(await extracting(_get_available_streams, video_id))
+    except Exception:
+        return JSONResponse({'error': 'Failed to get download options'}, status_code=500)
+
+async def _wait_for(landing: BlockLanding, timeout: float) -> None:
+    """Wait for a block another request is fetching, without holding a thread or polling"""
+    loop = asyncio.get_running_loop()
+    landed = loop.create_future()
+
+    def wake() -> None:
+        if not landed.done():
+            landed.set_result(None)
+
+    def landed_elsewhere() -> None:
+        # Called by whichever thread or task stores the block
+        try:
+            loop.call_soon_threadsafe(wake)
+        except RuntimeError:
+            pass  # The loop has shut down
+    landing.add_callback(landed_elsewhere)
+    try:
+        await asyncio.wait_for(landed, timeout)
+    except asyncio.TimeoutError:
+        pass
+
+async def _probe(request: Request, url: str, headers: Dict[str, str]) -> Optional[Tuple[int, str]]:
+    """Ask upstream for a stream's total size and content type"""
+    response = await upstream(request).open_stream('GET', url, headers={**headers, 'Range': 'bytes=0-0'})
+    try:
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code != 206 or '/' not in content_range:
+            return None
+        total = content_range.rsplit('/', 1)[1]
+        if not total.isdigit():
+            return None
+        return int(total), response.headers.get('Content-Type', 'video/mp4')
+    finally:
+        await response.aclose()
+
+async def _fetch_blocks(request: Request, video_id: str, format_id: str, url: str, headers: Dict[str, str],
+                        blocks: List[int], size: int) -> AsyncIterator[Tuple[int, bytes]]:
+    """Fetch a run of claimed blocks with one upstream request, storing and yielding each"""
+    segments = stream_proxy.segments
+    first = blocks[0] * segments.block_size
+    last = min((blocks[-1] + 1) * segments.block_size, size) - 1
+    pending = list(blocks)
+    try:
+        response = await upstream(request).open_stream('GET', url, headers={**headers, 'Range': f"bytes={first}-{last}"})
+        try:
+            if response.status_code != 206:
+                raise IOError(f"Upstream returned {response.status_code} for bytes {first}-{last}")
+            buffer = bytearray()
+            async for chunk in response.aiter_raw():
+                buffer += chunk
+                while pending and len(buffer) >= segments.block_length(size, pending[0]):
+                    needed = segments.block_length(size, pending[0])
+                    block = bytes(buffer[:needed])
+                    del buffer[:needed]
+                    index = pending.pop(0)
+                    await blocking(segments.store, video_id, format_id, index, block)
+                    yield index, block
+                if not pending:
+                    break
+            if pending:
+                raise IOError(f"Upstream ended early in block {pending[0]} of {video_id}/{format_id}")
+        finally:
+            await response.aclose()
+    finally:
+        if pending:
+            segments.release(video_id, format_id, pending)
+
+async def _relay_segments(request: Request, video_id: str, format_id: str, url: str, headers: Dict[str, str],
+                          size: int, start: int, end: int, stats: Any) -> AsyncIterator[bytes]:
+    """StreamProxy._relay_segments on the event loop: cached blocks from disk, missing ones from upstream"""
+    segments = stream_proxy.segments
+    block_size = segments.block_size
+    index, last = start // block_size, end // block_size
+
+    def window(i: int) -> Tuple[int, int]:
+        """The requested part of block i, relative to the block"""
+        block_start = i * block_size
+        return max(start - block_start, 0), min(end + 1 - block_start, segments.block_length(size, i))
+
+    try:
+        while index <= last:
+            lo, hi = window(index)
+            data = await blocking(segments.read, video_id, format_id, index, lo, hi)
+            if data is not None:
+                stats.bytes += len(data)
+                yield data
+                index += 1
+                continue
+
+            claimed, event = segments.claim(video_id, format_id, index, last)
+            if event is not None:
+                # Another request is fetching this block; read it once it lands
+                await _wait_for(event, INFLIGHT_WAIT_SECONDS)
+                continue
+            async for fetched, block in _fetch_blocks(request, video_id, format_id, url, headers, claimed, size):
+                lo, hi = window(fetched)
+                stats.bytes += hi - lo
+                yield block[lo:hi]
+                index = fetched + 1
+    except Exception as e:
+        stats.error = str(e)
+        logger.error(f"Stream {stats.id} for {video_id}/{format_id} failed: {str(e)}")
+    finally:
+        stream_proxy.finish(stats)
+
+async def stream_cached(request: Request, video_id: str, format_id: str, url: str,
+                        headers: Dict[str, str]) -> Optional[Response]:
+    """Serve a stream through the segment cache like StreamProxy.proxy_cached
+
+    Returns None when the size cannot be probed, so the caller relays the
+    stream directly instead.
+    """
+    segments = stream_proxy.segments
+    meta = await blocking(segments.get_meta, video_id, format_id)
+    if meta is None:
+        probed = await _probe(request, url, headers)
+        if probed is None:
+            return None
+        meta = await blocking(segments.set_meta, video_id, format_id, *probed)
+    size = meta['size']
+    try:
+        byte_range = parse_range(request.headers.get('range'), size)
+    except ValueError:
+        return Response(status_code=416, headers={'Content-Range': f"bytes */{size}"})
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+
+    response_headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Type': meta['content_type'],
+        'Content-Length': str(end - start + 1)
+    }
+    if byte_range is not None:
+        response_headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+    stats = stream_proxy.track(video_id, "cache")
+    body = _relay_segments(request, video_id, format_id, url, headers, size, start, end, stats)
+    return StreamingResponse(body, status_code=206 if byte_range is not None else 200, headers=response_headers)
+
+async def stream_video(request: Request) -> Response:
+    """Relay a video stream with Range support, holding no thread while bytes flow"""
+    video_id = request.path_params['video_id']
+    try:
+        def extract_stream_format():
+            info = download_service.extract_info(video_id)
+            return download_service.stream_format(info) if info else None
+
+        stream = await extracting(
+            stream_url_cache.get_or_compute, f"format:{video_id}", extract_stream_format,
+            ttl=lambda fmt: url_ttl(fmt['url'])
+        )
+        # A finished download with audio and video, at least as good as the
+        # stream, is served from disk instead of relayed
+        stored = await blocking(download_service.stored_stream, video_id, stream)
+        if stored:
+            return FileResponse(stored['file_path'], media_type=mimetypes.guess_type(stored['file_path'])[0])
+        if not stream:
+            return Response("Could not find stream URL", status_code=404)
+
+        headers = {'User-Agent': stream['http_headers'].get('User-Agent') or STREAM_USER_AGENT}
+        if stream_proxy.segments is not None and stream.get('format_id'):
+            cached = await stream_cached(request, video_id, stream['format_id'], stream['url'], headers)
+            if cached is not None:
+                return cached
+        if 'range' in request.headers:
+            headers['Range'] = request.headers['range']
+        response = await upstream(request).open_stream('GET', stream['url'], headers=headers)
+        if response.status_code >= 400:
+            await response.aclose()
+            return Response(f"Upstream returned {response.status_code}", status_code=502)
+
+        response_headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Type': response.headers.get('Content-Type', 'video/mp4'),
+        }
+        for h in ['Content-Length', 'Content-Range', 'Accept-Ranges']:
+            if h in response.headers:
+                response_headers[h] = response.headers[h]
+
+        stats = stream_proxy.track(video_id, "async")
+
+        async def relay():
+            try:
+                # The server awaits each send, so a slow client slows our reads
+                async for chunk in response.aiter_raw():
+                    stats.bytes += len(chunk)
+                    yield chunk
+            except Exception as e:
+                stats.error = str(e)
+                logger.error(f"Stream {stats.id} for {video_id} failed: {str(e)}")
+            finally:
+                await response.aclose()
+                stream_proxy.finish(stats)
+
+        return StreamingResponse(relay(), status_code=response.status_code, headers=response_headers)
+    except Exception as e:
+        logger.error(f"Streaming error: {str(e)}")
+        return Response(str(e), status_code=500)
+
+@asynccontextmanager
+async def lifespan(starlette_app: Starlette):
+    client = AsyncUpstreamClient.from_env()
+    starlette_app.state.upstream = client
+    # Lets the Flask /admin/stats view report the async client too
+    flask_app.extensions['async_upstream'] = client
+    try:
+        yield
+    finally:
+        flask_app.extensions.pop('async_upstream', None)
+        await client.aclose()
+
+flask_asgi = WSGIMiddleware(flask_app, workers=int(os.environ.get("ASGI_WSGI_THREADS", 32)))
+
+app = Starlette(
+    routes=[
+        Route('/search', search),
+        Route('/channel/{channel_id}', ChannelRoute(flask_asgi)),
+        Route('/video/download-options/{video_id}', download_options),
+        Route('/video/stream/{video_id}', stream_video),
+        Mount('/', app=flask_asgi)
+    ],
+    lifespan=lifespan
+)
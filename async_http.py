@@ -0,0 +1,120 @@
+import os
+import asyncio
+import logging
+from typing import Any, Dict
+
+import httpx
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Methods safe to send twice; urllib3's Retry (behind UpstreamClient) only
+# retries these after a request may have reached the server
+IDEMPOTENT_METHODS = frozenset(Retry.DEFAULT_ALLOWED_METHODS)
+
+class AsyncUpstreamClient:
+    """asyncio counterpart of UpstreamClient for the ASGI serving path
+
+    One httpx.AsyncClient keeps a keep-alive pool per host, like the
+    requests session behind UpstreamClient, but a request waiting on YouTube
+    only holds a coroutine instead of a thread. It is bound to the event loop
+    it was created on, so create it inside the ASGI app's lifespan.
+    """
+
+    def __init__(self, max_connections: int = 1000, max_keepalive: int = 100,
+                 connect_timeout: float = 5.0, read_timeout: float = 15.0,
+                 retries: int = 2, backoff_factor: float = 0.3):
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._max_connections = max_connections
+        self._max_keepalive = max_keepalive
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "retries": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0
+        }
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            follow_redirects=True,
+            http2=False
+        )
+
+    @classmethod
+    def from_env(cls) -> "AsyncUpstreamClient":
+        """Build a client configured from UPSTREAM_* environment variables"""
+        return cls(
+            max_connections=int(os.environ.get("UPSTREAM_ASYNC_MAX_CONNECTIONS", 1000)),
+            max_keepalive=int(os.environ.get("UPSTREAM_ASYNC_MAX_KEEPALIVE", 100)),
+            connect_timeout=float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 5)),
+            read_timeout=float(os.environ.get("UPSTREAM_READ_TIMEOUT", 15)),
+            retries=int(os.environ.get("UPSTREAM_RETRIES", 2)),
+            backoff_factor=float(os.environ.get("UPSTREAM_BACKOFF", 0.3))
+        )
+
+    def _enter(self) -> None:
+        self._stats["requests"] += 1
+        self._stats["in_flight"] += 1
+        self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request and read its whole body, retrying failures the way UpstreamClient does
+
+        Connection failures are retried for any method, since nothing was
+        sent; 429/5xx answers and errors after sending only for idempotent
+        methods, so a POST is never repeated.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        self._enter()
+        try:
+            for attempt in range(self._retries + 1):
+                last_attempt = attempt == self._retries
+                try:
+                    response = await self._client.request(method, url, **kwargs)
+                    if response.status_code not in RETRY_STATUSES or not idempotent or last_attempt:
+                        return response
+                except (httpx.ConnectError, httpx.ConnectTimeout):
+                    if last_attempt:
+                        self._stats["errors"] += 1
+                        raise
+                except httpx.TransportError:
+                    if not idempotent or last_attempt:
+                        self._stats["errors"] += 1
+                        raise
+                self._stats["retries"] += 1
+                await asyncio.sleep(self._backoff_factor * (2 ** attempt))
+        finally:
+            self._stats["in_flight"] -= 1
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    async def open_stream(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request without reading its body; the caller must ``await response.aclose()``"""
+        self._enter()
+        try:
+            request = self._client.build_request(method, url, **kwargs)
+            return await self._client.send(request, stream=True)
+        except httpx.TransportError:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            self._stats["in_flight"] -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        # Counters are only touched from the event loop thread, so no lock
+        return {
+            **self._stats,
+            "max_connections": self._max_connections,
+            "max_keepalive": self._max_keepalive
+        }
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Cache micro-benchmark
+Measures Cache.set/get throughput at several cache sizes, e.g.
+
+    python bench_cache.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from cache import Cache
+
+def _rate(ops, seconds):
+    return f"{ops / seconds:>12,.0f} ops/s"
+
+def bench(size, lookups):
+    """Fill a cache to ``size`` entries, then time hits, misses and churn"""
+    keys = [f"query:{i}" for i in range(size)]
+    cache = Cache(ttl_seconds=3600, max_size=size, prefix="bench")
+
+    start = time.perf_counter()
+    for key in keys:
+        cache.set(key, key)
+    fill = time.perf_counter() - start
+
+    sample = random.choices(keys, k=lookups)
+    start = time.perf_counter()
+    for key in sample:
+        cache.get(key)
+    hits = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(lookups):
+        cache.get(f"missing:{i}")
+    misses = time.perf_counter() - start
+
+    # Writes at capacity: every set evicts the LRU entry
+    start = time.perf_counter()
+    for i in range(lookups):
+        cache.set(f"new:{i}", i)
+    churn = time.perf_counter() - start
+
+    # Short-TTL writes that expire while the cache is full exercise reaping
+    expiring = Cache(ttl_seconds=0, max_size=size, prefix="bench")
+    for key in keys:
+        expiring.set(key, key)
+    start = time.perf_counter()
+    for i in range(lookups):
+        expiring.set(f"new:{i}", i)
+    reap = time.perf_counter() - start
+
+    print(f"size={size:,}")
+    print(f"  set (fill)        {_rate(size, fill)}")
+    print(f"  get (hit)         {_rate(lookups, hits)}")
+    print(f"  get (miss)        {_rate(lookups, misses)}")
+    print(f"  set (evicting)    {_rate(lookups, churn)}")
+    print(f"  set (expiring)    {_rate(lookups, reap)}")
+
+def main():
+    """Main function to handle command line usage"""
+    parser = argparse.ArgumentParser(description="Benchmark Cache set/get throughput")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Cache sizes to benchmark")
+    parser.add_argument("--lookups", type=int, default=200_000, help="Operations per timed phase")
+    args = parser.parse_args()
+
+    random.seed(0)
+    for size in args.sizes:
+        bench(size, args.lookups)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
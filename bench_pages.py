@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Page query benchmark for /search-history and /my-videos
+Seeds --rows searches and saved videos for each of --users users, then
+times the first, middle and last keyset page of each list, the same pages
+read with OFFSET, and the popular-searches lists, e.g.
+
+    python bench_pages.py --rows 100000
+    python bench_pages.py --database-url postgresql://localhost/bench --rows 100000 --without-indexes
+
+Runs against a throwaway SQLite file unless --database-url is given; never
+point it at a database whose data you care about.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BATCH = 5000
+
+def _median_ms(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def seed(db, models, users, rows):
+    """Insert ``rows`` searches and saved videos per user; returns the user IDs"""
+    User, SearchHistory, Video, UserVideo = models
+    now = datetime.utcnow()
+    words = ["music", "news", "cats", "python", "live", "trailer", "remix", "podcast", "review", "tutorial"]
+    user_ids = []
+    for u in range(users):
+        user = User(username=f"bench-{u}-{random.randrange(1 << 30)}", email=f"bench{u}-{random.randrange(1 << 30)}@example.com")
+        db.session.add(user)
+        db.session.flush()
+        user_ids.append(user.id)
+        for start in range(0, rows, BATCH):
+            count = min(BATCH, rows - start)
+            db.session.execute(SearchHistory.__table__.insert(), [{
+                'query': f"{random.choice(words)} {random.choice(words)}",
+                'timestamp': now - timedelta(seconds=(start + i) * 30),
+                'results_count': 20,
+                'user_id': user.id
+            } for i in range(count)])
+            video_ids = [f"b{user.id}-{start + i}"[:20] for i in range(count)]
+            db.session.execute(Video.__table__.insert(), [{
+                'id': video_id, 'title': f"Video {video_id}", 'thumbnail_url': None
+            } for video_id in video_ids])
+            db.session.execute(UserVideo.__table__.insert(), [{
+                'user_id': user.id, 'video_id': video_id, 'favorite': False, 'downloaded': False,
+                'created_at': now - timedelta(seconds=(start + i) * 30), 'updated_at': now
+            } for i, video_id in enumerate(video_ids)])
+        db.session.commit()
+        print(f"  seeded user {user.id}: {rows:,} searches, {rows:,} saved videos")
+    return user_ids
+
+def bench_list(db, label, statement, sort_column, id_column, rows, page_size, repeats):
+    from pagination import encode_cursor, keyset_page
+
+    # Cursors pointing at the middle and the end of the list
+    ordered = statement.order_by(sort_column.desc(), id_column.desc())
+    cursors = {}
+    for name, offset in (("middle", rows // 2), ("last", max(rows - page_size - 1, 0))):
+        row = db.session.execute(ordered.offset(offset).limit(1)).unique().scalars().first()
+        cursors[name] = encode_cursor(getattr(row, sort_column.key), getattr(row, id_column.key))
+
+    print(f"{label} ({rows:,} rows, {page_size} per page)")
+    page = lambda before: keyset_page(db.session, statement, sort_column, id_column, before, page_size)
+    print(f"  keyset first page  {_median_ms(lambda: page(None), repeats):>9.2f} ms")
+    for name, cursor in cursors.items():
+        print(f"  keyset {name:<11} {_median_ms(lambda: page(cursor), repeats):>9.2f} ms")
+    for name, offset in (("middle", rows // 2), ("last", max(rows - page_size, 0))):
+        query = lambda: db.session.execute(ordered.offset(offset).limit(page_size)).unique().scalars().all()
+        print(f"  offset {name:<11} {_median_ms(query, repeats):>9.2f} ms")
+    db.session.expunge_all()
+
+def run(db, models, args):
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import joinedload
+    from search_persistence import POPULAR_PERIODS, popular_searches
+
+    User, SearchHistory, Video, UserVideo = models
+    user_id = args.user_ids[0]
+    bench_list(db, "search history",
+               select(SearchHistory).where(SearchHistory.user_id == user_id),
+               SearchHistory.timestamp, SearchHistory.id, args.rows, 50, args.repeats)
+    bench_list(db, "my videos",
+               select(UserVideo).options(joinedload(UserVideo.video)).where(UserVideo.user_id == user_id),
+               UserVideo.created_at, UserVideo.id, args.rows, 48, args.repeats)
+
+    count = lambda model: db.session.execute(select(func.count()).select_from(model).where(model.user_id == user_id)).scalar()
+    print("counts")
+    print(f"  searches           {_median_ms(lambda: count(SearchHistory), args.repeats):>9.2f} ms")
+    print(f"  saved videos       {_median_ms(lambda: count(UserVideo), args.repeats):>9.2f} ms")
+    print("popular searches")
+    for period in POPULAR_PERIODS:
+        print(f"  {period:<18} {_median_ms(lambda: popular_searches(db.session, period), args.repeats):>9.2f} ms")
+
+def main():
+    """Main function to handle command line usage"""
+    parser = argparse.ArgumentParser(description="Benchmark the search history and my videos page queries")
+    parser.add_argument("--database-url", help="Database to seed (default: a temporary SQLite file)")
+    parser.add_argument("--rows", type=int, default=100_000, help="Searches and saved videos per user")
+    parser.add_argument("--users", type=int, default=2, help="Users to seed; pages are read for the first")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per query (the median is shown)")
+    parser.add_argument("--without-indexes", action="store_true",
+                        help="Repeat the run after dropping the page indexes, for comparison")
+    args = parser.parse_args()
+
+    workdir = None
+    if not args.database_url:
+        workdir = tempfile.mkdtemp(prefix="bench_pages-")
+        args.database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # The app reads its database from the environment at import
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from app import app, db
+    from models import User, SearchHistory, Video, UserVideo
+    models = (User, SearchHistory, Video, UserVideo)
+
+    random.seed(0)
+    with app.app_context():
+        print(f"Seeding {args.database_url}")
+        start = time.perf_counter()
+        args.user_ids = seed(db, models, args.users, args.rows)
+        print(f"  took {time.perf_counter() - start:.1f}s")
+        run(db, models, args)
+
+        if args.without_indexes:
+            page_indexes = [index for model in (SearchHistory, UserVideo) for index in model.__table__.indexes]
+            for index in page_indexes:
+                index.drop(db.engine)
+            print("\nwithout page indexes")
+            run(db, models, args)
+            for index in page_indexes:
+                index.create(db.engine)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,111 +1,668 @@
-from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import heapq
+import os
 import threading
 import logging
+import sys
+import time
 from collections import OrderedDict
+from itertools import islice
+from cache_backends import CacheBackend
+from cache_disk import DiskTier
 
 logger = logging.getLogger(__name__)
 
+# Expired entries reaped per write; keeps set() O(log n) amortized
+REAP_BATCH = 16
+
+# Eviction policies a Cache can be configured with
+POLICIES = ("lru", "fifo", "lfu")
+
+# Entries examined per eviction under the sampled LFU policy
+LFU_SAMPLE = 8
+
+# Per-entry bookkeeping (CacheEntry, OrderedDict node, heap item) charged on top of the value
+ENTRY_OVERHEAD = 200
+
+def estimate_size(value: Any) -> int:
+    """Approximate the memory held by a value, following containers
+
+    Walks dicts, lists, tuples and sets iteratively and counts each object
+    once, so shared strings (e.g. repeated channel names) are not
+    double-counted. Cheap enough to run once per insert.
+    """
+    size = 0
+    seen = set()
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return size
+
 class CacheEntry:
-    def __init__(self, value: Any, ttl: int):
+    """Compact cache record; all times are time.monotonic() seconds"""
+    __slots__ = ("value", "created_at", "ttl", "stale_at", "expires_at", "hits", "loader", "cache_if", "size")
+
+    def __init__(self, value: Any, ttl: int, hard_ttl: Optional[int] = None,
+                 loader: Optional[Callable[[], Any]] = None,
+                 cache_if: Optional[Callable[[Any], bool]] = None,
+                 now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
         self.value = value
-        self.timestamp = datetime.now()
+        self.created_at = now
         self.ttl = ttl
-        self.last_accessed = datetime.now()
+        self.stale_at = now + ttl
+        self.expires_at = now + (hard_ttl if hard_ttl is not None else ttl)
+        self.hits = 0
+        # How to recompute the value, so it can be refreshed in the background
+        self.loader = loader
+        self.cache_if = cache_if
+        self.size = estimate_size(value) + ENTRY_OVERHEAD
+
+    def age(self, now: float) -> float:
+        return now - self.created_at
+
+    def is_stale(self, now: float) -> bool:
+        """Past the soft TTL: still servable while a refresh runs"""
+        return now > self.stale_at
+
+    def is_expired(self, now: float) -> bool:
+        """Past the hard TTL: must not be served at all"""
+        return now > self.expires_at
 
-    def is_expired(self) -> bool:
-        return datetime.now() - self.timestamp > timedelta(seconds=self.ttl)
+def _tier_stats(hits: int, lookups: int) -> Dict[str, Any]:
+    return {
+        "lookups": lookups,
+        "hits": hits,
+        "hit_rate": round(hits / lookups, 4) if lookups else None
+    }
+
+class _Flight:
+    """A computation in progress that concurrent callers can wait on"""
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
 
 class Cache:
-    def __init__(self, ttl_seconds: int = 3600, max_size: int = 1000, prefix: str = ""):
+    def __init__(self, ttl_seconds: int = 3600, max_size: Optional[int] = 1000, prefix: str = "",
+                 compute_timeout: float = 60.0, hard_ttl_seconds: Optional[int] = None,
+                 refresh_ahead: Optional[float] = 0.8, hot_threshold: int = 3,
+                 refresh_workers: int = 2, refresh_retry_seconds: int = 30,
+                 max_bytes: Optional[int] = None, policy: str = "lru",
+                 backend: Optional[CacheBackend] = None,
+                 disk: Optional[DiskTier] = None, warm_keys: int = 100):
+        """
+        ``ttl_seconds`` is the soft TTL. Entries loaded through get_or_compute
+        stay servable until ``hard_ttl_seconds`` and are refreshed in the
+        background once stale. Keys hit at least ``hot_threshold`` times are
+        refreshed ahead of time once ``refresh_ahead`` of their soft TTL has
+        passed (None disables refresh-ahead).
+
+        ``max_bytes`` bounds the estimated memory of all entries; entries are
+        evicted until a new entry fits. ``max_size``
+        still caps the entry count (None for no count limit).
+
+        ``policy`` picks the eviction victim: "lru" (least recently used),
+        "fifo" (oldest insert, hits do not reorder) or "lfu" (fewest hits
+        among the LFU_SAMPLE oldest entries).
+
+        With a ``backend`` the in-process entries act as an L1 in front of a
+        store shared by all worker processes: misses are looked up there and
+        computed or set values are written through to it.
+
+        With a ``disk`` tier, entries evicted from memory are written to disk
+        instead of being lost and misses check the disk before the backend.
+        The ``warm_keys`` most hit keys on disk are loaded at startup.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown cache policy: {policy}")
         self._cache: OrderedDict[str, CacheEntry] = OrderedDict()
         self._default_ttl = ttl_seconds
+        self._stale_window = max((hard_ttl_seconds or ttl_seconds) - ttl_seconds, 0)
         self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._bytes = 0
         self._prefix = prefix
+        self._policy = policy
+        self._backend = backend
+        self._disk = disk
+        # Entries evicted under the lock, written to disk once it is released
+        self._spills: List[Tuple[str, CacheEntry]] = []
+        self._compute_timeout = compute_timeout
+        self._refresh_ahead = refresh_ahead
+        self._hot_threshold = hot_threshold
+        self._refresh_workers = refresh_workers
+        self._refresh_retry_seconds = refresh_retry_seconds
+        self._refresh_executor: Optional[ThreadPoolExecutor] = None
+        self._refresh_state: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Dict[str, _Flight] = {}
+        # Min-heap of (hard deadline, key). Replaced or removed entries leave
+        # stale items behind that are skipped when popped (lazy deletion).
+        self._expiry_heap: List[Tuple[float, str]] = []
         self._lock = threading.RLock()  # Using RLock for nested lock support
         self._stats = {
             "hits": 0,
             "misses": 0,
-            "evictions": 0
+            "evictions": 0,
+            "coalesced": 0,
+            "compute_errors": 0,
+            "stale_hits": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "refreshes_discarded": 0,
+            "rejected": 0,
+            "disk_lookups": 0,
+            "disk_hits": 0,
+            "backend_lookups": 0,
+            "backend_hits": 0
         }
+        if disk is not None and warm_keys:
+            self._warm_start(warm_keys)
 
     def _get_full_key(self, key: str) -> str:
         return f"{self._prefix}:{key}" if self._prefix else key
 
-    def _evict_lru(self) -> None:
-        """Evict the least recently used item from cache"""
-        if self._cache:
-            self._cache.popitem(last=False)  # Remove the first item (least recently used)
-            self._stats["evictions"] += 1
-            logger.debug("Cache eviction performed")
-
-    def _cleanup_expired(self) -> None:
-        """Remove all expired entries from the cache"""
-        now = datetime.now()
-        expired_keys = [
-            key for key, entry in self._cache.items()
-            if entry.is_expired()
-        ]
-        for key in expired_keys:
-            del self._cache[key]
-            self._stats["evictions"] += 1
+    def _remove(self, full_key: str) -> None:
+        """Drop an entry and any refresh bookkeeping for it"""
+        entry = self._cache.pop(full_key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        state = self._refresh_state.get(full_key)
+        if state is not None and state["state"] != "refreshing":
+            del self._refresh_state[full_key]
+
+    def _evict(self) -> None:
+        """Evict one item according to the cache's policy"""
+        if not self._cache:
+            return
+        if self._policy == "lfu":
+            # Sample the oldest entries instead of scanning the whole cache
+            sample = islice(self._cache.items(), LFU_SAMPLE)
+            full_key = min(sample, key=lambda item: item[1].hits)[0]
+        else:
+            # Under LRU and FIFO the first item is the one to go
+            full_key = next(iter(self._cache))
+        if self._disk is not None:
+            self._spills.append((full_key, self._cache[full_key]))
+        self._remove(full_key)
+        self._stats["evictions"] += 1
+        logger.debug("Cache eviction performed")
+
+    def _reap_expired(self, now: float, limit: Optional[int] = REAP_BATCH) -> None:
+        """Remove expired entries in deadline order, at most ``limit`` at a time"""
+        heap = self._expiry_heap
+        reaped = 0
+        while heap and heap[0][0] < now and (limit is None or reaped < limit):
+            deadline, full_key = heapq.heappop(heap)
+            entry = self._cache.get(full_key)
+            # Skip heap items left behind by entries that were replaced or removed
+            if entry is not None and entry.expires_at == deadline:
+                self._remove(full_key)
+                self._stats["evictions"] += 1
+                reaped += 1
+
+        # Rebuild once dead heap items outnumber live entries, so the heap
+        # stays O(n) in size; the O(n) cost is amortized over those writes
+        if len(heap) > 2 * len(self._cache) + 64:
+            self._expiry_heap = [(entry.expires_at, key) for key, entry in self._cache.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _schedule_refresh(self, full_key: str, entry: CacheEntry) -> None:
+        """Recompute an entry on a background worker (caller holds the lock)"""
+        state = self._refresh_state.setdefault(full_key, {
+            "state": "idle",
+            "refreshes": 0,
+            "failures": 0,
+            "last_attempt": None,
+            "last_refresh": None,
+            "last_error": None
+        })
+        if state["state"] == "refreshing":
+            return
+        now = time.monotonic()
+        if state["state"] == "failed" and state["last_attempt"] and \
+                now - state["last_attempt"] < self._refresh_retry_seconds:
+            return
+
+        state["state"] = "refreshing"
+        state["last_attempt"] = now
+        if self._refresh_executor is None:
+            self._refresh_executor = ThreadPoolExecutor(
+                max_workers=self._refresh_workers,
+                thread_name_prefix=f"cache-refresh-{self._prefix or 'default'}"
+            )
+        self._refresh_executor.submit(self._refresh, full_key, entry)
+
+    def _refresh(self, full_key: str, entry: CacheEntry) -> None:
+        loader, cache_if, ttl = entry.loader, entry.cache_if, entry.ttl
+        try:
+            value = loader()
+            if value is None or (cache_if is not None and not cache_if(value)):
+                raise ValueError("refresh produced an uncacheable value")
+            with self._lock:
+                if self._cache.get(full_key) is not entry:
+                    # Deleted, cleared or replaced while the loader ran; storing
+                    # the result would undo that
+                    self._stats["refreshes_discarded"] += 1
+                    state = self._refresh_state.get(full_key)
+                    if state is not None:
+                        state["state"] = "idle"
+                        if full_key not in self._cache:
+                            del self._refresh_state[full_key]
+                    return
+                self._store(full_key, value, ttl, loader, cache_if)
+                state = self._refresh_state[full_key]
+                state["state"] = "idle"
+                state["refreshes"] += 1
+                state["last_refresh"] = time.monotonic()
+                state["last_error"] = None
+                self._stats["refreshes"] += 1
+            self._write_through(full_key, value, ttl)
+            logger.debug(f"Cache refreshed: {full_key}")
+        except Exception as e:
+            logger.warning(f"Background refresh failed for {full_key}: {str(e)}")
+            with self._lock:
+                state = self._refresh_state[full_key]
+                state["state"] = "failed"
+                state["failures"] += 1
+                state["last_error"] = str(e)
+                self._stats["refresh_failures"] += 1
+                # The stale value stays until its hard TTL; drop state if it is already gone
+                if full_key not in self._cache:
+                    del self._refresh_state[full_key]
+
+    def _hit(self, full_key: str, entry: CacheEntry, now: float) -> Any:
+        """Record a hit on a live entry and schedule any refresh it needs (caller holds the lock)"""
+        entry.hits += 1
+        if self._policy == "lru":
+            self._cache.move_to_end(full_key)  # Move to end (most recently used)
+        self._stats["hits"] += 1
+
+        if entry.is_stale(now):
+            self._stats["stale_hits"] += 1
+            self._schedule_refresh(full_key, entry)
+        elif (entry.loader is not None and self._refresh_ahead is not None
+              and entry.hits >= self._hot_threshold
+              and entry.age(now) >= entry.ttl * self._refresh_ahead):
+            # Hot key close to expiry: refresh it before anyone sees it stale
+            self._schedule_refresh(full_key, entry)
+
+        return entry.value
 
     def get(self, key: str) -> Optional[Any]:
-        """Get a value from the cache"""
+        """Get a value from the cache
+
+        Stale entries that know how to reload themselves are returned while a
+        background refresh runs; other stale entries count as misses.
+        """
+        full_key = self._get_full_key(key)
+        now = time.monotonic()
         with self._lock:
-            full_key = self._get_full_key(key)
             entry = self._cache.get(full_key)
 
-            if entry is None:
+            if entry is not None and (entry.is_expired(now) or (entry.loader is None and entry.is_stale(now))):
+                self._remove(full_key)
+                self._stats["evictions"] += 1
+                entry = None
+
+            if entry is not None:
+                return self._hit(full_key, entry, now)
+            if self._disk is None and self._backend is None:
                 self._stats["misses"] += 1
                 return None
 
-            if entry.is_expired():
-                del self._cache[full_key]
-                self._stats["evictions"] += 1
+        # Lower tiers are read outside the lock; they mean disk or network I/O
+        found = None
+        tier = None
+        if self._disk is not None:
+            found = self._disk.get(full_key)
+            tier = "disk"
+        if found is None and self._backend is not None:
+            found = self._backend.get(full_key)
+            tier = "backend"
+
+        with self._lock:
+            if self._disk is not None:
+                self._stats["disk_lookups"] += 1
+            if tier == "backend":
+                self._stats["backend_lookups"] += 1
+            if found is None:
                 self._stats["misses"] += 1
                 return None
-
-            # Update access time and move to end (most recently used)
-            entry.last_accessed = datetime.now()
-            self._cache.move_to_end(full_key)
+            value, remaining = found[0], found[1]
             self._stats["hits"] += 1
+            self._stats[f"{tier}_hits"] += 1
+            # Promote into memory for the rest of the lower-tier entry's lifetime
+            self._store(full_key, value, remaining)
+            if len(found) > 2 and full_key in self._cache:
+                self._cache[full_key].hits = found[2]
+        self._flush_spills()
+        return value
+
+    def _store(self, full_key: str, value: Any, ttl: int,
+               loader: Optional[Callable[[], Any]] = None,
+               cache_if: Optional[Callable[[Any], bool]] = None) -> None:
+        now = time.monotonic()
+        self._reap_expired(now)  # Reap a bounded batch of expired entries first
+
+        hard_ttl = ttl + self._stale_window if loader is not None else ttl
+        entry = CacheEntry(value, ttl, hard_ttl, loader, cache_if, now)
+        if self._max_bytes is not None and entry.size > self._max_bytes:
+            self._stats["rejected"] += 1
+            logger.warning(f"Cache entry too large to store: {full_key} ({entry.size} bytes)")
+            return
 
-            return entry.value
+        # Take out the entry being replaced (its refresh state is kept)
+        previous = self._cache.pop(full_key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+
+        # If we're at max size, evict one item to make room
+        if self._max_size is not None and len(self._cache) >= self._max_size:
+            self._evict()
+
+        # Evict entries until the new one fits the byte budget
+        if self._max_bytes is not None:
+            while self._cache and self._bytes + entry.size > self._max_bytes:
+                self._evict()
+
+        self._cache[full_key] = entry
+        self._bytes += entry.size  # New keys go in at the most recently used end
+        heapq.heappush(self._expiry_heap, (entry.expires_at, full_key))
+
+    def _flush_spills(self) -> None:
+        """Write entries evicted from memory to the disk tier (called without the lock held)"""
+        if self._disk is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            spills, self._spills = self._spills, []
+        items = [
+            (full_key, entry.value, entry.expires_at - now, entry.hits)
+            for full_key, entry in spills if entry.expires_at > now
+        ]
+        if items:
+            self._disk.put_many(items)
+
+    def _write_through(self, full_key: str, value: Any, ttl: float) -> None:
+        """Copy a value to the shared store (called without the lock held)"""
+        if self._backend is not None:
+            self._backend.set(full_key, value, ttl)
+        self._flush_spills()
+
+    def _warm_start(self, limit: int) -> None:
+        """Load the most hit keys from the disk tier into memory"""
+        loaded = 0
+        with self._lock:
+            for full_key, value, remaining, hits in self._disk.hottest(limit):
+                self._store(full_key, value, remaining)
+                if full_key in self._cache:
+                    self._cache[full_key].hits = hits
+                    loaded += 1
+            # Everything just loaded is still on disk; nothing to spill back
+            self._spills = []
+        if loaded:
+            logger.info(f"Cache {self._prefix or 'default'} warmed with {loaded} entries from disk")
+
+    def persist(self) -> None:
+        """Write every live in-memory entry to the disk tier, e.g. before shutdown"""
+        if self._disk is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            items = [
+                (full_key, entry.value, entry.expires_at - now, entry.hits)
+                for full_key, entry in self._cache.items() if entry.expires_at > now
+            ]
+            self._spills = []
+        if items:
+            self._disk.put_many(items)
 
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
         """Set a value in the cache with optional TTL override"""
+        full_key = self._get_full_key(key)
+        ttl_value = ttl if ttl is not None else self._default_ttl
         with self._lock:
-            self._cleanup_expired()  # Clean up expired entries first
+            self._store(full_key, value, ttl_value)
+        self._write_through(full_key, value, ttl_value)
 
-            full_key = self._get_full_key(key)
-            ttl_value = ttl if ttl is not None else self._default_ttl
+    def delete(self, key: str) -> None:
+        """Drop a key from every tier"""
+        full_key = self._get_full_key(key)
+        with self._lock:
+            self._remove(full_key)
+        if self._disk is not None:
+            self._disk.delete(full_key)
+        if self._backend is not None:
+            self._backend.delete(full_key)
 
-            # If we're at max size, evict the LRU item
-            if len(self._cache) >= self._max_size and full_key not in self._cache:
-                self._evict_lru()
+    def get_or_compute(self, key: str, fn: Callable[[], Any],
+                       ttl: Optional[Union[int, Callable[[Any], int]]] = None,
+                       timeout: Optional[float] = None,
+                       cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Get a value, computing it on a miss with only one caller doing the work
 
-            self._cache[full_key] = CacheEntry(value, ttl_value)
-            self._cache.move_to_end(full_key)  # Move to end (most recently used)
-            logger.debug(f"Cache set: {full_key}")
+        Concurrent callers that miss on the same key wait for the first
+        caller's result instead of running ``fn`` themselves. If ``fn`` raises,
+        every waiter gets the same exception and nothing is cached. Waiters give
+        up with TimeoutError after ``timeout`` seconds (the cache's
+        compute_timeout by default); the computation itself keeps running.
+        ``None`` results, or results rejected by ``cache_if``, are returned but
+        not stored. ``ttl`` may be a function of the computed value, for values
+        that carry their own expiry.
+        """
+        value = self.get(key)
+        full_key = self._get_full_key(key)
+        if value is not None:
+            self._adopt(full_key, fn, ttl, cache_if)
+            return value
+
+        with self._lock:
+            # Re-check under the lock: a computation may have just finished
+            entry = self._cache.get(full_key)
+            if entry is not None and not entry.is_stale(time.monotonic()):
+                return entry.value
+
+            flight = self._inflight.get(full_key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._inflight[full_key] = flight
+            else:
+                self._stats["coalesced"] += 1
+
+        if not is_leader:
+            wait_timeout = timeout if timeout is not None else self._compute_timeout
+            if not flight.event.wait(wait_timeout):
+                raise TimeoutError(f"Timed out after {wait_timeout}s waiting for {full_key}")
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = fn()
+            if value is not None and (cache_if is None or cache_if(value)):
+                ttl_value = ttl(value) if callable(ttl) else ttl
+                if ttl_value is None:
+                    ttl_value = self._default_ttl
+                with self._lock:
+                    self._store(full_key, value, ttl_value, fn, cache_if)
+                self._write_through(full_key, value, ttl_value)
+            flight.value = value
+            return value
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self._stats["compute_errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+            flight.event.set()
+
+    def _adopt(self, full_key: str, fn: Callable[[], Any],
+               ttl: Optional[Union[int, Callable[[Any], int]]],
+               cache_if: Optional[Callable[[Any], bool]]) -> None:
+        """Give an entry that has no loader (promoted from disk or the shared
+        store, or set directly) ``fn`` as one, so it is refreshed like an entry
+        get_or_compute stored itself"""
+        with self._lock:
+            entry = self._cache.get(full_key)
+            if entry is None or entry.loader is not None:
+                return
+            ttl_value = ttl(entry.value) if callable(ttl) else ttl
+            entry.loader = fn
+            entry.cache_if = cache_if
+            entry.ttl = ttl_value if ttl_value is not None else self._default_ttl
+            # A lower tier only knows when the value must go, which may be its
+            # hard deadline; refresh it within one TTL of promotion, then keep
+            # it servable stale for the same window as a computed entry
+            entry.stale_at = min(entry.stale_at, entry.created_at + entry.ttl)
+            stale_until = entry.stale_at + self._stale_window
+            if stale_until > entry.expires_at:
+                entry.expires_at = stale_until
+                heapq.heappush(self._expiry_heap, (entry.expires_at, full_key))
 
     def clear(self) -> None:
-        """Clear all items from the cache"""
+        """Clear all items from the cache, including its keys in the shared store"""
+        if self._backend is not None:
+            self._backend.clear(self._get_full_key(""))
+        if self._disk is not None:
+            self._disk.clear()
         with self._lock:
             self._cache.clear()
+            self._bytes = 0
+            self._expiry_heap = []
+            self._refresh_state = {
+                key: state for key, state in self._refresh_state.items()
+                if state["state"] == "refreshing"
+            }
             logger.debug("Cache cleared")
 
-    def get_stats(self) -> Dict[str, int]:
-        """Get cache statistics"""
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics, including per-tier hit rates and per-key refresh state"""
+        disk_stats = self._disk.get_stats() if self._disk is not None else None
         with self._lock:
+            now = time.monotonic()
+            refresh = {
+                key: {
+                    "state": state["state"],
+                    "refreshes": state["refreshes"],
+                    "failures": state["failures"],
+                    "seconds_since_refresh": round(now - state["last_refresh"], 1) if state["last_refresh"] else None,
+                    "last_error": state["last_error"]
+                }
+                for key, state in self._refresh_state.items()
+            }
+            stats = self._stats
+            lookups = stats["hits"] + stats["misses"]
+            memory_hits = stats["hits"] - stats["disk_hits"] - stats["backend_hits"]
+            tiers = {"memory": _tier_stats(memory_hits, lookups)}
+            if self._disk is not None:
+                tiers["disk"] = _tier_stats(stats["disk_hits"], stats["disk_lookups"])
+            if self._backend is not None:
+                tiers["backend"] = _tier_stats(stats["backend_hits"], stats["backend_lookups"])
             return {
                 **self._stats,
                 "size": len(self._cache),
-                "max_size": self._max_size
+                "max_size": self._max_size,
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "policy": self._policy,
+                "backend": self._backend.name if self._backend is not None else None,
+                "ttl": self._default_ttl,
+                "inflight": len(self._inflight),
+                "refreshing": sum(1 for state in self._refresh_state.values() if state["state"] == "refreshing"),
+                "tiers": tiers,
+                "disk": disk_stats,
+                "refresh": refresh
             }
 
     def get_keys(self) -> List[str]:
         """Get all non-expired keys in the cache"""
         with self._lock:
-            self._cleanup_expired()
-            return list(self._cache.keys())
\ No newline at end of file
+            self._reap_expired(time.monotonic(), limit=None)
+            return list(self._cache.keys())
+
+class CacheRegistry:
+    """Named cache namespaces, each with its own capacity, TTL and policy
+
+    Keeping hot, short-lived data (e.g. stream URLs) apart from colder data
+    (e.g. search results) stops one kind from evicting the other.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 256 * 1024 * 1024):
+        """``backend``, if given, is shared by every namespace as their L2.
+        With ``disk_dir`` each namespace also gets a disk tier in
+        ``<disk_dir>/<name>.log``, and memory is persisted to it at exit.
+        """
+        self.backend = backend
+        self._disk_dir = disk_dir
+        self._disk_max_bytes = disk_max_bytes
+        self._caches: Dict[str, Cache] = {}
+        self._lock = threading.Lock()
+        if disk_dir:
+            atexit.register(self.persist)
+
+    def create(self, name: str, **kwargs: Any) -> Cache:
+        """Create a namespace; keyword arguments are passed to Cache
+
+        ``max_bytes`` can be overridden with CACHE_<NAME>_MAX_BYTES and
+        ``ttl_seconds`` with CACHE_<NAME>_TTL.
+        """
+        env_prefix = f"CACHE_{name.upper()}_"
+        if os.environ.get(env_prefix + "MAX_BYTES"):
+            kwargs["max_bytes"] = int(os.environ[env_prefix + "MAX_BYTES"])
+        if os.environ.get(env_prefix + "TTL"):
+            kwargs["ttl_seconds"] = int(os.environ[env_prefix + "TTL"])
+        kwargs.setdefault("prefix", name)
+        kwargs.setdefault("backend", self.backend)
+        if self._disk_dir and "disk" not in kwargs:
+            kwargs["disk"] = DiskTier(os.path.join(self._disk_dir, f"{name}.log"), self._disk_max_bytes)
+
+        with self._lock:
+            if name in self._caches:
+                raise ValueError(f"Cache namespace already exists: {name}")
+            cache = Cache(**kwargs)
+            self._caches[name] = cache
+        return cache
+
+    def get(self, name: str) -> Cache:
+        return self._caches[name]
+
+    def __getitem__(self, name: str) -> Cache:
+        return self._caches[name]
+
+    def names(self) -> List[str]:
+        return list(self._caches.keys())
+
+    def clear(self) -> None:
+        """Clear every namespace"""
+        for cache in list(self._caches.values()):
+            cache.clear()
+
+    def persist(self) -> None:
+        """Write every namespace's in-memory entries to its disk tier"""
+        for name, cache in list(self._caches.items()):
+            try:
+                cache.persist()
+            except Exception as e:
+                logger.warning(f"Failed to persist cache {name}: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get statistics for every namespace, keyed by name"""
+        return {name: cache.get_stats() for name, cache in list(self._caches.items())}
@@ -0,0 +1,363 @@
+import os
+import abc
+import pickle
+import socket
+import sqlite3
+import threading
+import logging
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Pickled payloads larger than this are zlib-compressed before storing
+COMPRESS_THRESHOLD = 1024
+
+# Writes between purges of expired rows in the SQLite backend
+PURGE_INTERVAL = 500
+
+def dumps(value: Any) -> bytes:
+    """Serialize a value, compressing large payloads; the first byte is a format tag"""
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) > COMPRESS_THRESHOLD:
+        return b"z" + zlib.compress(data, 1)
+    return b"p" + data
+
+def loads(data: bytes) -> Any:
+    tag, payload = data[:1], data[1:]
+    if tag == b"z":
+        payload = zlib.decompress(payload)
+    elif tag != b"p":
+        raise ValueError(f"Unknown cache payload tag: {tag!r}")
+    return pickle.loads(payload)
+
+class CacheBackend(abc.ABC):
+    """A store shared by every worker process on a host
+
+    Values are serialized with pickle, so only trusted processes may write to
+    the store. Expiry is wall-clock time, since monotonic clocks are not
+    comparable across processes.
+    """
+
+    name = "none"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "gets": 0,
+            "hits": 0,
+            "sets": 0,
+            "errors": 0
+        }
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, seconds left to live) or None"""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def clear(self, prefix: str = "") -> None:
+        """Delete every key starting with ``prefix``"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": self.name, **self._stats}
+
+    def close(self) -> None:
+        pass
+
+class SQLiteBackend(CacheBackend):
+    """Cache table in a local SQLite file, shared through WAL mode"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        super().__init__()
+        self.path = path
+        self._busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self._busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        self._count("gets")
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            remaining = row[1] - time.time()
+            if remaining <= 0:
+                return None
+            value = loads(row[0])
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"SQLite cache read failed for {key}: {str(e)}")
+            return None
+        self._count("hits")
+        return value, remaining
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._count("sets")
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(dumps(value)), time.time() + ttl)
+            )
+            with self._lock:
+                self._writes += 1
+                purge = self._writes % PURGE_INTERVAL == 0
+            if purge:
+                conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"SQLite cache write failed for {key}: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"SQLite cache delete failed for {key}: {str(e)}")
+
+    def clear(self, prefix: str = "") -> None:
+        try:
+            # Range scan on the primary key instead of LIKE, so '%' and '_' in keys are literal
+            if prefix:
+                self._connection().execute(
+                    "DELETE FROM cache WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff")
+                )
+            else:
+                self._connection().execute("DELETE FROM cache")
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"SQLite cache clear failed: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats["path"] = self.path
+        try:
+            stats["entries"] = self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        except Exception:
+            stats["entries"] = None
+        return stats
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class RedisError(Exception):
+    pass
+
+class RedisBackend(CacheBackend):
+    """Minimal Redis client speaking RESP over a socket per thread
+
+    Only GET/SET/DEL/SCAN are used, so any server implementing the Redis
+    protocol (Redis, Valkey, KeyDB, a local stand-in) works.
+    """
+
+    name = "redis"
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, timeout: float = 2.0):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.db = db
+        self._password = password
+        self._timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        parsed = urlparse(url)
+        db = parsed.path.lstrip("/")
+        return cls(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=parsed.password
+        )
+
+    def _connect(self) -> Tuple[socket.socket, Any]:
+        sock = socket.create_connection((self.host, self.port), timeout=self._timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile("rb")
+        self._local.conn = (sock, reader)
+        try:
+            if self._password:
+                self._execute("AUTH", self._password)
+            if self.db:
+                self._execute("SELECT", str(self.db))
+        except Exception:
+            # Never leave an unauthenticated socket pooled for the next command
+            self._disconnect()
+            raise
+        return sock, reader
+
+    def _disconnect(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _encode(*args: Any) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read_reply(self, reader: Any) -> Any:
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RedisError(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self._read_reply(reader) for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def _execute(self, *args: Any) -> Any:
+        sock, reader = self._local.conn
+        sock.sendall(self._encode(*args))
+        return self._read_reply(reader)
+
+    def execute(self, *args: Any) -> Any:
+        """Run one command, reconnecting once if the pooled socket went stale"""
+        for attempt in range(2):
+            if getattr(self._local, "conn", None) is None:
+                self._connect()
+            try:
+                return self._execute(*args)
+            except (OSError, ConnectionError):
+                self._disconnect()
+                if attempt:
+                    raise
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        self._count("gets")
+        try:
+            data = self.execute("GET", key)
+            if data is None:
+                return None
+            expires_at, payload = data.split(b":", 1)
+            remaining = float(expires_at) - time.time()
+            if remaining <= 0:
+                return None
+            value = loads(payload)
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Redis cache read failed for {key}: {str(e)}")
+            return None
+        self._count("hits")
+        return value, remaining
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._count("sets")
+        try:
+            # Store the deadline with the value so readers get the remaining TTL in one round trip
+            payload = b"%.3f:" % (time.time() + ttl) + dumps(value)
+            self.execute("SET", key, payload, "PX", max(int(ttl * 1000), 1))
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Redis cache write failed for {key}: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self.execute("DEL", key)
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Redis cache delete failed for {key}: {str(e)}")
+
+    def clear(self, prefix: str = "") -> None:
+        try:
+            pattern = "".join(f"\\{c}" if c in "*?[]\\" else c for c in prefix) + "*"
+            cursor = b"0"
+            while True:
+                cursor, keys = self.execute("SCAN", cursor, "MATCH", pattern, "COUNT", 500)
+                if keys:
+                    self.execute("DEL", *keys)
+                if cursor == b"0":
+                    break
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Redis cache clear failed: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats["address"] = f"{self.host}:{self.port}/{self.db}"
+        return stats
+
+    def close(self) -> None:
+        self._disconnect()
+
+def backend_from_url(url: Optional[str]) -> Optional[CacheBackend]:
+    """Build a backend from a URL such as sqlite:///tmp/cache.db or redis://localhost:6379/0"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative.db and sqlite:////absolute/path.db, as in SQLAlchemy
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if parsed.scheme in ("redis", "tcp"):
+        return RedisBackend.from_url(url)
+    raise ValueError(f"Unsupported cache backend: {url}")
+
+def backend_from_env() -> Optional[CacheBackend]:
+    """Build the backend named by CACHE_BACKEND_URL, if set"""
+    return backend_from_url(os.environ.get("CACHE_BACKEND_URL"))
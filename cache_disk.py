@@ -0,0 +1,307 @@
+import os
+import mmap
+import fcntl
+import struct
+import threading
+import logging
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache_backends import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Record header: crc32, flags, key length, value length, expiry (wall clock), hits.
+# The crc covers everything after itself, so a torn write at the tail is detected.
+HEADER = struct.Struct("<IBHIdI")
+FLAG_TOMBSTONE = 1
+
+# Logs smaller than this are never compacted
+MIN_COMPACT_BYTES = 1024 * 1024
+
+class _Slot:
+    """Where the current record for a key lives in the log"""
+    __slots__ = ("offset", "length", "expires_at", "hits", "record_size")
+
+    def __init__(self, offset: int, length: int, expires_at: float, hits: int, record_size: int):
+        self.offset = offset
+        self.length = length
+        self.expires_at = expires_at
+        self.hits = hits
+        self.record_size = record_size
+
+class DiskTier:
+    """Append-only on-disk cache tier read through mmap
+
+    Every put appends a record; an in-memory index maps each key to its newest
+    record. Workers sharing a log append under an exclusive flock and pick up
+    each other's records by scanning the tail they have not seen yet. Once
+    superseded records outweigh live ones (or the log outgrows ``max_bytes``)
+    the log is rewritten with only live records, dropping the least hit keys
+    if it is still over budget.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: Dict[str, _Slot] = {}
+        self._live_bytes = 0
+        self._end = 0
+        self._inode = None
+        self._fd = -1
+        self._mmap: Optional[mmap.mmap] = None
+        self._stats = {
+            "reads": 0,
+            "hits": 0,
+            "writes": 0,
+            "compactions": 0,
+            "errors": 0
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            self._open()
+
+    def _open(self) -> None:
+        """(Re)open the log and rebuild the index from scratch"""
+        self._close_files()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._inode = os.fstat(self._fd).st_ino
+        self._index = {}
+        self._live_bytes = 0
+        self._end = 0
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            self._scan()
+            size = os.fstat(self._fd).st_size
+            if self._end < size:
+                # A crash left a torn record at the tail; cut it off
+                logger.warning(f"Truncating {size - self._end} corrupt bytes from {self.path}")
+                os.ftruncate(self._fd, self._end)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _close_files(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fd != -1:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _map(self, needed: int) -> mmap.mmap:
+        """Return a mapping covering at least ``needed`` bytes of the log"""
+        if self._mmap is None or len(self._mmap) < needed:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._fd, os.fstat(self._fd).st_size, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _scan(self) -> None:
+        """Index every complete record between the known end and the end of file"""
+        size = os.fstat(self._fd).st_size
+        if size <= self._end:
+            return
+        view = self._map(size)
+        pos = self._end
+        while pos + HEADER.size <= size:
+            crc, flags, key_len, value_len, expires_at, hits = HEADER.unpack_from(view, pos)
+            record_size = HEADER.size + key_len + value_len
+            if pos + record_size > size or \
+                    zlib.crc32(view[pos + 4:pos + record_size]) != crc:
+                break
+            key_start = pos + HEADER.size
+            key = view[key_start:key_start + key_len].decode()
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._live_bytes -= previous.record_size
+            if not flags & FLAG_TOMBSTONE:
+                self._index[key] = _Slot(key_start + key_len, value_len, expires_at, hits, record_size)
+                self._live_bytes += record_size
+            pos += record_size
+        self._end = pos
+
+    def _sync(self) -> None:
+        """Catch up with records appended, or a compaction done, by other workers"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._open()
+            return
+        if st.st_ino != self._inode or st.st_size < self._end:
+            self._open()
+        elif st.st_size > self._end:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                self._scan()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _record(key: str, payload: bytes, expires_at: float, hits: int, flags: int = 0) -> bytes:
+        key_bytes = key.encode()
+        body = HEADER.pack(0, flags, len(key_bytes), len(payload), expires_at, hits)[4:] + key_bytes + payload
+        return struct.pack("<I", zlib.crc32(body)) + body
+
+    def _append(self, records: List[bytes]) -> None:
+        while True:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                # Another worker may have swapped in a compacted log while we waited
+                if os.stat(self.path).st_ino == self._inode:
+                    self._scan()
+                    os.write(self._fd, b"".join(records))
+                    self._scan()
+                    return
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._open()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float, int]]:
+        """Return (value, seconds left to live, hits) or None"""
+        with self._lock:
+            self._stats["reads"] += 1
+            try:
+                self._sync()
+                slot = self._index.get(key)
+                if slot is None:
+                    return None
+                remaining = slot.expires_at - time.time()
+                if remaining <= 0:
+                    return None
+                view = self._map(slot.offset + slot.length)
+                value = loads(view[slot.offset:slot.offset + slot.length])
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"Disk cache read failed for {key}: {str(e)}")
+                return None
+            self._stats["hits"] += 1
+            return value, remaining, slot.hits
+
+    def put_many(self, items: List[Tuple[str, Any, float, int]]) -> None:
+        """Append (key, value, ttl seconds, hits) records in one write"""
+        now = time.time()
+        records = []
+        for key, value, ttl, hits in items:
+            try:
+                records.append(self._record(key, dumps(value), now + ttl, hits))
+            except Exception as e:
+                logger.warning(f"Disk cache cannot store {key}: {str(e)}")
+        if not records:
+            return
+        with self._lock:
+            try:
+                self._sync()
+                self._append(records)
+                self._stats["writes"] += len(records)
+                if self._needs_compaction():
+                    self._compact()
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"Disk cache write failed: {str(e)}")
+
+    def put(self, key: str, value: Any, ttl: float, hits: int = 0) -> None:
+        self.put_many([(key, value, ttl, hits)])
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            try:
+                self._sync()
+                if key in self._index:
+                    self._append([self._record(key, b"", 0, 0, FLAG_TOMBSTONE)])
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"Disk cache delete failed for {key}: {str(e)}")
+
+    def _needs_compaction(self) -> bool:
+        return self._end > MIN_COMPACT_BYTES and \
+            (self._end > 2 * self._live_bytes or self._end > self._max_bytes)
+
+    def _compact(self) -> None:
+        """Rewrite the log with only live records (caller holds self._lock)"""
+        while True:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            # The lock only guards the file this fd was opened on; if another
+            # worker swapped in a compacted log meanwhile, compacting the old
+            # one would replace the new log and lose what was appended to it
+            if os.stat(self.path).st_ino == self._inode:
+                break
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._open()
+            if not self._needs_compaction():
+                return
+        try:
+            self._scan()
+            now = time.time()
+            view = self._map(self._end)
+            live = [(key, slot) for key, slot in self._index.items() if slot.expires_at > now]
+            # Keep the most hit keys when the live set alone is over budget
+            live.sort(key=lambda item: item[1].hits, reverse=True)
+            budget = self._max_bytes * 3 // 4
+            tmp_path = f"{self.path}.compact.{os.getpid()}"
+            kept = 0
+            with open(tmp_path, "wb") as out:
+                for key, slot in live:
+                    if kept + slot.record_size > budget:
+                        break
+                    payload = view[slot.offset:slot.offset + slot.length]
+                    out.write(self._record(key, payload, slot.expires_at, slot.hits))
+                    kept += slot.record_size
+            os.replace(tmp_path, self.path)
+            self._stats["compactions"] += 1
+            logger.debug(f"Compacted {self.path}: {self._end} -> {kept} bytes")
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._open()
+
+    def hottest(self, limit: int) -> List[Tuple[str, Any, float, int]]:
+        """Return up to ``limit`` unexpired (key, value, ttl left, hits), most hit first"""
+        with self._lock:
+            try:
+                self._sync()
+                now = time.time()
+                slots = sorted(
+                    ((key, slot) for key, slot in self._index.items() if slot.expires_at > now),
+                    key=lambda item: item[1].hits,
+                    reverse=True
+                )[:limit]
+                if not slots:
+                    return []
+                view = self._map(self._end)
+                return [
+                    (key, loads(view[slot.offset:slot.offset + slot.length]), slot.expires_at - now, slot.hits)
+                    for key, slot in slots
+                ]
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"Disk cache warm-up read failed: {str(e)}")
+                return []
+
+    def clear(self) -> None:
+        # Swap in an empty log rather than truncating, so other workers'
+        # mappings of the old file stay valid until they notice
+        with self._lock:
+            tmp_path = f"{self.path}.clear.{os.getpid()}"
+            open(tmp_path, "wb").close()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._open()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "path": self.path,
+                "entries": len(self._index),
+                "live_bytes": self._live_bytes,
+                "file_bytes": self._end,
+                "max_bytes": self._max_bytes
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
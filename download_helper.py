@@ -29,7 +29,8 @@ logger = logging.getLogger("download_helper")
 class YouTubeDownloader:
     """Helper class for downloading YouTube videos with multiple fallback approaches"""
     
-    def __init__(self):
+    def __init__(self, connections=8):
+        self.connections = connections
         # Default paths
         self.cookies_path = os.path.join(os.getcwd(), 'cookies.txt')
         self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/105.0.0.0 Safari/537.36"
@@ -86,9 +87,9 @@ class YouTubeDownloader:
                 "--no-check-certificate",
                 "--user-agent", self.user_agent,
                 "--referer", "https://www.youtube.com/",
+                # Keep .part files so a retry (or a rerun after a timeout) resumes
                 "--continue",
-                "--no-part",
-                "--force-overwrites",
+                "--concurrent-fragments", str(self.connections),
                 url
             ]
             
@@ -170,10 +171,11 @@ def main():
     parser.add_argument("video_id", help="YouTube video ID")
     parser.add_argument("--output", "-o", required=True, help="Output file path")
     parser.add_argument("--format", "-f", default="best", help="Format code to download")
+    parser.add_argument("--connections", "-N", type=int, default=8, help="Fragments to download concurrently")
     
     args = parser.parse_args()
     
-    downloader = YouTubeDownloader()
+    downloader = YouTubeDownloader(connections=args.connections)
     success = downloader.download(args.video_id, args.output, args.format)
     
     if success:
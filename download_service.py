@@ -1,89 +1,337 @@
+import copy
 import logging
+import mimetypes
 import os
+import threading
+import time
+import uuid
 import yt_dlp
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from pytubefix import YouTube
-from typing import Dict
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from cache import Cache
+from event_bus import EventBus, event_bus
+from download_store import DownloadStore
+from job_journal import JobJournal
+from parallel_download import download_formats
 
 logger = logging.getLogger(__name__)
 
+# Finished jobs are kept this long so clients can still read their result
+JOB_RETENTION_SECONDS = 3600
+
+# Progress events for one job are published at most this often (seconds)
+PROGRESS_INTERVAL = 0.5
+
+# Player clients tried by the regular extraction, and by the last-ditch fallback
+DEFAULT_CLIENTS = ('android', 'ios', 'tv', 'web', 'mweb')
+FALLBACK_CLIENTS = ('tv', 'mweb', 'web_embedded')
+
+# Cached extractions are dropped this long before their signed URLs expire
+INFO_EXPIRY_MARGIN = 300
+INFO_MIN_TTL = 60
+INFO_DEFAULT_TTL = 1800
+
+def _url_expiry(url: str) -> Optional[int]:
+    """The wall-clock expiry signed into a googlevideo URL's ``expire`` parameter"""
+    expire = parse_qs(urlparse(url or '').query).get('expire')
+    return int(expire[0]) if expire and expire[0].isdigit() else None
+
+def _ttl_until(expiry: Optional[int]) -> int:
+    if expiry is None:
+        return INFO_DEFAULT_TTL
+    return max(int(expiry - time.time()) - INFO_EXPIRY_MARGIN, INFO_MIN_TTL)
+
+def url_ttl(url: str) -> int:
+    """Seconds a signed stream URL stays usable"""
+    return _ttl_until(_url_expiry(url))
+
+def stream_rank(fmt: Dict[str, Any]) -> Tuple[bool, int]:
+    """How /video/stream ranks formats and stored files: mp4 first, then height"""
+    ext = fmt.get('ext') or fmt.get('file_path', '').rsplit('.', 1)[-1]
+    return ext == 'mp4', fmt.get('height') or 0
+
+def info_ttl(info: Dict[str, Any]) -> int:
+    """Seconds an extracted info dict stays usable: until its first signed URL expires"""
+    expiries = [e for e in (_url_expiry(f.get('url')) for f in info.get('formats') or []) if e is not None]
+    return _ttl_until(min(expiries) if expiries else None)
+
+class DownloadQueueFull(Exception):
+    """Raised when the download queue already holds its maximum number of jobs"""
+
+class DownloadJob:
+    """A download handed to the worker pool: queued -> running -> done | failed"""
+
+    def __init__(self, video_id: str, itag: str):
+        self.id = uuid.uuid4().hex
+        self.video_id = video_id
+        self.itag = itag
+        self.state = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'video_id': self.video_id,
+            'itag': self.itag,
+            'state': self.state,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'result': self.result,
+            'error': self.error
+        }
+
+class DownloadProgress:
+    """Turns yt-dlp and pytubefix callbacks into throttled progress events"""
+
+    def __init__(self, publish: Callable[[Dict[str, Any]], None], interval: float = PROGRESS_INTERVAL):
+        self._publish = publish
+        self._interval = interval
+        self._last = 0.0
+        self._phase: Optional[str] = None
+        self._started: Optional[float] = None
+
+    def report(self, phase: str, downloaded_bytes: Optional[int] = None, total_bytes: Optional[int] = None,
+               speed: Optional[float] = None, eta: Optional[float] = None, force: bool = False) -> None:
+        """Publish a progress event unless one for the same phase went out too recently"""
+        now = time.monotonic()
+        if not force and phase == self._phase and now - self._last < self._interval:
+            return
+        self._phase = phase
+        self._last = now
+        percent = None
+        if downloaded_bytes is not None and total_bytes:
+            percent = round(min(downloaded_bytes * 100 / total_bytes, 100), 1)
+        self._publish({
+            'type': 'progress',
+            'phase': phase,
+            'downloaded_bytes': downloaded_bytes,
+            'total_bytes': total_bytes,
+            'percent': percent,
+            'speed': round(speed) if speed else None,
+            'eta': round(eta) if eta is not None else None
+        })
+
+    def ytdlp_hook(self, d: Dict[str, Any]) -> None:
+        """yt-dlp progress_hooks callback"""
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if d.get('status') == 'downloading':
+            self.report('download', d.get('downloaded_bytes'), total, d.get('speed'), d.get('eta'))
+        elif d.get('status') == 'finished':
+            done = d.get('downloaded_bytes') or total
+            self.report('download', done, total or done, force=True)
+
+    def ytdlp_postprocessor_hook(self, d: Dict[str, Any]) -> None:
+        """yt-dlp postprocessor_hooks callback; merging video and audio is its own phase"""
+        if d.get('status') == 'started':
+            name = d.get('postprocessor') or ''
+            self.report('merge' if 'Merger' in name else 'postprocess', force=True)
+
+    def pytubefix_hook(self, stream: Any, chunk: bytes, bytes_remaining: int) -> None:
+        """pytubefix on_progress callback"""
+        now = time.monotonic()
+        if self._started is None:
+            self._started = now
+        total = getattr(stream, 'filesize', None)
+        if not total:
+            self.report('download')
+            return
+        done = total - bytes_remaining
+        elapsed = now - self._started
+        speed = done / elapsed if elapsed > 0 else None
+        eta = bytes_remaining / speed if speed else None
+        self.report('download', done, total, speed, eta)
+
 class DownloadService:
     """Service for downloading YouTube videos using multiple libraries for maximum reliability"""
     
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, max_queued: Optional[int] = None,
+                 events: Optional[EventBus] = None, info_cache: Optional[Cache] = None):
         self.download_folder = os.path.join(os.getcwd(), 'static', 'downloads')
         if not os.path.exists(self.download_folder):
             os.makedirs(self.download_folder)
         
+        # Finished downloads, stored once per (video_id, format) and shared by all users
+        self.store = DownloadStore(os.path.join(self.download_folder, 'store'))
+
         self.cookies_path = os.path.join(os.getcwd(), 'cookies.txt')
         if not os.path.exists(self.cookies_path):
             with open(self.cookies_path, 'w') as f:
                 f.write("# Netscape HTTP Cookie File\n")
+
+        # Downloads run on a bounded pool so request threads never wait on yt-dlp
+        self.max_workers = max_workers or int(os.environ.get("DOWNLOAD_WORKERS", 2))
+        self.max_queued = max_queued or int(os.environ.get("DOWNLOAD_QUEUE_SIZE", 20))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download")
+        self._jobs: Dict[str, DownloadJob] = {}
+        self._jobs_lock = threading.Lock()
+        # Job state changes and progress are published on a topic per job ID,
+        # and journaled next to the store for requests other workers receive
+        self.events = events or event_bus
+        self.journal = JobJournal(os.path.join(self.download_folder, 'jobs'))
+
+        # Sanitized extract_info results per (video_id, client set), so the
+        # options dialog, the download and the stream share one extraction
+        self.info_cache = info_cache or Cache(
+            ttl_seconds=INFO_DEFAULT_TTL, max_size=None, max_bytes=64 * 1024 * 1024,
+            refresh_ahead=None, prefix="extraction"
+        )
+
+        # Concurrent connections per download, shared between its video and audio streams
+        self.connections = int(os.environ.get("DOWNLOAD_CONNECTIONS", 8))
+        # Part files live here under stable names so an interrupted download resumes
+        self.partial_folder = os.path.join(self.download_folder, 'partial')
+        # yt-dlp writes each attempt under its own name here, so concurrent
+        # downloads of one video never share a .part or intermediate file
+        self.work_folder = os.path.join(self.download_folder, 'work')
+        os.makedirs(self.work_folder, exist_ok=True)
+        self._transfer_lock = threading.Lock()
+        self._transfer_stats = {
+            "transfers": 0,
+            "bytes": 0,
+            "resumed_bytes": 0,
+            "seconds": 0.0,
+            "last_throughput_bps": None
+        }
     
+    def _cookiefile(self) -> Optional[str]:
+        return self.cookies_path if os.path.exists(self.cookies_path) and os.path.getsize(self.cookies_path) > 30 else None
+
+    def _extract_opts(self, clients: Tuple[str, ...]) -> Dict:
+        return {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+            'noplaylist': True,
+            'cookiefile': self._cookiefile(),
+            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'nocheckcertificate': True,
+            'remote_components': ['ejs:github'],
+            'extractor_args': {'youtube': {'player_client': list(clients)}},
+        }
+
+    @staticmethod
+    def _info_key(video_id: str, clients: Tuple[str, ...]) -> str:
+        return f"{video_id}:{','.join(clients)}"
+
+    def extract_info(self, video_id: str, clients: Tuple[str, ...] = DEFAULT_CLIENTS) -> Optional[Dict]:
+        """Return the sanitized yt-dlp info dict for a video, extracting it at most once
+
+        Concurrent callers share one extraction, and the result is cached
+        until shortly before its signed format URLs expire.
+        """
+        def extract() -> Optional[Dict]:
+            url = f"https://www.youtube.com/watch?v={video_id}"
+            with yt_dlp.YoutubeDL(self._extract_opts(clients)) as ydl:
+                info = ydl.extract_info(url, download=False)
+                return ydl.sanitize_info(info) if info else None
+
+        return self.info_cache.get_or_compute(self._info_key(video_id, clients), extract, ttl=info_ttl)
+
+    def forget_info(self, video_id: str, clients: Tuple[str, ...] = DEFAULT_CLIENTS) -> None:
+        """Drop a cached extraction, e.g. after its URLs were refused"""
+        self.info_cache.delete(self._info_key(video_id, clients))
+
+    @staticmethod
+    def stream_format(info: Dict) -> Optional[Dict[str, Any]]:
+        """Pick a progressive (audio and video) format from an info dict, preferring mp4
+
+        Returns its URL, format ID and the request headers its client expects.
+        """
+        progressive = [
+            f for f in info.get('formats') or []
+            if f.get('url') and f.get('vcodec', 'none') != 'none' and f.get('acodec', 'none') != 'none'
+            and f.get('protocol') in ('http', 'https')
+        ]
+        if not progressive:
+            if not info.get('url'):
+                return None
+            progressive = [info]
+        best = max(progressive, key=lambda f: (stream_rank(f), f.get('tbr') or 0))
+        return {'url': best['url'], 'format_id': best.get('format_id'), 'http_headers': best.get('http_headers') or {},
+                'ext': best.get('ext'), 'height': best.get('height')}
+
+    def stored_stream(self, video_id: str, stream: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """The best stored download that can stand in for a progressive stream, or None
+
+        Only files known to hold both video and audio qualify, and with
+        ``stream`` (a ``stream_format`` result) only ones at least as good as
+        it, so the player never loses audio or quality to a cached file.
+        """
+        playable = [
+            record for record in self.store.for_video(video_id)
+            if record.get('vcodec') not in (None, 'none') and record.get('acodec') not in (None, 'none')
+            and (mimetypes.guess_type(record['file_path'])[0] or '').startswith('video/')
+            and os.path.exists(record['file_path'])
+        ]
+        if stream is not None:
+            playable = [record for record in playable if stream_rank(record) >= stream_rank(stream)]
+        return max(playable, key=stream_rank, default=None)
+
     def get_available_streams(self, video_id: str) -> Dict:
         """Get video info using yt-dlp with bypass settings"""
         try:
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'cookiefile': self.cookies_path if os.path.exists(self.cookies_path) and os.path.getsize(self.cookies_path) > 30 else None,
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'nocheckcertificate': True,
-                'remote_components': ['ejs:github'],
-                # Prioritize android/tv clients which often bypass bot detection
-                'extractor_args': {'youtube': {'player_client': ['android', 'ios', 'tv', 'web', 'mweb']}},
-            }
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                video_streams = []
-                audio_streams = []
+            # Prioritize android/tv clients which often bypass bot detection
+            info = self.extract_info(video_id)
+            if not info:
+                raise ValueError("No video info returned")
+            video_streams = []
+            audio_streams = []
+            
+            for f in info.get('formats', []):
+                if not f.get('format_id'): continue
+
+                vcodec = f.get('vcodec', 'none')
+                acodec = f.get('acodec', 'none')
                 
-                for f in info.get('formats', []):
-                    if not f.get('format_id'): continue
-
-                    vcodec = f.get('vcodec', 'none')
-                    acodec = f.get('acodec', 'none')
-                    
-                    filesize = f.get('filesize') or f.get('filesize_approx')
-                    filesize_mb = round(filesize / (1024 * 1024), 2) if filesize else "unknown"
-
-                    if vcodec != 'none':
-                        height = f.get('height')
-                        resolution = f"{height}p" if height else "unknown"
-                        video_streams.append({
-                            'itag': str(f.get('format_id')),
-                            'resolution': resolution,
-                            'mime_type': f.get('ext') or 'unknown',
-                            'size_mb': filesize_mb,
-                            'format_name': f"{f.get('format_note') or 'Video'} ({resolution})"
-                        })
-                    elif acodec != 'none' and vcodec == 'none':
-                        abr = f.get('abr')
-                        bitrate = f"{int(abr)}kbps" if abr else "unknown"
-                        audio_streams.append({
-                            'itag': str(f.get('format_id')),
-                            'abr': bitrate,
-                            'mime_type': f.get('ext') or 'unknown',
-                            'size_mb': filesize_mb,
-                            'format_name': f"{f.get('format_note') or 'Audio'} ({bitrate})"
-                        })
-
-                # Sort by resolution/bitrate
-                video_streams.sort(key=lambda x: int(x['resolution'].replace('p', '')) if x['resolution'].replace('p', '').isdigit() else 0, reverse=True)
-                audio_streams.sort(key=lambda x: int(x['abr'].replace('kbps', '')) if x['abr'].replace('kbps', '').isdigit() else 0, reverse=True)
+                filesize = f.get('filesize') or f.get('filesize_approx')
+                filesize_mb = round(filesize / (1024 * 1024), 2) if filesize else "unknown"
 
-                return {
-                    'success': True,
-                    'title': info.get('title'),
-                    'thumbnail': info.get('thumbnail'),
-                    'length': info.get('duration'),
-                    'author': info.get('uploader'),
-                    'video_streams': video_streams[:15],
-                    'audio_streams': audio_streams[:15]
-                }
+                if vcodec != 'none':
+                    height = f.get('height')
+                    resolution = f"{height}p" if height else "unknown"
+                    video_streams.append({
+                        'itag': str(f.get('format_id')),
+                        'resolution': resolution,
+                        'mime_type': f.get('ext') or 'unknown',
+                        'size_mb': filesize_mb,
+                        'format_name': f"{f.get('format_note') or 'Video'} ({resolution})"
+                    })
+                elif acodec != 'none' and vcodec == 'none':
+                    abr = f.get('abr')
+                    bitrate = f"{int(abr)}kbps" if abr else "unknown"
+                    audio_streams.append({
+                        'itag': str(f.get('format_id')),
+                        'abr': bitrate,
+                        'mime_type': f.get('ext') or 'unknown',
+                        'size_mb': filesize_mb,
+                        'format_name': f"{f.get('format_note') or 'Audio'} ({bitrate})"
+                    })
+
+            # Sort by resolution/bitrate
+            video_streams.sort(key=lambda x: int(x['resolution'].replace('p', '')) if x['resolution'].replace('p', '').isdigit() else 0, reverse=True)
+            audio_streams.sort(key=lambda x: int(x['abr'].replace('kbps', '')) if x['abr'].replace('kbps', '').isdigit() else 0, reverse=True)
+
+            return {
+                'success': True,
+                'title': info.get('title'),
+                'thumbnail': info.get('thumbnail'),
+                'length': info.get('duration'),
+                'author': info.get('uploader'),
+                'video_streams': video_streams[:15],
+                'audio_streams': audio_streams[:15]
+            }
         except Exception as e:
             logger.error(f"Error getting info for {video_id}: {str(e)}")
             try:
@@ -101,27 +349,36 @@ class DownloadService:
             except:
                 return {'success': False, 'error': str(e)}
 
-    def download_video(self, video_id: str, itag: str) -> Dict:
+    def download_video(self, video_id: str, itag: str, progress: Optional[DownloadProgress] = None) -> Dict:
         """Attempt download using yt-dlp with optimized bot-bypass settings"""
         url = f"https://www.youtube.com/watch?v={video_id}"
         
         # Try yt-dlp first
-        result = self._download_with_ytdlp(video_id, itag, url)
+        result = self._download_with_ytdlp(video_id, itag, url, progress)
         if result['success']:
             return result
             
         # Fallback to pytubefix
         logger.warning(f"yt-dlp failed for {video_id}, trying pytubefix")
-        result = self._download_with_pytubefix(video_id, itag, url)
+        result = self._download_with_pytubefix(video_id, itag, url, progress)
         if result['success']:
             return result
             
         # Emergency last ditch effort
-        return self._emergency_fallback_download(video_id)
+        return self._emergency_fallback_download(video_id, progress)
 
-    def _download_with_ytdlp(self, video_id: str, itag: str, url: str) -> Dict:
+    @staticmethod
+    def _add_progress_hooks(ydl_opts: Dict, progress: Optional[DownloadProgress]) -> Dict:
+        if progress is not None:
+            ydl_opts['progress_hooks'] = [progress.ytdlp_hook]
+            ydl_opts['postprocessor_hooks'] = [progress.ytdlp_postprocessor_hook]
+        return ydl_opts
+
+    def _download_with_ytdlp(self, video_id: str, itag: str, url: str,
+                             progress: Optional[DownloadProgress] = None) -> Dict:
+        attempt = uuid.uuid4().hex
         try:
-            output_template = os.path.join(self.download_folder, '%(title)s-%(id)s.%(ext)s')
+            output_template = os.path.join(self.work_folder, f"{attempt}.%(ext)s")
             ydl_opts = {
                 'format': f"{itag}/bestvideo+bestaudio/best",
                 'outtmpl': output_template,
@@ -129,20 +386,34 @@ class DownloadService:
                 'no_warnings': True,
                 'merge_output_format': 'mp4',
                 'noplaylist': True,
-                'cookiefile': self.cookies_path if os.path.exists(self.cookies_path) and os.path.getsize(self.cookies_path) > 30 else None,
+                'cookiefile': self._cookiefile(),
                 'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
                 'nocheckcertificate': True,
                 'ignoreerrors': True,
-                'remote_components': ['ejs:github'],
-                # Diverse client set to bypass "not a bot" check
-                'extractor_args': {'youtube': {'player_client': ['android', 'ios', 'tv', 'web', 'mweb']}},
+                'concurrent_fragment_downloads': self.connections,
             }
+            self._add_progress_hooks(ydl_opts, progress)
             
+            cached = self.extract_info(video_id)
+            if not cached: return {'success': False}
+
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+                # Select formats from the cached extraction instead of extracting
+                # again; processing mutates the dict, so work on a copy
+                info = ydl.process_ie_result(copy.deepcopy(cached), download=False)
                 if not info: return {'success': False}
-                
+
                 filename = ydl.prepare_filename(info)
+                transfer = self._download_parallel(video_id, info, filename, progress)
+                if transfer is None:
+                    # Segmented (DASH/HLS) formats: yt-dlp fetches fragments concurrently itself
+                    info = ydl.process_ie_result(copy.deepcopy(cached), download=True)
+                    if not info:
+                        # Most likely the cached URLs were refused; extract afresh next time
+                        self.forget_info(video_id)
+                        self._discard_attempt(attempt)
+                        return {'success': False}
+                    filename = ydl.prepare_filename(info)
                 if not os.path.exists(filename):
                     base = filename.rsplit('.', 1)[0]
                     for ext in ['mp4', 'mkv', 'webm', 'm4a']:
@@ -156,17 +427,74 @@ class DownloadService:
                         'title': info.get('title'),
                         'file_path': os.path.relpath(filename, os.getcwd()),
                         'file_size': round(os.path.getsize(filename) / (1024 * 1024), 2),
-                        'mime_type': filename.rsplit('.', 1)[-1]
+                        'mime_type': filename.rsplit('.', 1)[-1],
+                        'vcodec': info.get('vcodec'),
+                        'acodec': info.get('acodec'),
+                        'height': info.get('height'),
+                        'transfer': transfer
                     }
+            self._discard_attempt(attempt)
             return {'success': False}
         except Exception as e:
             logger.error(f"yt-dlp error: {str(e)}")
+            self.forget_info(video_id)
+            self._discard_attempt(attempt)
             return {'success': False}
 
-    def _download_with_pytubefix(self, video_id: str, itag: str, url: str) -> Dict:
+    def _discard_attempt(self, attempt: str) -> None:
+        """Delete whatever a failed download attempt left in the work folder"""
+        for name in os.listdir(self.work_folder):
+            if name.startswith(attempt):
+                try:
+                    os.remove(os.path.join(self.work_folder, name))
+                except OSError:
+                    pass
+
+    def _download_parallel(self, video_id: str, info: Dict, filename: str,
+                           progress: Optional[DownloadProgress] = None) -> Optional[Dict[str, Any]]:
+        """Fetch the selected formats as concurrent byte ranges and merge them into ``filename``
+
+        Returns the transfer stats, or None when the formats are not plain
+        HTTP(S) files (or the ranged download failed) so yt-dlp should handle them.
+        """
+        formats = info.get('requested_formats') or [info]
+        if not all(f.get('url') and f.get('protocol') in ('http', 'https') for f in formats):
+            return None
+        formats = [dict(f, _video_id=video_id) for f in formats]
+
+        def on_progress(done: int, total: int, throughput: Optional[float]) -> None:
+            if progress is not None:
+                eta = (total - done) / throughput if throughput and total else None
+                progress.report('download', done, total or None, throughput, eta)
+
+        def on_merge() -> None:
+            if progress is not None:
+                progress.report('merge', force=True)
+
+        try:
+            transfer = download_formats(formats, self.partial_folder, filename,
+                                        connections=self.connections,
+                                        on_progress=on_progress, on_merge=on_merge)
+        except Exception as e:
+            # Part files stay on disk, so the next attempt resumes where this one stopped
+            logger.warning(f"Ranged download failed for {video_id}, handing over to yt-dlp: {str(e)}")
+            return None
+
+        with self._transfer_lock:
+            self._transfer_stats["transfers"] += 1
+            self._transfer_stats["bytes"] += transfer['downloaded_bytes']
+            self._transfer_stats["resumed_bytes"] += transfer['resumed_bytes']
+            self._transfer_stats["seconds"] += transfer['seconds']
+            self._transfer_stats["last_throughput_bps"] = transfer['throughput_bps']
+        return transfer
+
+    def _download_with_pytubefix(self, video_id: str, itag: str, url: str,
+                                 progress: Optional[DownloadProgress] = None) -> Dict:
+        attempt = uuid.uuid4().hex
         try:
             # Use specific clients in pytubefix if available
-            yt = YouTube(url, use_oauth=False, client='WEB')
+            yt = YouTube(url, use_oauth=False, client='WEB',
+                         on_progress_callback=progress.pytubefix_hook if progress else None)
             stream = None
             if itag and itag.isdigit():
                 stream = yt.streams.get_by_id(int(itag))
@@ -175,37 +503,46 @@ class DownloadService:
             
             if not stream: return {'success': False}
             
-            target_filename = f"{video_id}_pytube.{stream.subtype}"
-            file_path = stream.download(output_path=self.download_folder, filename=target_filename)
+            # Its own name in the work folder, like the yt-dlp attempts; the store takes it from there
+            file_path = stream.download(output_path=self.work_folder, filename=f"{attempt}.{stream.subtype}")
             
             return {
                 'success': True,
                 'title': yt.title,
                 'file_path': os.path.relpath(file_path, os.getcwd()),
                 'file_size': round(os.path.getsize(file_path) / (1024 * 1024), 2),
-                'mime_type': stream.mime_type
+                'mime_type': stream.mime_type,
+                'vcodec': stream.video_codec if stream.includes_video_track else 'none',
+                'acodec': stream.audio_codec if stream.includes_audio_track else 'none',
+                'height': int(stream.resolution[:-1]) if stream.resolution else None
             }
         except Exception as e:
             logger.error(f"pytubefix error: {str(e)}")
+            self._discard_attempt(attempt)
             return {'success': False}
 
-    def _emergency_fallback_download(self, video_id: str) -> Dict:
+    def _emergency_fallback_download(self, video_id: str, progress: Optional[DownloadProgress] = None) -> Dict:
         """Final attempt using minimal yt-dlp options and a diverse client set"""
+        attempt = uuid.uuid4().hex
         try:
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            output_template = os.path.join(self.download_folder, f"fallback_{video_id}.%(ext)s")
+            output_template = os.path.join(self.work_folder, f"{attempt}.%(ext)s")
             # Minimal options, forcing specific non-browser clients
+            cached = self.extract_info(video_id, FALLBACK_CLIENTS)
+            if not cached: return {'success': False, 'error': "All bypass strategies failed"}
             ydl_opts = {
                 'format': 'best', 
                 'outtmpl': output_template, 
                 'noplaylist': True, 
                 'ignoreerrors': True,
-                'extractor_args': {'youtube': {'player_client': ['tv', 'mweb', 'web_embedded']}},
             }
+            self._add_progress_hooks(ydl_opts, progress)
             
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                if not info: return {'success': False, 'error': "All bypass strategies failed"}
+                info = ydl.process_ie_result(copy.deepcopy(cached), download=True)
+                if not info:
+                    self.forget_info(video_id, FALLBACK_CLIENTS)
+                    self._discard_attempt(attempt)
+                    return {'success': False, 'error': "All bypass strategies failed"}
                 filename = ydl.prepare_filename(info)
                 if os.path.exists(filename):
                     return {
@@ -213,11 +550,127 @@ class DownloadService:
                         'title': info.get('title', 'Video'),
                         'file_path': os.path.relpath(filename, os.getcwd()),
                         'file_size': round(os.path.getsize(filename) / (1024 * 1024), 2),
-                        'mime_type': filename.rsplit('.', 1)[-1]
+                        'mime_type': filename.rsplit('.', 1)[-1],
+                        'vcodec': info.get('vcodec'),
+                        'acodec': info.get('acodec'),
+                        'height': info.get('height')
                     }
+            self._discard_attempt(attempt)
             return {'success': False, 'error': "All bypass strategies failed"}
         except Exception as e:
+            self._discard_attempt(attempt)
             return {'success': False, 'error': str(e)}
 
-    def direct_download(self, video_id: str, format_code: str = 'best') -> Dict:
-        return self.download_video(video_id, format_code)
+    def direct_download(self, video_id: str, format_code: str = 'best',
+                        progress: Optional[DownloadProgress] = None) -> Dict:
+        return self.download_video(video_id, format_code, progress)
+
+    def submit_job(self, video_id: str, itag: str,
+                   run: Optional[Callable[[DownloadProgress], Dict]] = None) -> DownloadJob:
+        """Queue a download and return its job right away
+
+        ``run`` performs the download, reporting to the DownloadProgress it is
+        given, and returns a result dict with ``success``; it defaults to
+        download_video through the store. A request for a video and format that is already
+        queued or running gets the existing job.
+        """
+        with self._jobs_lock:
+            self._prune_jobs()
+            pending = 0
+            for job in self._jobs.values():
+                if job.finished:
+                    continue
+                if job.video_id == video_id and job.itag == itag:
+                    return job
+                pending += 1
+            if pending >= self.max_queued:
+                raise DownloadQueueFull(f"{pending} downloads already pending")
+
+            job = DownloadJob(video_id, itag)
+            self._jobs[job.id] = job
+        self.journal.prune(JOB_RETENTION_SECONDS)
+
+        self._publish_state(job)
+        if run is None:
+            def run(progress):
+                return self.store.get_or_create(video_id, itag, lambda: self.download_video(video_id, itag, progress))
+        self._executor.submit(self._run_job, job, run)
+        logger.info(f"Queued download job {job.id} for {video_id} (itag {itag})")
+        return job
+
+    def _publish(self, job_id: str, event: Dict[str, Any], close: bool = False) -> None:
+        seq = self.events.publish(job_id, event, close=close)
+        self.journal.append_event(job_id, seq, event)
+
+    def _publish_state(self, job: DownloadJob) -> None:
+        state = job.to_dict()
+        self._publish(job.id, {'type': 'state', **state}, close=job.finished)
+        self.journal.write_state(state)
+
+    def _run_job(self, job: DownloadJob, run: Callable[[DownloadProgress], Dict]) -> None:
+        job.state = "running"
+        job.started_at = time.time()
+        self._publish_state(job)
+        progress = DownloadProgress(lambda event: self._publish(job.id, {'job_id': job.id, **event}))
+        try:
+            result = run(progress)
+            job.result = result
+            if result.get('success'):
+                job.state = "done"
+            else:
+                job.error = result.get('error') or "Download failed"
+                job.state = "failed"
+        except Exception as e:
+            logger.error(f"Download job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            job.finished_at = time.time()
+            self._publish_state(job)
+            logger.info(f"Download job {job.id} {job.state} in {job.finished_at - job.started_at:.1f}s")
+
+    def _prune_jobs(self) -> None:
+        """Forget finished jobs older than the retention window (caller holds the lock)"""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get_job(self, job_id: str) -> Optional[DownloadJob]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's state, whichever worker runs it"""
+        job = self.get_job(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.journal.read_state(job_id)
+
+    def job_events(self, job_id: str, after: int = 0) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """Follow a job's events: from the event bus when this worker runs it, else from the journal"""
+        if self.get_job(job_id) is not None or self.events.has_topic(job_id):
+            return self.events.subscribe(job_id, after=after)
+        return self.journal.follow(job_id, after=after)
+
+    def get_job_stats(self) -> Dict[str, Any]:
+        """Count jobs by state, plus throughput of ranged downloads"""
+        with self._jobs_lock:
+            counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job.state] += 1
+        with self._transfer_lock:
+            transfers = dict(self._transfer_stats)
+        transfers["avg_throughput_bps"] = (
+            round(transfers["bytes"] / transfers["seconds"]) if transfers["seconds"] else None
+        )
+        transfers["seconds"] = round(transfers["seconds"], 2)
+        return {
+            **counts,
+            "max_workers": self.max_workers,
+            "max_queued": self.max_queued,
+            "connections": self.connections,
+            "transfers": transfers,
+            "journal": self.journal.get_stats()
+        }
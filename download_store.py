@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import shutil
+import threading
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK = 1024 * 1024
+
+# A hit rewrites the manifest only when the entry's access stamp is older
+# than this (seconds); hits in between are counted in memory meanwhile
+ACCESS_STAMP_INTERVAL = 60
+
+class _Flight:
+    """A download in progress that identical requests wait on"""
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+class DownloadStore:
+    """Downloaded files kept once per content hash and indexed by (video_id, format)
+
+    Artifacts live under ``<root>/objects/<sha[:2]>/<sha256>.<ext>``, so two
+    formats that resolve to the same bytes share one file. ``manifest.json``
+    maps each ``video_id:format`` key to its artifact; it is rewritten
+    atomically under an flock so several workers can share the store.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self._lock_path = os.path.join(root, 'manifest.lock')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._manifest: Dict[str, Dict[str, Any]] = {}
+        self._manifest_mtime: Optional[float] = None
+        self._inflight: Dict[str, _Flight] = {}
+        self._unstamped_hits: Dict[str, int] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "deduplicated": 0,
+            "access_stamps": 0
+        }
+        with self._lock:
+            self._reload()
+
+    @staticmethod
+    def key(video_id: str, fmt: str) -> str:
+        return f"{video_id}:{fmt}"
+
+    def _reload(self) -> None:
+        """Re-read the manifest if another worker changed it (caller holds self._lock)"""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        try:
+            with open(self.manifest_path) as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read download manifest: {str(e)}")
+
+    def _update(self, change: Callable[[Dict[str, Dict[str, Any]]], None]) -> None:
+        """Apply ``change`` to the latest manifest and write it back (caller holds self._lock)"""
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload()
+                change(self._manifest)
+                tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._manifest, f)
+                os.replace(tmp_path, self.manifest_path)
+                self._manifest_mtime = os.path.getmtime(self.manifest_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _result(record: Dict[str, Any], cached: bool) -> Dict[str, Any]:
+        """Shape a manifest record like a DownloadService result"""
+        return {
+            'success': True,
+            'title': record.get('title'),
+            'file_path': record['file_path'],
+            'file_size': round(record['size'] / (1024 * 1024), 2),
+            'mime_type': record.get('mime_type'),
+            'download_name': record.get('download_name'),
+            'format': record.get('format'),
+            'cached': cached
+        }
+
+    def lookup(self, video_id: str, fmt: str) -> Optional[Dict[str, Any]]:
+        """Return the stored result for a video and format, recording the access
+
+        The access is written to the manifest at most once per
+        ACCESS_STAMP_INTERVAL per entry, so a popular file does not take the
+        manifest lock on every request.
+        """
+        key = self.key(video_id, fmt)
+        with self._lock:
+            self._reload()
+            record = self._manifest.get(key)
+            if record is None or not os.path.exists(record['file_path']):
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            hits = self._unstamped_hits.get(key, 0) + 1
+            if time.time() - record.get('last_access', 0) < ACCESS_STAMP_INTERVAL:
+                self._unstamped_hits[key] = hits
+                return self._result(record, cached=True)
+            self._unstamped_hits.pop(key, None)
+            self._stats["access_stamps"] += 1
+
+            def touch(manifest: Dict[str, Dict[str, Any]]) -> None:
+                if key in manifest:
+                    manifest[key]['last_access'] = time.time()
+                    manifest[key]['hits'] = manifest[key].get('hits', 0) + hits
+            self._update(touch)
+            return self._result(record, cached=True)
+
+    def latest(self, video_id: str, fmt: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the most recently stored record for a video, in ``fmt`` or any format"""
+        with self._lock:
+            self._reload()
+            records = [r for r in self._manifest.values()
+                       if r['video_id'] == video_id and (fmt is None or r['format'] == fmt)]
+        if not records:
+            return None
+        return max(records, key=lambda r: r['created_at'])
+
+    def for_video(self, video_id: str) -> List[Dict[str, Any]]:
+        """Every stored record of a video, in any format"""
+        with self._lock:
+            self._reload()
+            return [dict(record) for record in self._manifest.values() if record['video_id'] == video_id]
+
+    def records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._reload()
+            return [dict(record, key=key) for key, record in self._manifest.items()]
+
+    def forget(self, file_path: str) -> None:
+        """Drop manifest entries for a file that was deleted from disk"""
+        target = os.path.abspath(file_path)
+
+        def drop(manifest: Dict[str, Dict[str, Any]]) -> None:
+            for key in [k for k, r in manifest.items() if os.path.abspath(r['file_path']) == target]:
+                del manifest[key]
+        with self._lock:
+            self._update(drop)
+
+    @staticmethod
+    def _sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def ingest(self, video_id: str, fmt: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Move a freshly downloaded file into the store and index it"""
+        source = result['file_path']
+        ext = source.rsplit('.', 1)[-1] if '.' in os.path.basename(source) else 'bin'
+        sha = self._sha256(source)
+        target_dir = os.path.join(self.objects_dir, sha[:2])
+        target = os.path.join(target_dir, f"{sha}.{ext}")
+        os.makedirs(target_dir, exist_ok=True)
+        if os.path.exists(target):
+            # Same bytes as an artifact we already have
+            os.remove(source)
+            with self._lock:
+                self._stats["deduplicated"] += 1
+        else:
+            shutil.move(source, target)
+
+        title = result.get('title') or video_id
+        safe_title = re.sub(r'[^\w\- ]+', '', title).strip()[:80] or video_id
+        now = time.time()
+        record = {
+            'video_id': video_id,
+            'format': fmt,
+            'sha256': sha,
+            'file_path': os.path.relpath(target, os.getcwd()),
+            'size': os.path.getsize(target),
+            'mime_type': result.get('mime_type'),
+            # What the file holds, so /video/stream only plays complete files
+            'vcodec': result.get('vcodec'),
+            'acodec': result.get('acodec'),
+            'height': result.get('height'),
+            'title': title,
+            'download_name': f"{safe_title}-{video_id}.{ext}",
+            'created_at': now,
+            'last_access': now,
+            'hits': 0
+        }
+        key = self.key(video_id, fmt)
+        with self._lock:
+            self._update(lambda manifest: manifest.__setitem__(key, record))
+        logger.info(f"Stored {key} as {record['file_path']}")
+        return record
+
+    def get_or_create(self, video_id: str, fmt: str, produce: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Serve a stored artifact, or run ``produce`` once for concurrent identical requests
+
+        ``produce`` returns a DownloadService-style result; successful results
+        without a ``note`` (i.e. not a fallback such as a thumbnail) are moved
+        into the store.
+        """
+        stored = self.lookup(video_id, fmt)
+        if stored is not None:
+            return stored
+
+        key = self.key(video_id, fmt)
+        with self._lock:
+            flight = self._inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+            else:
+                self._stats["coalesced"] += 1
+
+        if not is_leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            result = produce()
+            if result.get('success') and not result.get('note') and os.path.exists(result.get('file_path', '')):
+                result = dict(self._result(self.ingest(video_id, fmt, result), cached=False),
+                              transfer=result.get('transfer'))
+            flight.value = result
+            return result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._reload()
+            return {
+                **self._stats,
+                "entries": len(self._manifest),
+                "objects": len({record['sha256'] for record in self._manifest.values()}),
+                "inflight": len(self._inflight)
+            }
@@ -0,0 +1,182 @@
+import os
+import threading
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Closed topics are kept this long so late subscribers still see the final events
+CLOSED_TOPIC_TTL = 600
+
+class _Topic:
+    """Recent events for one topic and the condition its subscribers wait on"""
+
+    def __init__(self, capacity: int):
+        self.condition = threading.Condition()
+        self.events: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=capacity)
+        self.last_seq = 0
+        self.closed = False
+        self.closed_at: Optional[float] = None
+        self.subscribers = 0
+
+class EventBus:
+    """In-process publish/subscribe of small event dicts, one stream per topic
+
+    Each topic keeps its last ``capacity`` events in a ring buffer with
+    increasing sequence numbers, so a subscriber that reconnects with the last
+    sequence it saw picks up where it left off. Subscribers block on the
+    topic's condition until something is published; they never poll.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._capacity = capacity
+        self._topics: Dict[str, _Topic] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "published": 0,
+            "topics_closed": 0
+        }
+
+    def _topic(self, name: str, create: bool = True) -> Optional[_Topic]:
+        with self._lock:
+            topic = self._topics.get(name)
+            if topic is None and create:
+                self._prune()
+                topic = _Topic(self._capacity)
+                self._topics[name] = topic
+            return topic
+
+    def _prune(self) -> None:
+        """Drop topics closed longer than CLOSED_TOPIC_TTL ago (caller holds the lock)"""
+        cutoff = time.time() - CLOSED_TOPIC_TTL
+        expired = [name for name, topic in self._topics.items()
+                   if topic.closed and topic.closed_at < cutoff and not topic.subscribers]
+        for name in expired:
+            del self._topics[name]
+
+    def publish(self, name: str, event: Dict[str, Any], close: bool = False) -> int:
+        """Append an event to a topic and wake its subscribers; returns its sequence number
+
+        ``close`` marks this as the topic's last event.
+        """
+        topic = self._topic(name)
+        with topic.condition:
+            if topic.closed:
+                return topic.last_seq
+            topic.last_seq += 1
+            topic.events.append((topic.last_seq, event))
+            if close:
+                topic.closed = True
+                topic.closed_at = time.time()
+            topic.condition.notify_all()
+        with self._lock:
+            self._stats["published"] += 1
+            if close:
+                self._stats["topics_closed"] += 1
+        return topic.last_seq
+
+    def close(self, name: str) -> None:
+        """End a topic without publishing anything more"""
+        topic = self._topic(name)
+        with topic.condition:
+            if not topic.closed:
+                topic.closed = True
+                topic.closed_at = time.time()
+                topic.condition.notify_all()
+
+    def has_topic(self, name: str) -> bool:
+        return self._topic(name, create=False) is not None
+
+    def events_after(self, name: str, after: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """Return buffered events with a sequence number above ``after``"""
+        topic = self._topic(name, create=False)
+        if topic is None:
+            return []
+        with topic.condition:
+            return [(seq, event) for seq, event in topic.events if seq > after]
+
+    def subscribe(self, name: str, after: int = 0,
+                  heartbeat: float = 15.0) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """Yield (seq, event) pairs as they are published until the topic closes
+
+        Yields (seq, None) after ``heartbeat`` quiet seconds so callers can keep
+        idle connections alive (and notice clients that went away).
+        """
+        topic = self._topic(name)
+        with topic.condition:
+            topic.subscribers += 1
+        try:
+            while True:
+                with topic.condition:
+                    if topic.last_seq <= after and not topic.closed:
+                        topic.condition.wait(heartbeat)
+                    pending = [(seq, event) for seq, event in topic.events if seq > after]
+                    finished = topic.closed
+                if not pending and not finished:
+                    yield after, None
+                    continue
+                for seq, event in pending:
+                    after = seq
+                    yield seq, event
+                if finished:
+                    return
+        finally:
+            with topic.condition:
+                topic.subscribers -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            topics = list(self._topics.values())
+            stats = dict(self._stats)
+        stats.update({
+            "topics": len(topics),
+            "open_topics": sum(1 for topic in topics if not topic.closed),
+            "subscribers": sum(topic.subscribers for topic in topics)
+        })
+        return stats
+
+class WatcherLimit:
+    """Caps how many event streams are open at once in this process
+
+    Under gthread every open stream holds one of the worker's request
+    threads, so past ``max_watchers`` new watchers are turned away (and the
+    browser polls the job status instead) before streams can starve
+    ordinary requests.
+    """
+
+    def __init__(self, max_watchers: int = 16):
+        self.max_watchers = max_watchers
+        self._watchers = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "admitted": 0,
+            "rejected": 0
+        }
+
+    @classmethod
+    def from_env(cls) -> "WatcherLimit":
+        """Build a limit configured from the SSE_MAX_WATCHERS environment variable"""
+        return cls(max_watchers=int(os.environ.get("SSE_MAX_WATCHERS", 16)))
+
+    def acquire(self) -> bool:
+        """Take a watcher slot; False when all are in use"""
+        with self._lock:
+            if self._watchers >= self.max_watchers:
+                self._stats["rejected"] += 1
+                return False
+            self._watchers += 1
+            self._stats["admitted"] += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._watchers -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, watchers=self._watchers, max_watchers=self.max_watchers)
+
+# Process-wide bus shared by the download workers and the SSE endpoint
+event_bus = EventBus()
@@ -0,0 +1,121 @@
+import os
+import logging
+import threading
+from typing import Any, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+class UpstreamClient:
+    """Shared HTTP client for all upstream YouTube/googlevideo traffic
+
+    A single requests.Session with one mounted adapter keeps a urllib3
+    connection pool per host, so TCP+TLS handshakes are paid once per
+    connection rather than once per request. The session is configured once
+    at construction and urllib3 pools are thread-safe, so one instance can be
+    shared by every request thread.
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 32,
+                 connect_timeout: float = 5.0, read_timeout: float = 15.0,
+                 retries: int = 2, backoff_factor: float = 0.3):
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "errors": 0
+        }
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+        self._session = requests.Session()
+        self._session.mount('https://', self._adapter)
+        self._session.mount('http://', self._adapter)
+
+    @classmethod
+    def from_env(cls) -> "UpstreamClient":
+        """Build a client configured from UPSTREAM_* environment variables"""
+        return cls(
+            pool_connections=int(os.environ.get("UPSTREAM_POOL_CONNECTIONS", 10)),
+            pool_maxsize=int(os.environ.get("UPSTREAM_POOL_MAXSIZE", 32)),
+            connect_timeout=float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 5)),
+            read_timeout=float(os.environ.get("UPSTREAM_READ_TIMEOUT", 15)),
+            retries=int(os.environ.get("UPSTREAM_RETRIES", 2)),
+            backoff_factor=float(os.environ.get("UPSTREAM_BACKOFF", 0.3))
+        )
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send a request through the pooled session with the default timeout"""
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self._stats["requests"] += 1
+        try:
+            return self._session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get request counters and per-host connection pool hit/miss stats
+
+        A pool "miss" is a request that had to open a new connection (and pay
+        the handshake); every other request on that pool reused a kept-alive
+        connection and counts as a hit.
+        """
+        pools = {}
+        pool_manager = self._adapter.poolmanager
+        for key in pool_manager.pools.keys():
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            opened = pool.num_connections
+            pools[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+                "requests": pool.num_requests,
+                "hits": max(pool.num_requests - opened, 0),
+                "misses": opened
+            }
+
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats.update({
+            "hits": sum(p["hits"] for p in pools.values()),
+            "misses": sum(p["misses"] for p in pools.values()),
+            "pool_connections": self._pool_connections,
+            "pool_maxsize": self._pool_maxsize,
+            "pools": pools
+        })
+        return stats
+
+    def close(self) -> None:
+        self._session.close()
+
+# Process-wide client shared by the YouTube service, the stream proxy and downloads
+upstream_client = UpstreamClient.from_env()
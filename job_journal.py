@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import ctypes
+import ctypes.util
+import logging
+import select
+import struct
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+FINISHED_STATES = ("done", "failed")
+
+# inotify(7), used to sleep until a job's files change instead of polling
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Even with inotify, look again this often: writes made on another host
+# sharing the folder over the network raise no local events
+WATCH_RECHECK = 5.0
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _libc.inotify_init1
+except (OSError, AttributeError):
+    _libc = None
+
+class _FileWatch:
+    """Wait for files named ``<prefix>*`` in a directory to be written, via inotify
+
+    Falls back to sleeping ``poll_interval`` where inotify is unavailable.
+    """
+
+    def __init__(self, root: str, prefix: str, poll_interval: float):
+        self.prefix = prefix.encode()
+        self.poll_interval = poll_interval
+        self._fd = -1
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and _libc.inotify_add_watch(fd, root.encode(), IN_MODIFY | IN_MOVED_TO | IN_CREATE) >= 0:
+                self._fd = fd
+            elif fd >= 0:
+                os.close(fd)
+
+    def wait(self, timeout: float) -> None:
+        """Return once a watched file changed, or after ``timeout`` seconds at most"""
+        if self._fd == -1:
+            time.sleep(min(timeout, self.poll_interval))
+            return
+        deadline = time.monotonic() + min(timeout, WATCH_RECHECK)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self._fd], [], [], remaining)[0]:
+                return
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                continue
+            # Other jobs' writes wake us too; only return for this job's files
+            pos = 0
+            while pos < len(data):
+                _, _, _, name_len = INOTIFY_EVENT.unpack_from(data, pos)
+                name = data[pos + INOTIFY_EVENT.size:pos + INOTIFY_EVENT.size + name_len]
+                if name.startswith(self.prefix):
+                    return
+                pos += INOTIFY_EVENT.size + name_len
+
+    def close(self) -> None:
+        if self._fd != -1:
+            os.close(self._fd)
+            self._fd = -1
+
+class JobJournal:
+    """Download job state and events on disk, readable by every worker
+
+    The worker running a job writes its latest state to ``<root>/<id>.json``
+    and appends each event, with the sequence number the in-process event
+    bus gave it, as a JSON line to ``<root>/<id>.events``. A status or events
+    request that lands on another gunicorn worker reads them from here, so
+    ``root`` must be on storage all workers share, like the download store.
+    """
+
+    def __init__(self, root: str, poll_interval: float = 0.5):
+        self.root = root
+        self.poll_interval = poll_interval
+        os.makedirs(root, exist_ok=True)
+        self._stats = {
+            "states_written": 0,
+            "events_written": 0,
+            "write_errors": 0
+        }
+
+    def _path(self, job_id: str, suffix: str) -> Optional[str]:
+        # Job IDs come from URLs; anything but a uuid4 hex never names a file
+        if not JOB_ID_RE.fullmatch(job_id):
+            return None
+        return os.path.join(self.root, f"{job_id}{suffix}")
+
+    def write_state(self, state: Dict[str, Any]) -> None:
+        """Atomically replace a job's state snapshot"""
+        path = self._path(state['job_id'], '.json')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+            self._stats["states_written"] += 1
+        except OSError as e:
+            self._stats["write_errors"] += 1
+            logger.error(f"Could not write state of job {state['job_id']}: {str(e)}")
+
+    def append_event(self, job_id: str, seq: int, event: Dict[str, Any]) -> None:
+        """Append one event; only the worker running the job writes its events"""
+        try:
+            with open(self._path(job_id, '.events'), 'a') as f:
+                f.write(json.dumps({'seq': seq, 'event': event}) + "\n")
+            self._stats["events_written"] += 1
+        except OSError as e:
+            self._stats["write_errors"] += 1
+            logger.error(f"Could not record event of job {job_id}: {str(e)}")
+
+    def read_state(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(job_id, '.json')
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read state of job {job_id}: {str(e)}")
+            return None
+        return state
+
+    @staticmethod
+    def _read_events(path: str, offset: int) -> Tuple[List[Tuple[int, Dict[str, Any]]], int]:
+        """Complete records from byte ``offset`` on, and the offset just past them"""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+        # A line still being appended has no newline yet
+        end = data.rfind(b"\n") + 1
+        records = [json.loads(line) for line in data[:end].splitlines()]
+        return [(record['seq'], record['event']) for record in records], offset + end
+
+    def events_after(self, job_id: str, after: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """Recorded events with a sequence number above ``after``"""
+        path = self._path(job_id, '.events')
+        if path is None:
+            return []
+        return [(seq, event) for seq, event in self._read_events(path, 0)[0] if seq > after]
+
+    def follow(self, job_id: str, after: int = 0,
+               heartbeat: float = 15.0) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """Yield (seq, event) pairs like EventBus.subscribe, tailing the journal
+
+        Stops after the job's final state event; yields (seq, None) after
+        ``heartbeat`` quiet seconds. Only bytes appended since the last read
+        are parsed. Between reads the caller's thread sleeps in inotify until
+        one of the job's files changes (rechecking every WATCH_RECHECK
+        seconds), or polls every ``poll_interval`` seconds without inotify;
+        it stays held for as long as the client watches.
+        """
+        path = self._path(job_id, '.events')
+        if path is None:
+            return
+        offset = 0
+        quiet_since = time.monotonic()
+        watch = _FileWatch(self.root, job_id, self.poll_interval)
+        try:
+            while True:
+                records, offset = self._read_events(path, offset)
+                pending = [(seq, event) for seq, event in records if seq > after]
+                for seq, event in pending:
+                    after = seq
+                    yield seq, event
+                    if event.get('type') == 'state' and event.get('state') in FINISHED_STATES:
+                        return
+                if pending:
+                    quiet_since = time.monotonic()
+                else:
+                    state = self.read_state(job_id)
+                    if state is None or state['state'] in FINISHED_STATES:
+                        # Events are appended before the state is written, so
+                        # nothing the job published can still be missing
+                        yield from ((seq, event) for seq, event in self._read_events(path, offset)[0] if seq > after)
+                        return
+                    if time.monotonic() - quiet_since >= heartbeat:
+                        quiet_since = time.monotonic()
+                        yield after, None
+                watch.wait(max(heartbeat - (time.monotonic() - quiet_since), 0.01))
+        finally:
+            watch.close()
+
+    def prune(self, retention: float) -> int:
+        """Delete files of jobs not updated for ``retention`` seconds; returns how many"""
+        cutoff = time.time() - retention
+        removed = 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+HTTP load test for comparing the sync (gunicorn) and async (uvicorn) servers
+Keeps --concurrency requests in flight against each --base-url for
+--duration seconds and reports throughput, latency and errors, e.g.
+
+    gunicorn --bind 0.0.0.0:5000 --worker-class gthread --threads 64 main:app
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+    python loadtest.py --base-url http://localhost:5000 --base-url http://localhost:5001 \\
+        --path "/search?q=music&type=videos" --path /video/stream/dQw4w9WgXcQ \\
+        --concurrency 500 --duration 30
+
+Stream paths are read for at most --stream-bytes before the connection is
+dropped, like a viewer seeking away.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+class Result:
+    def __init__(self):
+        self.latencies = []
+        self.first_byte = []
+        self.bytes = 0
+        self.errors = 0
+        self.statuses = {}
+
+def _percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+async def _one(client, url, stream_bytes, result):
+    started = time.perf_counter()
+    try:
+        async with client.stream('GET', url) as response:
+            first = None
+            is_video = response.headers.get('content-type', '').startswith('video/')
+            received = 0
+            async for chunk in response.aiter_raw():
+                if first is None:
+                    first = time.perf_counter() - started
+                received += len(chunk)
+                if is_video and stream_bytes and received >= stream_bytes:
+                    break
+            result.bytes += received
+            result.statuses[response.status_code] = result.statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 400:
+                result.errors += 1
+                return
+            result.first_byte.append(first if first is not None else time.perf_counter() - started)
+    except httpx.HTTPError:
+        result.errors += 1
+        return
+    result.latencies.append(time.perf_counter() - started)
+
+async def run(base_url, paths, concurrency, duration, stream_bytes, timeout):
+    result = Result()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    deadline = time.perf_counter() + duration
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        async def worker(offset):
+            i = offset
+            while time.perf_counter() < deadline:
+                await _one(client, paths[i % len(paths)], stream_bytes, result)
+                i += 1
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return result, elapsed
+
+def report(base_url, result, elapsed):
+    done = len(result.latencies)
+    print(f"{base_url}")
+    print(f"  requests ok       {done:>10,}   errors {result.errors:,}   statuses {result.statuses}")
+    print(f"  throughput        {done / elapsed:>10,.1f} req/s   {result.bytes / elapsed / 1e6:,.1f} MB/s")
+    if done:
+        print(f"  latency ms        p50 {_percentile(result.latencies, 50) * 1000:,.0f}"
+              f"   p95 {_percentile(result.latencies, 95) * 1000:,.0f}"
+              f"   p99 {_percentile(result.latencies, 99) * 1000:,.0f}"
+              f"   mean {statistics.mean(result.latencies) * 1000:,.0f}")
+        print(f"  first byte ms     p50 {_percentile(result.first_byte, 50) * 1000:,.0f}"
+              f"   p95 {_percentile(result.first_byte, 95) * 1000:,.0f}")
+
+def main():
+    """Main function to handle command line usage"""
+    parser = argparse.ArgumentParser(description="Load test the app's upstream-bound routes")
+    parser.add_argument("--base-url", action="append", required=True,
+                        help="Server to test; repeat to compare servers one after another")
+    parser.add_argument("--path", action="append", required=True, help="Path to request; repeat to mix paths")
+    parser.add_argument("--concurrency", "-c", type=int, default=200, help="Requests kept in flight")
+    parser.add_argument("--duration", "-d", type=float, default=30, help="Seconds per server")
+    parser.add_argument("--stream-bytes", type=int, default=4 * 1024 * 1024,
+                        help="Bytes read from a video response before dropping it (0 reads it all)")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    for base_url in args.base_url:
+        result, elapsed = asyncio.run(run(base_url, args.path, args.concurrency, args.duration,
+                                          args.stream_bytes, args.timeout))
+        report(base_url, result, elapsed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -34,12 +34,37 @@ class SearchHistory(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     user = db.relationship('User', backref=db.backref('searches', lazy=True))
 
+    # A user's searches, newest first (the search history page)
+    __table_args__ = (
+        db.Index('ix_search_history_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
+
+class SearchCount(db.Model):
+    """All-time number of searches per (lowercased) query, kept up to date as searches are written"""
+    query_column = db.Column('query', db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    last_searched = db.Column(db.DateTime)
+
+class HourlySearchCount(db.Model):
+    """Searches per query and hour, for the 24-hour and 7-day popular lists; older hours are pruned"""
+    query_column = db.Column('query', db.String(200), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True, index=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
 class Video(db.Model):
     id = db.Column(db.String(20), primary_key=True)  # YouTube video ID
     title = db.Column(db.String(200), nullable=False)
     thumbnail_url = db.Column(db.String(500))
-    search_query_id = db.Column(db.Integer, db.ForeignKey('search_history.id'))
+    search_query_id = db.Column(db.Integer, db.ForeignKey('search_history.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Indexed for local search; nullable, since rows saved earlier lack them
+    channel = db.Column(db.String(200))
+    channel_id = db.Column(db.String(64))
+    description = db.Column(db.Text)
+    duration = db.Column(db.String(20))
+    # Last time a search returned this video; the search index refreshes from it
+    updated_at = db.Column(db.DateTime, index=True)
     
     search_query = db.relationship('SearchHistory', backref=db.backref('videos', lazy=True))
     
@@ -65,6 +90,13 @@ class UserVideo(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # Is this video already in the user's collection?
+        db.Index('ix_user_video_user_video', 'user_id', 'video_id'),
+        # A user's collection, newest first (the my videos page)
+        db.Index('ix_user_video_user_created', 'user_id', 'created_at', 'id'),
+    )
     
     def __repr__(self):
         return f'<UserVideo {self.user_id}:{self.video_id}>'
@@ -0,0 +1,53 @@
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> str:
+    # Rows without a sort value get an empty one: "_<id>"
+    return f"{sort_value.isoformat() if sort_value is not None else ''}_{row_id}"
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        sort_value, row_id = cursor.rsplit('_', 1)
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(row_id)
+    except ValueError:
+        raise ValueError(f"Invalid page cursor: {cursor}")
+
+def _rows(session: Any, statement: Any) -> List[Any]:
+    return list(session.execute(statement).unique().scalars())
+
+def keyset_page(session: Any, statement: Any, sort_column: Any, id_column: Any,
+                before: Optional[str] = None, limit: int = 50) -> Tuple[List[Any], Optional[str]]:
+    """One page of ``statement``'s rows, newest first, and the cursor of the next page
+
+    Rows are ordered by (``sort_column``, ``id_column``) descending and a page
+    starts after the row the cursor names, so with an index on the filter
+    columns followed by those two, every page reads only ``limit`` rows
+    however far back it is. Rows whose sort value is NULL come after all
+    others, newest ID first; they are read with a query of their own so
+    neither part needs an OR the index cannot seek. Raises ValueError for a
+    malformed cursor.
+    """
+    sort_value, row_id = decode_cursor(before) if before else (None, None)
+    rows: List[Any] = []
+    if not before or sort_value is not None:
+        dated = statement.where(sort_column.isnot(None))
+        if before:
+            # The redundant <= bound lets the database seek into the index
+            # instead of scanning every row the OR could match
+            dated = dated.where(and_(
+                sort_column <= sort_value,
+                or_(sort_column < sort_value, id_column < row_id)
+            ))
+        rows = _rows(session, dated.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1))
+    if len(rows) <= limit:
+        undated = statement.where(sort_column.is_(None))
+        if before and sort_value is None:
+            undated = undated.where(id_column < row_id)
+        rows += _rows(session, undated.order_by(id_column.desc()).limit(limit + 1 - len(rows)))
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
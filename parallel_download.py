@@ -0,0 +1,242 @@
+import os
+import json
+import shutil
+import subprocess
+import threading
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from http_client import UpstreamClient, upstream_client
+
+logger = logging.getLogger(__name__)
+
+# googlevideo throttles large single requests; ranges this size stay fast
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Attempts per range before the whole download is given up
+CHUNK_RETRIES = 3
+
+# Read size while streaming one range into the part file
+READ_SIZE = 256 * 1024
+
+class DownloadInterrupted(Exception):
+    pass
+
+class TransferStats:
+    """Byte counter shared by every range of one or more concurrent transfers"""
+
+    def __init__(self, total_bytes: int = 0,
+                 on_progress: Optional[Callable[[int, int, Optional[float]], None]] = None):
+        self.total_bytes = total_bytes
+        self.downloaded_bytes = 0
+        self.resumed_bytes = 0
+        self.started = time.monotonic()
+        self._on_progress = on_progress
+        self._lock = threading.Lock()
+
+    def add(self, count: int) -> None:
+        with self._lock:
+            self.downloaded_bytes += count
+            done = self.downloaded_bytes + self.resumed_bytes
+        if self._on_progress is not None:
+            self._on_progress(done, self.total_bytes, self.throughput)
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Bytes per second fetched in this run (resumed bytes excluded)"""
+        elapsed = time.monotonic() - self.started
+        return self.downloaded_bytes / elapsed if elapsed > 0 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        return {
+            'total_bytes': self.total_bytes,
+            'downloaded_bytes': self.downloaded_bytes,
+            'resumed_bytes': self.resumed_bytes,
+            'seconds': round(elapsed, 2),
+            'throughput_bps': round(self.downloaded_bytes / elapsed) if elapsed > 0 else None
+        }
+
+class RangeDownloader:
+    """Fetches one URL as concurrent byte ranges into a resumable part file
+
+    The file is written to ``<dest>.part`` with positional writes, and the
+    indexes of finished ranges go to a ``<dest>.part.json`` sidecar. A later
+    call for the same destination and size (say, after the worker was killed)
+    skips the ranges already on disk.
+    """
+
+    def __init__(self, http: Optional[UpstreamClient] = None, connections: int = 4,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.http = http or upstream_client
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+
+    def _probe_size(self, url: str, headers: Dict[str, str]) -> int:
+        response = self.http.get(url, headers={**headers, 'Range': 'bytes=0-0'}, stream=True)
+        try:
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range:
+                return int(content_range.rsplit('/', 1)[1])
+            raise DownloadInterrupted(f"Server does not support ranges (HTTP {response.status_code})")
+        finally:
+            response.close()
+
+    @staticmethod
+    def _load_sidecar(path: str, size: int, chunk_size: int) -> set:
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if state.get('size') != size or state.get('chunk_size') != chunk_size:
+            return set()
+        return set(state.get('done', []))
+
+    @staticmethod
+    def _save_sidecar(path: str, size: int, chunk_size: int, done: set) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'size': size, 'chunk_size': chunk_size, 'done': sorted(done)}, f)
+        os.replace(tmp_path, path)
+
+    def _fetch_range(self, url: str, headers: Dict[str, str], fd: int, start: int, end: int,
+                     stats: TransferStats) -> None:
+        """Write bytes start..end (inclusive) of the URL at the same offsets in the part file"""
+        for attempt in range(CHUNK_RETRIES):
+            position = start
+            try:
+                response = self.http.get(url, headers={**headers, 'Range': f"bytes={start}-{end}"}, stream=True)
+                try:
+                    if response.status_code != 206:
+                        raise DownloadInterrupted(f"Expected 206 for range {start}-{end}, got {response.status_code}")
+                    for block in response.iter_content(chunk_size=READ_SIZE):
+                        if not block:
+                            continue
+                        os.pwrite(fd, block, position)
+                        position += len(block)
+                        stats.add(len(block))
+                finally:
+                    response.close()
+                if position != end + 1:
+                    raise DownloadInterrupted(f"Range {start}-{end} ended early at {position}")
+                return
+            except Exception as e:
+                # Bytes from the failed attempt are fetched again
+                stats.add(-(position - start))
+                if attempt == CHUNK_RETRIES - 1:
+                    raise
+                logger.warning(f"Retrying range {start}-{end}: {str(e)}")
+                time.sleep(0.5 * (attempt + 1))
+
+    def download(self, url: str, dest: str, size: Optional[int] = None,
+                 headers: Optional[Dict[str, str]] = None,
+                 stats: Optional[TransferStats] = None) -> Dict[str, Any]:
+        """Download ``url`` to ``dest``; returns byte counts, duration and throughput"""
+        headers = headers or {}
+        size = size or self._probe_size(url, headers)
+        part_path = f"{dest}.part"
+        sidecar_path = f"{part_path}.json"
+        own_stats = stats is None
+        if stats is None:
+            stats = TransferStats(size)
+
+        chunk_count = (size + self.chunk_size - 1) // self.chunk_size
+        done = self._load_sidecar(sidecar_path, size, self.chunk_size) if os.path.exists(part_path) else set()
+        if done:
+            resumed = sum(min(self.chunk_size, size - i * self.chunk_size) for i in done)
+            stats.resumed_bytes += resumed
+            logger.info(f"Resuming {os.path.basename(dest)}: {len(done)}/{chunk_count} ranges already on disk")
+
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        done_lock = threading.Lock()
+        try:
+            os.ftruncate(fd, size)
+
+            def fetch(index: int) -> None:
+                start = index * self.chunk_size
+                end = min(start + self.chunk_size, size) - 1
+                self._fetch_range(url, headers, fd, start, end, stats)
+                with done_lock:
+                    done.add(index)
+                    self._save_sidecar(sidecar_path, size, self.chunk_size, done)
+
+            pending = [i for i in range(chunk_count) if i not in done]
+            with ThreadPoolExecutor(max_workers=min(self.connections, max(len(pending), 1)),
+                                    thread_name_prefix="range") as pool:
+                for future in [pool.submit(fetch, index) for index in pending]:
+                    future.result()
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        os.replace(part_path, dest)
+        try:
+            os.remove(sidecar_path)
+        except FileNotFoundError:
+            pass
+        result = stats.to_dict() if own_stats else {'total_bytes': size}
+        result['connections'] = self.connections
+        return result
+
+def merge_streams(video_path: str, audio_path: str, dest: str) -> None:
+    """Mux a video-only and an audio-only file into ``dest`` without re-encoding"""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is required to merge video and audio")
+    tmp_path = f"{dest}.merging.{os.path.splitext(dest)[1].lstrip('.') or 'mp4'}"
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-i', video_path, '-i', audio_path,
+               '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', tmp_path]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg merge failed: {completed.stderr.strip()[:500]}")
+    os.replace(tmp_path, dest)
+
+def download_formats(formats: List[Dict[str, Any]], part_dir: str, dest: str,
+                     connections: int = 4, http: Optional[UpstreamClient] = None,
+                     on_progress: Optional[Callable[[int, int, Optional[float]], None]] = None,
+                     on_merge: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Download yt-dlp format dicts side by side, then merge them into ``dest``
+
+    Every format is fetched at the same time, with ``connections`` split
+    between them. Each format's part file is named by video and format ID, so
+    an interrupted download resumes from what is already on disk.
+    """
+    os.makedirs(part_dir, exist_ok=True)
+    per_stream = max(1, connections // len(formats))
+    downloader = RangeDownloader(http=http, connections=per_stream)
+    stats = TransferStats(sum(f.get('filesize') or 0 for f in formats), on_progress)
+
+    paths = [
+        os.path.join(part_dir, f"{f['_video_id']}-{f['format_id']}.{f.get('ext') or 'bin'}")
+        for f in formats
+    ]
+    with ThreadPoolExecutor(max_workers=len(formats), thread_name_prefix="stream") as pool:
+        futures = [
+            pool.submit(downloader.download, f['url'], path, f.get('filesize'), f.get('http_headers'), stats)
+            for f, path in zip(formats, paths)
+        ]
+        for future in futures:
+            future.result()
+    transfer = stats.to_dict()
+
+    if len(paths) == 1:
+        os.replace(paths[0], dest)
+    else:
+        if on_merge is not None:
+            on_merge()
+        started = time.monotonic()
+        merge_streams(paths[0], paths[1], dest)
+        transfer['merge_seconds'] = round(time.monotonic() - started, 2)
+        for path in paths:
+            os.remove(path)
+
+    transfer['connections'] = connections
+    transfer['streams'] = len(formats)
+    logger.info(
+        f"Downloaded {os.path.basename(dest)}: {transfer['downloaded_bytes']} bytes in {transfer['seconds']}s "
+        f"({(transfer['throughput_bps'] or 0) / 1e6:.1f} MB/s, {connections} connections)"
+    )
+    return transfer
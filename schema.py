@@ -0,0 +1,36 @@
+import logging
+from typing import Any
+
+from sqlalchemy import inspect
+
+logger = logging.getLogger(__name__)
+
+def _add_missing_columns(connection: Any, table: Any) -> None:
+    """Add nullable columns a model declares but an existing table lacks"""
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    preparer = connection.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        if not column.nullable:
+            logger.error(f"Column {table.name}.{column.name} is missing and NOT NULL; add it with a migration")
+            continue
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.exec_driver_sql(
+            f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}"
+        )
+        logger.info(f"Added column {table.name}.{column.name}")
+
+def ensure_schema(db: Any) -> None:
+    """Create missing tables, then any nullable columns and indexes missing from existing tables
+
+    ``create_all`` only adds columns and indexes along with a new table, so
+    ones declared on a model later would never reach an existing database.
+    """
+    db.create_all()
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            _add_missing_columns(connection, table)
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+    logger.debug("Database schema is up to date")
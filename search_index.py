@@ -0,0 +1,241 @@
+import os
+import re
+import math
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# How much a query word counts when it appears in each field
+FIELD_WEIGHTS = {'title': 3.0, 'channel': 2.0, 'description': 1.0}
+
+# Words in more than this share of videos (and more than a page of them)
+# are too common to widen an OR match
+COMMON_TOKEN_SHARE = 0.2
+
+# Overlap when asking the database for rows changed since the last refresh,
+# so rows written with a slightly earlier clock are not missed
+REFRESH_OVERLAP = timedelta(seconds=10)
+
+SEARCH_MODES = ('off', 'prefill', 'local', 'offline')
+
+# Rough cost of one indexed video (stored fields, word weights and postings),
+# measured with tracemalloc on typical titles and descriptions
+BYTES_PER_VIDEO = 8 * 1024
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_RE.findall(text.casefold()) if text else []
+
+class SearchIndex:
+    """In-process inverted index over stored Video metadata
+
+    Maps each word of a video's title, channel and description to the
+    videos containing it, and ranks matches by field-weighted word counts
+    times inverse document frequency. Videos from this worker's own searches
+    are added as they are seen; ``start`` loads the most recently seen
+    stored videos in the background and then picks up rows other workers
+    wrote every ``refresh_interval`` seconds. At most ``max_docs`` videos are kept,
+    the least recently added going first. Every gunicorn worker holds its
+    own copy, so ``max_docs`` is sized from a per-worker memory budget.
+    """
+
+    def __init__(self, max_docs: int = 8192, refresh_interval: float = 60.0, page_size: int = 5000):
+        self.max_docs = max_docs
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+        self._docs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._weights: Dict[str, Dict[str, float]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self._loaded = threading.Event()
+        self._stats = {
+            "searches": 0,
+            "hits": 0,
+            "search_ms": 0.0,
+            "added": 0,
+            "evicted": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "last_refresh": None
+        }
+
+    @classmethod
+    def from_env(cls) -> "SearchIndex":
+        """Build an index configured from SEARCH_INDEX_* environment variables
+
+        SEARCH_INDEX_MAX_DOCS, when set, overrides the video count derived
+        from SEARCH_INDEX_MEMORY_MB.
+        """
+        memory_mb = float(os.environ.get("SEARCH_INDEX_MEMORY_MB", 64))
+        max_docs = os.environ.get("SEARCH_INDEX_MAX_DOCS")
+        return cls(
+            max_docs=int(max_docs) if max_docs else int(memory_mb * 1024 * 1024 // BYTES_PER_VIDEO),
+            refresh_interval=float(os.environ.get("SEARCH_INDEX_REFRESH", 60))
+        )
+
+    def _remove(self, video_id: str) -> None:
+        self._docs.pop(video_id, None)
+        for token in self._weights.pop(video_id, {}):
+            ids = self._postings.get(token)
+            if ids is not None:
+                ids.discard(video_id)
+                if not ids:
+                    del self._postings[token]
+
+    def add(self, videos: Iterable[Dict[str, Any]]) -> int:
+        """Index (or re-index) video result dicts; returns how many were added"""
+        added = 0
+        with self._lock:
+            for video in videos:
+                video_id = video.get('id')
+                if not video_id or not video.get('title'):
+                    continue
+                self._remove(video_id)
+                weights: Dict[str, float] = {}
+                for field, weight in FIELD_WEIGHTS.items():
+                    for token in tokenize(video.get(field)):
+                        weights[token] = weights.get(token, 0.0) + weight
+                self._docs[video_id] = {
+                    'id': video_id,
+                    'title': video['title'],
+                    'thumbnail': video.get('thumbnail') or f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+                    'channel': video.get('channel') or "Unknown Channel",
+                    'channel_id': video.get('channel_id') or "",
+                    'views': "",
+                    'duration': video.get('duration') or "Unknown duration",
+                    'publish_time': "",
+                    'description': video.get('description') or ""
+                }
+                self._weights[video_id] = weights
+                for token in weights:
+                    self._postings.setdefault(token, set()).add(video_id)
+                added += 1
+            while len(self._docs) > self.max_docs:
+                self._remove(next(iter(self._docs)))
+                self._stats["evicted"] += 1
+            self._stats["added"] += added
+        return added
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Best matches for ``query``: videos with every word first, then videos with some"""
+        started = time.perf_counter()
+        tokens = list(dict.fromkeys(tokenize(query)))
+        results: List[Dict[str, Any]] = []
+        with self._lock:
+            total = len(self._docs)
+            postings = [(token, self._postings.get(token, set())) for token in tokens]
+            if total and postings:
+                idf = {token: math.log(1 + total / (len(ids) or 1)) for token, ids in postings}
+
+                def score(video_id: str) -> float:
+                    weights = self._weights[video_id]
+                    return sum(weights.get(token, 0.0) * idf[token] for token in tokens)
+
+                # Intersect from the rarest word so the working set stays small
+                postings.sort(key=lambda item: len(item[1]))
+                matches = set(postings[0][1])
+                for _, ids in postings[1:]:
+                    matches &= ids
+                ranked = heapq.nlargest(limit, matches, key=score)
+
+                if len(ranked) < limit and len(postings) > 1:
+                    partial: Set[str] = set()
+                    for _, ids in postings:
+                        if len(ids) <= max(total * COMMON_TOKEN_SHARE, limit):
+                            partial |= ids
+                    partial -= matches
+                    ranked += heapq.nlargest(limit - len(ranked), partial, key=score)
+                results = [dict(self._docs[video_id]) for video_id in ranked]
+
+            self._stats["searches"] += 1
+            self._stats["hits"] += bool(results)
+            self._stats["search_ms"] += (time.perf_counter() - started) * 1000
+        return results
+
+    def search_channels(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Channels of the best matching videos, in order of their best video"""
+        channels: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for video in self.search(query, limit=limit * 5):
+            if video['channel_id'] and video['channel_id'] not in channels:
+                channels[video['channel_id']] = {
+                    'id': video['channel_id'],
+                    'name': video['channel'],
+                    'thumbnail': video['thumbnail'],
+                    'subscriber_count': "",
+                    'description': ""
+                }
+        return list(channels.values())[:limit]
+
+    def start(self, load_page: Callable[[datetime, Optional[str], int], List[Dict[str, Any]]],
+              load_newest: Callable[[int], List[Dict[str, Any]]]) -> None:
+        """Load stored videos in the background and keep picking up new ones
+
+        ``load_newest(limit)`` returns the ``limit`` most recently updated
+        videos, newest first, and fills the index once. After that
+        ``load_page(since, after_id, limit)`` returns up to ``limit`` videos
+        updated at or after ``since``, ordered by ID after ``after_id``.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            # Started on first use so no thread exists before gunicorn forks
+            self._thread = threading.Thread(target=self._run, args=(load_page, load_newest),
+                                            name="search-index", daemon=True)
+            self._thread.start()
+
+    def _load(self, load_page: Callable[..., List[Dict[str, Any]]], since: datetime) -> int:
+        loaded, after_id = 0, None
+        while True:
+            page = load_page(since, after_id, self.page_size)
+            loaded += self.add(page)
+            if len(page) < self.page_size:
+                return loaded
+            after_id = page[-1]['id']
+
+    def _run(self, load_page: Callable[..., List[Dict[str, Any]]],
+             load_newest: Callable[[int], List[Dict[str, Any]]]) -> None:
+        since: Optional[datetime] = None
+        while True:
+            checkpoint = datetime.utcnow() - REFRESH_OVERLAP
+            try:
+                if since is None:
+                    # Only the newest max_docs rows could stay; oldest added
+                    # first so they are the first evicted
+                    loaded = self.add(reversed(load_newest(self.max_docs)))
+                else:
+                    loaded = self._load(load_page, since)
+                since = checkpoint
+                with self._lock:
+                    self._stats["refreshes"] += 1
+                    self._stats["last_refresh"] = datetime.utcnow().isoformat()
+                if loaded:
+                    logger.debug(f"Search index loaded {loaded} videos, {len(self._docs)} indexed")
+            except Exception as e:
+                with self._lock:
+                    self._stats["refresh_errors"] += 1
+                logger.error(f"Search index refresh failed: {str(e)}")
+            self._loaded.set()
+            time.sleep(self.refresh_interval)
+
+    def wait_loaded(self, timeout: Optional[float] = None) -> bool:
+        return self._loaded.wait(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["videos"] = len(self._docs)
+            stats["words"] = len(self._postings)
+        stats["avg_search_ms"] = round(stats["search_ms"] / stats["searches"], 3) if stats["searches"] else None
+        stats["search_ms"] = round(stats["search_ms"], 1)
+        stats["loaded"] = self._loaded.is_set()
+        stats["max_docs"] = self.max_docs
+        stats["approx_mb"] = round(stats["videos"] * BYTES_PER_VIDEO / (1024 * 1024), 1)
+        return stats
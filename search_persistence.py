@@ -0,0 +1,475 @@
+import os
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, select, update
+
+from models import HourlySearchCount, SearchCount, SearchHistory, Video
+from pagination import keyset_page
+
+logger = logging.getLogger(__name__)
+
+# Column limits of the Video model
+TITLE_LENGTH = 200
+THUMBNAIL_LENGTH = 500
+CHANNEL_LENGTH = 200
+CHANNEL_ID_LENGTH = 64
+DURATION_LENGTH = 20
+QUERY_LENGTH = 200
+
+# Columns a repeat sighting of a video refreshes, besides updated_at
+VIDEO_UPDATE_COLUMNS = ('title', 'thumbnail_url', 'channel', 'channel_id', 'description', 'duration',
+                        'search_query_id')
+# Of those, ones a sighting without a value leaves as they are
+VIDEO_KEEP_COLUMNS = ('thumbnail_url', 'channel', 'channel_id', 'description', 'duration')
+
+# Windows of the popular-searches lists; hourly counts older than the
+# longest one are pruned
+POPULAR_PERIODS = {
+    'day': timedelta(hours=24),
+    'week': timedelta(days=7),
+    'all': None
+}
+HOURLY_RETENTION = timedelta(days=7)
+
+def popularity_key(query: str) -> str:
+    """Queries differing only in case or spacing count as the same search"""
+    return ' '.join(query.lower().split())[:QUERY_LENGTH]
+
+def _video_rows(videos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Video columns for a page of results, one row per video ID"""
+    rows: Dict[str, Dict[str, Any]] = {}
+    for video in videos:
+        if not video.get('id') or not video.get('title'):
+            continue
+        rows[video['id']] = {
+            'id': video['id'],
+            'title': video['title'][:TITLE_LENGTH],
+            'thumbnail_url': (video.get('thumbnail') or '')[:THUMBNAIL_LENGTH] or None,
+            'channel': (video.get('channel') or '')[:CHANNEL_LENGTH] or None,
+            'channel_id': (video.get('channel_id') or '')[:CHANNEL_ID_LENGTH] or None,
+            'description': video.get('description') or None,
+            'duration': (video.get('duration') or '')[:DURATION_LENGTH] or None
+        }
+    return list(rows.values())
+
+def pending_search(query: str, search_type: str, results: Dict[str, Any],
+                   user_id: Optional[int]) -> Dict[str, Any]:
+    """What gets written for one search, keeping only the columns we store"""
+    items = results.get('results', []) if search_type == 'videos' else results.get('channels', [])
+    return {
+        'query': query[:QUERY_LENGTH],
+        'results_count': len(items),
+        'user_id': user_id,
+        'timestamp': datetime.utcnow(),
+        'videos': _video_rows(items) if search_type == 'videos' else []
+    }
+
+def _insert(session: Any):
+    """The dialect's INSERT supporting ON CONFLICT, or None if it has none"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+def _db_utcnow(session: Any) -> Any:
+    """The database's current UTC time as a naive timestamp, like datetime.utcnow()"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return func.timezone('UTC', func.now())
+    if dialect == 'mysql':
+        return func.utc_timestamp()
+    # SQLite's CURRENT_TIMESTAMP is UTC
+    return func.now()
+
+def upsert_videos(session: Any, rows: List[Dict[str, Any]]) -> int:
+    """Insert new videos and refresh existing ones (``VIDEO_UPDATE_COLUMNS``), in one statement where possible
+
+    Each video ID may appear only once in ``rows``. PostgreSQL and SQLite
+    get ``INSERT ... ON CONFLICT (id) DO UPDATE``; other databases fall back
+    to one SELECT of the existing IDs, one bulk INSERT and one bulk UPDATE.
+    A NULL in one of ``VIDEO_KEEP_COLUMNS`` keeps the stored value.
+    ``updated_at`` is set from the database clock as the rows are written,
+    so the local search index refresh, which reads rows updated since its
+    last pass, sees them no matter how long they were queued.
+    """
+    if not rows:
+        return 0
+
+    table = Video.__table__
+    stamp = _db_utcnow(session)
+
+    def refreshed(column: str, value: Any) -> Any:
+        # Results pages often lack a description or channel; keep the stored one
+        return func.coalesce(value, table.c[column]) if column in VIDEO_KEEP_COLUMNS else value
+
+    insert = _insert(session)
+    if insert is not None:
+        statement = insert(Video).values([{**row, 'updated_at': stamp} for row in rows])
+        statement = statement.on_conflict_do_update(
+            index_elements=[Video.id],
+            set_={**{column: refreshed(column, statement.excluded[column]) for column in VIDEO_UPDATE_COLUMNS},
+                  'updated_at': statement.excluded.updated_at}
+        )
+        session.execute(statement)
+        return len(rows)
+
+    existing = set(session.execute(select(Video.id).where(Video.id.in_([row['id'] for row in rows]))).scalars())
+    new_rows = [row for row in rows if row['id'] not in existing]
+    if new_rows:
+        session.execute(table.insert().values(updated_at=stamp), new_rows)
+    existing_rows = [row for row in rows if row['id'] in existing]
+    if existing_rows:
+        # Executemany UPDATE ... WHERE id = ? with each row's values
+        statement = update(table).where(table.c.id == bindparam('video_id')).values(
+            {**{column: refreshed(column, bindparam(f"new_{column}")) for column in VIDEO_UPDATE_COLUMNS},
+             'updated_at': stamp}
+        )
+        session.execute(statement, [
+            {'video_id': row['id'], **{f"new_{column}": row.get(column) for column in VIDEO_UPDATE_COLUMNS}}
+            for row in existing_rows
+        ])
+    return len(rows)
+
+def count_searches(session: Any, searches: List[Dict[str, Any]], hourly_since: Optional[datetime] = None) -> None:
+    """Add a batch of searches to the all-time and hourly popularity counters
+
+    Counts are summed per query (and hour) first, so each counter row is
+    incremented once per batch. Searches without a timestamp, or from before
+    ``hourly_since``, only count towards the all-time total.
+    """
+    totals: Dict[str, Dict[str, Any]] = {}
+    hourly: Dict[Tuple[str, datetime], int] = {}
+    for search in searches:
+        key = popularity_key(search['query'])
+        if not key:
+            continue
+        timestamp = search['timestamp']
+        total = totals.setdefault(key, {'query': key, 'count': 0, 'last_searched': timestamp})
+        total['count'] += 1
+        if timestamp is None:
+            continue
+        if total['last_searched'] is None or timestamp > total['last_searched']:
+            total['last_searched'] = timestamp
+        if hourly_since is None or timestamp >= hourly_since:
+            hour = timestamp.replace(minute=0, second=0, microsecond=0)
+            hourly[(key, hour)] = hourly.get((key, hour), 0) + 1
+    if not totals:
+        return
+    # Sorted, so workers flushing at the same time lock counter rows in the same order
+    total_rows = [totals[key] for key in sorted(totals)]
+    hourly_rows = [{'query': key, 'hour': hour, 'count': hourly[(key, hour)]} for key, hour in sorted(hourly)]
+
+    totals_table = SearchCount.__table__
+    hourly_table = HourlySearchCount.__table__
+    insert = _insert(session)
+    if insert is not None:
+        statement = insert(totals_table).values(total_rows)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[totals_table.c.query],
+            set_={
+                'count': totals_table.c.count + statement.excluded.count,
+                'last_searched': func.coalesce(statement.excluded.last_searched, totals_table.c.last_searched)
+            }
+        ))
+        if hourly_rows:
+            statement = insert(hourly_table).values(hourly_rows)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[hourly_table.c.query, hourly_table.c.hour],
+                set_={'count': hourly_table.c.count + statement.excluded.count}
+            ))
+        return
+
+    # Without ON CONFLICT, one lookup per counter row
+    for row in total_rows:
+        counter = session.get(SearchCount, row['query'])
+        if counter is None:
+            session.execute(totals_table.insert(), [row])
+        else:
+            counter.count += row['count']
+            counter.last_searched = row['last_searched'] or counter.last_searched
+    for row in hourly_rows:
+        counter = session.get(HourlySearchCount, (row['query'], row['hour']))
+        if counter is None:
+            session.execute(hourly_table.insert(), [row])
+        else:
+            counter.count += row['count']
+
+def write_searches(session: Any, searches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Save a batch of searches and the videos they found in one transaction
+
+    The SearchHistory rows are flushed first so their IDs exist before the
+    videos are linked to them; a video found by several searches in the batch
+    ends up linked to the latest one. The popularity counters are updated in
+    the same transaction and hourly counts past ``HOURLY_RETENTION`` dropped.
+    """
+    started = time.perf_counter()
+    try:
+        histories = []
+        for search in searches:
+            search_history = SearchHistory()
+            search_history.query_column = search['query']
+            search_history.results_count = search['results_count']
+            search_history.user_id = search['user_id']
+            search_history.timestamp = search['timestamp']
+            histories.append(search_history)
+        session.add_all(histories)
+        session.flush()
+
+        rows: Dict[str, Dict[str, Any]] = {}
+        for search, search_history in zip(searches, histories):
+            for video in search['videos']:
+                rows[video['id']] = {**video, 'search_query_id': search_history.id}
+        written = upsert_videos(session, list(rows.values()))
+        count_searches(session, searches)
+        session.execute(delete(HourlySearchCount).where(
+            HourlySearchCount.hour < datetime.utcnow() - HOURLY_RETENTION
+        ))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return {'searches': len(histories), 'videos': written, 'db_ms': (time.perf_counter() - started) * 1000}
+
+def backfill_search_counts(session: Any, batch_size: int = 5000) -> int:
+    """Fill empty popularity counters from the existing search history; returns the searches counted
+
+    For databases that had searches before the counter tables existed. Does
+    nothing once the all-time counter has any rows, so it is safe to run on
+    every migration. The history is read in ID order ``batch_size`` rows at a
+    time and committed in one transaction, so an interrupted run leaves the
+    counters empty and the next run starts over.
+    """
+    if session.execute(select(SearchCount.query_column).limit(1)).first() is not None:
+        return 0
+    hourly_since = datetime.utcnow() - HOURLY_RETENTION
+    counted, after_id = 0, 0
+    try:
+        while True:
+            rows = session.execute(
+                select(SearchHistory.id, SearchHistory.query_column, SearchHistory.timestamp)
+                .where(SearchHistory.id > after_id)
+                .order_by(SearchHistory.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            count_searches(session, [{'query': row.query_column, 'timestamp': row.timestamp} for row in rows],
+                           hourly_since=hourly_since)
+            counted += len(rows)
+            after_id = rows[-1].id
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    if counted:
+        logger.info(f"Backfilled search counters from {counted} searches")
+    return counted
+
+def popular_searches(session: Any, period: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """The most searched queries over one of ``POPULAR_PERIODS``
+
+    Reads the counter tables, so the cost depends on the number of distinct
+    queries in the window rather than on the size of the search history.
+    """
+    window = POPULAR_PERIODS[period]
+    if window is None:
+        statement = (select(SearchCount.query_column, SearchCount.count, SearchCount.last_searched)
+                     .order_by(SearchCount.count.desc()).limit(limit))
+    else:
+        total = func.sum(HourlySearchCount.count)
+        statement = (select(HourlySearchCount.query_column, total, func.max(HourlySearchCount.hour))
+                     .where(HourlySearchCount.hour >= datetime.utcnow() - window)
+                     .group_by(HourlySearchCount.query_column)
+                     .order_by(total.desc()).limit(limit))
+    return [{'query': query, 'count': count, 'last_searched': last_searched}
+            for query, count, last_searched in session.execute(statement)]
+
+INDEXED_VIDEO_COLUMNS = (Video.id, Video.title, Video.thumbnail_url, Video.channel, Video.channel_id,
+                         Video.description, Video.duration)
+
+def indexed_videos(session: Any, since: Optional[datetime] = None, after_id: Optional[str] = None,
+                   limit: int = 5000) -> List[Dict[str, Any]]:
+    """A page of stored videos for the local search index, ordered by ID
+
+    With ``since``, only videos a search returned at or after that time.
+    """
+    statement = select(*INDEXED_VIDEO_COLUMNS)
+    if since is not None:
+        statement = statement.where(Video.updated_at >= since)
+    if after_id is not None:
+        statement = statement.where(Video.id > after_id)
+    return _indexed_rows(session, statement.order_by(Video.id).limit(limit))
+
+def newest_indexed_videos(session: Any, limit: int) -> List[Dict[str, Any]]:
+    """The ``limit`` videos searches returned most recently, newest first, for a fresh index"""
+    statement = (select(*INDEXED_VIDEO_COLUMNS)
+                 .order_by(Video.updated_at.desc().nulls_last(), Video.id.desc())
+                 .limit(limit))
+    return _indexed_rows(session, statement)
+
+def _indexed_rows(session: Any, statement: Any) -> List[Dict[str, Any]]:
+    return [{
+        'id': row.id,
+        'title': row.title,
+        'thumbnail': row.thumbnail_url,
+        'channel': row.channel,
+        'channel_id': row.channel_id,
+        'description': row.description,
+        'duration': row.duration
+    } for row in session.execute(statement)]
+
+def search_history_page(session: Any, user_id: int, before: Optional[str] = None,
+                        limit: int = 50) -> Tuple[List[SearchHistory], Optional[str]]:
+    """One page of a user's searches, newest first, and the cursor for the next page"""
+    statement = select(SearchHistory).where(SearchHistory.user_id == user_id)
+    return keyset_page(session, statement, SearchHistory.timestamp, SearchHistory.id, before, limit)
+
+def search_history_stats(session: Any, user_id: int) -> Dict[str, Any]:
+    """How many searches a user has made and the query they made most often"""
+    total = session.execute(
+        select(func.count()).select_from(SearchHistory).where(SearchHistory.user_id == user_id)
+    ).scalar()
+    most_searched = session.execute(
+        select(SearchHistory.query_column)
+        .where(SearchHistory.user_id == user_id)
+        .group_by(SearchHistory.query_column)
+        .order_by(func.count(SearchHistory.id).desc())
+        .limit(1)
+    ).scalar()
+    return {'total_searches': total, 'most_searched': most_searched}
+
+class SearchWriteBuffer:
+    """Write-behind buffer for search analytics
+
+    Requests only append to an in-memory queue; a background thread hands
+    the queue to ``write`` in batches every ``flush_interval`` seconds, or
+    sooner once ``batch_size`` searches are waiting. At most ``max_pending``
+    searches are held, newer ones are dropped (and counted) past that, and
+    whatever is left is written at exit. A batch the database rejects is
+    retried search by search, so only the offending searches are lost.
+    """
+
+    def __init__(self, write: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+                 batch_size: int = 100, flush_interval: float = 2.0, max_pending: int = 10000):
+        self._write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # One batch in the database at a time
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {
+            "queued": 0,
+            "dropped": 0,
+            "flushed_searches": 0,
+            "flushed_videos": 0,
+            "failed_searches": 0,
+            "batches": 0,
+            "retried_batches": 0,
+            "db_ms": 0.0,
+            "last_batch_ms": 0.0
+        }
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, write: Callable[[List[Dict[str, Any]]], Dict[str, Any]]) -> "SearchWriteBuffer":
+        """Build a buffer configured from SEARCH_WRITE_* environment variables"""
+        return cls(
+            write,
+            batch_size=int(os.environ.get("SEARCH_WRITE_BATCH", 100)),
+            flush_interval=float(os.environ.get("SEARCH_WRITE_INTERVAL", 2.0)),
+            max_pending=int(os.environ.get("SEARCH_WRITE_MAX_PENDING", 10000))
+        )
+
+    def add(self, search: Dict[str, Any]) -> bool:
+        """Queue a search for writing; False if the buffer is full and it was dropped"""
+        with self._cond:
+            if self._closed or len(self._pending) >= self.max_pending:
+                self._stats["dropped"] += 1
+                return False
+            self._pending.append(search)
+            self._stats["queued"] += 1
+            # Started on first use so no thread exists before gunicorn forks
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="search-writes", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self) -> None:
+        """Write everything queued so far, batch by batch"""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.batch_size]
+                    del self._pending[:self.batch_size]
+                if not batch:
+                    return
+                if self._write_batch(batch) or len(batch) == 1:
+                    continue
+                # One bad search must not cost the others theirs, so retry them
+                # one at a time; a search rejected on its own is dropped, since
+                # requeueing it would fail forever
+                logger.warning(f"Retrying {len(batch)} searches one at a time")
+                with self._cond:
+                    self._stats["retried_batches"] += 1
+                for search in batch:
+                    self._write_batch([search])
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        try:
+            result = self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                with self._cond:
+                    self._stats["failed_searches"] += 1
+            logger.error(f"Failed to write {len(batch)} searches: {str(e)}")
+            return False
+        with self._cond:
+            self._stats["flushed_searches"] += result['searches']
+            self._stats["flushed_videos"] += result['videos']
+            self._stats["batches"] += 1
+            self._stats["db_ms"] += result['db_ms']
+            self._stats["last_batch_ms"] = result['db_ms']
+        logger.debug(f"Wrote {result['searches']} searches and {result['videos']} videos in {result['db_ms']:.1f}ms")
+        return True
+
+    def close(self) -> None:
+        """Stop the background thread and write what is still queued"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["db_ms"] = round(stats["db_ms"], 1)
+        stats["last_batch_ms"] = round(stats["last_batch_ms"], 1)
+        stats["db_ms_per_search"] = round(stats["db_ms"] / stats["flushed_searches"], 2) if stats["flushed_searches"] else None
+        stats.update(batch_size=self.batch_size, flush_interval=self.flush_interval, max_pending=self.max_pending)
+        return stats
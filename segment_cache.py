@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import mmap
+import threading
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# Most blocks fetched upstream in one request for a run of missing blocks
+MAX_RUN_BLOCKS = 8
+
+# How long a reader waits for a block another request is already fetching
+INFLIGHT_WAIT_SECONDS = 30
+
+SAFE_NAME_RE = re.compile(r"[^\w\-]")
+
+class BlockLanding(threading.Event):
+    """Set once a block being fetched is stored or given up
+
+    Threads wait on it like any Event; asyncio code registers a callback
+    instead of holding a thread or polling.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._callbacks: List[Any] = []
+        self._callbacks_lock = threading.Lock()
+
+    def add_callback(self, callback: Any) -> None:
+        """Call ``callback()`` once set, right away if it already is"""
+        with self._callbacks_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def set(self) -> None:
+        with self._callbacks_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+class SegmentCache:
+    """Aligned blocks of proxied video streams kept on disk
+
+    A stream is identified by (video_id, format_id); its bytes are cut into
+    ``block_size`` blocks stored as ``<root>/<video_id>/<format_id>/<n>.blk``
+    next to a ``meta.json`` with the stream's size and content type. Blocks
+    are read through mmap. When the total passes ``max_bytes`` the least
+    recently used blocks are deleted.
+
+    Each block is fetched by one request at a time: readers that need a block
+    already being fetched wait for it rather than asking upstream again.
+    Blocks are written atomically, so workers sharing the directory can read
+    each other's blocks; each worker enforces the cap over the blocks it knows.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1024 ** 3, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks: "OrderedDict[str, int]" = OrderedDict()  # path -> size, least recent first
+        self._bytes = 0
+        self._inflight: Dict[str, BlockLanding] = {}
+        self._meta: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._stats = {
+            "block_hits": 0,
+            "block_misses": 0,
+            "waited": 0,
+            "local_bytes": 0,
+            "upstream_bytes": 0,
+            "evictions": 0
+        }
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_env(cls, default_root: str) -> "SegmentCache":
+        """Build a cache configured from STREAM_CACHE_* environment variables"""
+        return cls(
+            os.environ.get("STREAM_CACHE_DIR", default_root),
+            max_bytes=int(os.environ.get("STREAM_CACHE_MAX_BYTES", 1024 ** 3)),
+            block_size=int(os.environ.get("STREAM_CACHE_BLOCK_SIZE", DEFAULT_BLOCK_SIZE))
+        )
+
+    def _load(self) -> None:
+        """Index blocks left by earlier runs, oldest first"""
+        found = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.blk'):
+                    path = os.path.join(directory, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(found):
+            self._blocks[path] = size
+            self._bytes += size
+        if found:
+            logger.info(f"Segment cache loaded {len(found)} blocks ({self._bytes} bytes) from {self.root}")
+
+    def _dir(self, video_id: str, format_id: str) -> str:
+        return os.path.join(self.root, SAFE_NAME_RE.sub('_', video_id), SAFE_NAME_RE.sub('_', format_id))
+
+    def _block_path(self, video_id: str, format_id: str, index: int) -> str:
+        return os.path.join(self._dir(video_id, format_id), f"{index}.blk")
+
+    def block_count(self, size: int) -> int:
+        return (size + self.block_size - 1) // self.block_size
+
+    def block_length(self, size: int, index: int) -> int:
+        return min(self.block_size, size - index * self.block_size)
+
+    def get_meta(self, video_id: str, format_id: str) -> Optional[Dict[str, Any]]:
+        """Return {'size', 'content_type'} for a stream seen before"""
+        key = (video_id, format_id)
+        with self._lock:
+            meta = self._meta.get(key)
+        if meta is not None:
+            return meta
+        try:
+            with open(os.path.join(self._dir(video_id, format_id), 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._meta[key] = meta
+        return meta
+
+    def set_meta(self, video_id: str, format_id: str, size: int, content_type: str) -> Dict[str, Any]:
+        meta = {'size': size, 'content_type': content_type}
+        directory = self._dir(video_id, format_id)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f"meta.json.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+        with self._lock:
+            self._meta[(video_id, format_id)] = meta
+        return meta
+
+    def read(self, video_id: str, format_id: str, index: int, start: int = 0,
+             end: Optional[int] = None) -> Optional[bytes]:
+        """Return bytes [start, end) of a cached block, or None if it is not on disk"""
+        path = self._block_path(video_id, format_id, index)
+        try:
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    data = view[start:end]
+        except (OSError, ValueError):
+            with self._lock:
+                self._stats["block_misses"] += 1
+            return None
+        with self._lock:
+            if path in self._blocks:
+                self._blocks.move_to_end(path)
+            else:
+                # Written by another worker
+                self._blocks[path] = os.path.getsize(path)
+                self._bytes += self._blocks[path]
+            self._stats["block_hits"] += 1
+            self._stats["local_bytes"] += len(data)
+        return data
+
+    def claim(self, video_id: str, format_id: str, first: int, last: int) -> Tuple[List[int], Optional[BlockLanding]]:
+        """Claim the run of missing blocks from ``first`` (up to ``last``) for fetching
+
+        Returns (blocks claimed, None), or ([], event) when ``first`` is being
+        fetched by someone else; wait on the event, then read it again. Every
+        claimed block must be finished with store() or release().
+        """
+        with self._lock:
+            event = self._inflight.get(self._block_path(video_id, format_id, first))
+            if event is not None:
+                self._stats["waited"] += 1
+                return [], event
+            claimed = []
+            for index in range(first, min(last, first + MAX_RUN_BLOCKS - 1) + 1):
+                path = self._block_path(video_id, format_id, index)
+                if path in self._inflight or (index > first and os.path.exists(path)):
+                    break
+                self._inflight[path] = BlockLanding()
+                claimed.append(index)
+            return claimed, None
+
+    def store(self, video_id: str, format_id: str, index: int, data: bytes) -> None:
+        """Write a fetched block and wake readers waiting for it"""
+        path = self._block_path(video_id, format_id, index)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                previous = self._blocks.pop(path, 0)
+                self._blocks[path] = len(data)
+                self._bytes += len(data) - previous
+                self._stats["upstream_bytes"] += len(data)
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Could not cache block {path}: {str(e)}")
+        finally:
+            self.release(video_id, format_id, [index])
+
+    def release(self, video_id: str, format_id: str, indexes: List[int]) -> None:
+        """Give up claimed blocks (after a failed fetch) and wake their waiters"""
+        with self._lock:
+            for index in indexes:
+                event = self._inflight.pop(self._block_path(video_id, format_id, index), None)
+                if event is not None:
+                    event.set()
+
+    def _evict(self) -> None:
+        with self._lock:
+            victims = []
+            while self._bytes > self.max_bytes and self._blocks:
+                path, size = self._blocks.popitem(last=False)
+                self._bytes -= size
+                self._stats["evictions"] += 1
+                victims.append(path)
+        for path in victims:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            served = self._stats["local_bytes"] + self._stats["upstream_bytes"]
+            return {
+                **self._stats,
+                "blocks": len(self._blocks),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "block_size": self.block_size,
+                "inflight": len(self._inflight),
+                "local_ratio": round(self._stats["local_bytes"] / served, 3) if served else None
+            }
@@ -178,6 +178,132 @@ function openDownloadModal(videoId) {
         });
 }
 
+function formatBytes(bytes) {
+    if (!bytes) return '0 B';
+    const units = ['B', 'KB', 'MB', 'GB'];
+    const i = Math.min(Math.floor(Math.log(bytes) / Math.log(1024)), units.length - 1);
+    return `${(bytes / Math.pow(1024, i)).toFixed(i ? 1 : 0)} ${units[i]}`;
+}
+
+// Status line for a download job state or progress event
+function describeDownloadJob(event) {
+    if (event.type === 'progress') {
+        if (event.phase === 'merge') return 'Merging video and audio...';
+        if (event.phase === 'postprocess') return 'Processing file...';
+        const parts = [];
+        if (event.percent !== null && event.percent !== undefined) parts.push(`${event.percent}%`);
+        if (event.downloaded_bytes) {
+            parts.push(event.total_bytes
+                ? `${formatBytes(event.downloaded_bytes)} of ${formatBytes(event.total_bytes)}`
+                : formatBytes(event.downloaded_bytes));
+        }
+        if (event.speed) parts.push(`${formatBytes(event.speed)}/s`);
+        if (event.eta !== null && event.eta !== undefined) parts.push(`${event.eta}s left`);
+        return parts.length ? `Downloading: ${parts.join(' · ')}` : 'Downloading...';
+    }
+    if (event.state === 'queued') return 'Waiting for a free download slot...';
+    if (event.state === 'running') return 'Starting download...';
+    return 'Finishing up...';
+}
+
+// Reflect a download job event in a progress bar and status line
+function showDownloadProgress(event, progressBar, statusEl) {
+    if (statusEl) statusEl.textContent = describeDownloadJob(event);
+    if (!progressBar) return;
+    let percent = 0;
+    if (event.type === 'progress') {
+        percent = event.phase === 'download' ? (event.percent || 0) : 100;
+    } else if (event.state === 'done') {
+        percent = 100;
+    }
+    progressBar.style.width = `${percent}%`;
+    progressBar.setAttribute('aria-valuenow', percent);
+}
+
+// Poll a queued download job until it finishes; resolves with the job's result
+function waitForDownloadJob(job, onUpdate, interval = 2000) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(job.status_url || `/video/download/jobs/${job.job_id}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success) {
+                        throw new Error(data.error || 'Download job not found');
+                    }
+                    if (onUpdate) onUpdate(data);
+                    if (data.state === 'done') {
+                        resolve(data.result);
+                    } else if (data.state === 'failed') {
+                        reject(new Error(data.error || 'Download failed'));
+                    } else {
+                        setTimeout(poll, interval);
+                    }
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
+// Follow a download job over Server-Sent Events, falling back to polling
+function watchDownloadJob(job, onUpdate) {
+    if (!window.EventSource) {
+        return waitForDownloadJob(job, onUpdate);
+    }
+    return new Promise((resolve, reject) => {
+        const statusUrl = job.status_url || `/video/download/jobs/${job.job_id}`;
+        const source = new EventSource(`${statusUrl}/events`);
+        let settled = false;
+
+        source.addEventListener('progress', e => {
+            if (onUpdate) onUpdate(JSON.parse(e.data));
+        });
+        source.addEventListener('state', e => {
+            const data = JSON.parse(e.data);
+            if (onUpdate) onUpdate(data);
+            if (data.state === 'done') {
+                settled = true;
+                source.close();
+                resolve(data.result);
+            } else if (data.state === 'failed') {
+                settled = true;
+                source.close();
+                reject(new Error(data.error || 'Download failed'));
+            }
+        });
+        source.onerror = () => {
+            if (settled) return;
+            // The stream dropped before the job finished; keep following it by polling
+            source.close();
+            waitForDownloadJob(job, onUpdate).then(resolve, reject);
+        };
+    });
+}
+
+// Submit a download job; resolves with the download result once it is ready
+function startDownloadJob(videoId, itag, onUpdate) {
+    return fetch(`/video/download/${videoId}?itag=${itag}`)
+        .then(async response => {
+            const contentType = response.headers.get("content-type");
+            if (!contentType || !contentType.includes("application/json")) {
+                const text = await response.text();
+                console.error("Expected JSON but got:", text.substring(0, 100));
+                throw new Error("Server returned an invalid response (HTML instead of JSON). Please try again later.");
+            }
+            const data = await response.json();
+            if (!data.success) {
+                throw new Error(data.error || 'Download failed');
+            }
+            return data;
+        })
+        .then(job => {
+            if (onUpdate) onUpdate(job);
+            // Already in the download store: no job was queued
+            if (job.state === 'done') return job.result;
+            return watchDownloadJob(job, onUpdate);
+        });
+}
+
 // Function to download a specific stream
 function downloadStream(videoId, itag) {
     // Safe version of getting elements with fallback
@@ -201,22 +327,20 @@ function downloadStream(videoId, itag) {
         return;
     }
     
-    // Show loading state
+    // Show progress state, falling back to the loading spinner
+    const downloadProgress = document.getElementById('downloadProgress');
     downloadContent.classList.add('d-none');
-    downloadLoading.classList.remove('d-none');
     downloadError.classList.add('d-none');
+    if (downloadProgress) {
+        downloadProgress.classList.remove('d-none');
+    } else {
+        downloadLoading.classList.remove('d-none');
+    }
     
-    // Start download
-    fetch(`/video/download/${videoId}?itag=${itag}`)
-        .then(async response => {
-            const contentType = response.headers.get("content-type");
-            if (!contentType || !contentType.includes("application/json")) {
-                const text = await response.text();
-                console.error("Expected JSON but got:", text.substring(0, 100));
-                throw new Error("Server returned an invalid response (HTML instead of JSON). Please try again later.");
-            }
-            return response.json();
-        })
+    // Queue the download and wait for the job to finish
+    const downloadStatus = document.getElementById('downloadStatus');
+    const downloadProgressBar = document.getElementById('downloadProgressBar');
+    startDownloadJob(videoId, itag, event => showDownloadProgress(event, downloadProgressBar, downloadStatus))
         .then(data => {
             // Hide loading
             downloadLoading.classList.add('d-none');
@@ -244,8 +368,8 @@ function downloadStream(videoId, itag) {
                 // Update download link
                 const downloadLink = document.getElementById('downloadLink');
                 if (downloadLink) {
-                    downloadLink.href = '/' + data.file_path;
-                    downloadLink.download = data.file_path.split('/').pop();
+                    downloadLink.href = data.download_url || '/' + data.file_path;
+                    downloadLink.download = data.download_name || data.file_path.split('/').pop();
                 }
             } else {
                 // If success element doesn't exist, show a notification toast
@@ -279,6 +403,7 @@ function downloadStream(videoId, itag) {
         .catch(error => {
             // Hide loading and show error
             downloadLoading.classList.add('d-none');
+            if (downloadProgress) downloadProgress.classList.add('d-none');
             downloadError.textContent = `Error: ${error.message}`;
             downloadError.classList.remove('d-none');
         });
@@ -417,6 +542,16 @@ function playVideo(videoId) {
     videoPlayer.scrollIntoView({ behavior: 'smooth' });
 }
 
+// Escape text scraped from YouTube before it goes into HTML markup or attributes
+function escapeHtml(value) {
+    return String(value ?? '')
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
 // Format view count
 function formatViews(viewsStr) {
     const views = parseInt(viewsStr.replace(/[^0-9]/g, ''));
@@ -584,6 +719,10 @@ document.addEventListener('DOMContentLoaded', function() {
             : "Search for YouTube channels...";
     });
     
+    // Query the current results belong to, used when loading further pages
+    let currentQuery = '';
+    let currentQueryType = currentSearchType;
+
     // Handle search form submission
     searchForm.addEventListener('submit', async function(e) {
         e.preventDefault();
@@ -612,12 +751,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error('Search failed: No data received');
             }
 
-            if (data.search_type === 'channels' && data.channels) {
-                displayChannelResults(data.channels, data.total_results);
-            } else if (data.search_type === 'videos' && data.results) {
-                displaySearchResults(data.results, data.total_results);
-            } else {
-                showError('No results found for your search.');
+            currentQuery = query;
+            currentQueryType = currentSearchType;
+
+            displayResults(data);
+            if (data.partial) {
+                // Stored matches came back at once; swap in YouTube's full page when it arrives
+                refreshFromUpstream(query, currentSearchType);
             }
         } catch (error) {
             showError(error.message);
@@ -626,8 +766,30 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    function displayResults(data) {
+        if (data.search_type === 'channels' && data.channels) {
+            displayChannelResults(data.channels, data.next_cursor);
+        } else if (data.search_type === 'videos' && data.results) {
+            displaySearchResults(data.results, data.next_cursor);
+        } else {
+            showError('No results found for your search.');
+        }
+    }
+
+    async function refreshFromUpstream(query, searchType) {
+        try {
+            const response = await fetch(`/search?q=${encodeURIComponent(query)}&type=${searchType}&upstream=1`);
+            const data = await response.json();
+            // Keep the stored matches if this failed or a newer search replaced them
+            if (!response.ok || data.error || query !== currentQuery || searchType !== currentQueryType) return;
+            displayResults(data);
+        } catch (error) {
+            console.error('Error fetching full results:', error);
+        }
+    }
+
     // Display search results with enhanced channel information
-    function displaySearchResults(results, totalResults) {
+    function displaySearchResults(results, nextCursor) {
         if (results.length === 0) {
             searchResults.innerHTML = `
                 <div class="col-12">
@@ -639,73 +801,69 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        let resultsHTML = `
+        const resultsHTML = `
             <div class="col-12 mb-3">
                 <div class="d-flex justify-content-between align-items-center">
                     <h3>Search Results</h3>
-                    <span class="badge bg-secondary">${results.length} of ${totalResults || results.length} videos found</span>
+                    <span class="badge bg-secondary" id="resultsCount">${results.length} videos found</span>
                 </div>
             </div>
         `;
         
-        // Add message for more results if available
-        if (totalResults > results.length) {
-            resultsHTML += `
-                <div class="col-12 mb-3">
-                    <div class="alert alert-info small" role="alert">
-                        <i class="bi bi-info-circle"></i> 
-                        Showing ${results.length} of ${totalResults} total videos. YouTube limits how many results we can fetch at once.
-                    </div>
-                </div>
-            `;
-        }
-        
-        searchResults.innerHTML = resultsHTML + results.map(video => `
+        searchResults.innerHTML = resultsHTML + results.map(renderVideoCard).join('');
+        renderLoadMore(nextCursor);
+    }
+
+    function renderVideoCard(video) {
+        const videoId = escapeHtml(video.id);
+        const title = escapeHtml(video.title);
+        const thumbnail = escapeHtml(video.thumbnail);
+        return `
             <div class="col-md-4 mb-4">
                 <div class="card h-100">
                     <div class="search-result" 
-                         onclick="playVideo('${video.id}')"
-                         data-video-id="${video.id}"
-                         data-title="${video.title.replace(/"/g, '&quot;')}"
-                         data-thumbnail="${video.thumbnail.replace(/"/g, '&quot;')}">
+                         onclick="playVideo('${videoId}')"
+                         data-video-id="${videoId}"
+                         data-title="${title}"
+                         data-thumbnail="${thumbnail}">
                         <div class="thumbnail-container">
-                            <img src="${video.thumbnail}" class="card-img-top" alt="${video.title}"
+                            <img src="${thumbnail}" class="card-img-top" alt="${title}"
                                  onerror="this.src='https://via.placeholder.com/480x360.png?text=Thumbnail+Unavailable'">
-                            <span class="duration-badge">${video.duration}</span>
+                            <span class="duration-badge">${escapeHtml(video.duration)}</span>
                         </div>
                         <div class="card-body">
-                            <h5 class="card-title text-truncate" title="${video.title}">${video.title}</h5>
+                            <h5 class="card-title text-truncate" title="${title}">${title}</h5>
                             <p class="card-text description text-muted small">
-                                ${video.description || 'No description available'}
+                                ${escapeHtml(video.description || 'No description available')}
                             </p>
                         </div>
                     </div>
                     <div class="card-footer bg-transparent border-top-0">
-                        <a href="${video.channel_id ? `/channel/${video.channel_id}` : '#'}" 
+                        <a href="${video.channel_id ? `/channel/${encodeURIComponent(video.channel_id)}` : '#'}" 
                            class="channel-link" 
                            title="Visit channel"
                            ${!video.channel_id ? 'disabled' : ''}
                            onclick="event.stopPropagation(); ${!video.channel_id ? 'return false' : ''}">
                             <small class="text-muted">
-                                <i class="bi bi-person-circle"></i> ${video.channel}
+                                <i class="bi bi-person-circle"></i> ${escapeHtml(video.channel)}
                             </small>
                         </a>
                         <div class="video-meta">
                             <small class="text-muted d-block">
-                                <i class="bi bi-eye"></i> ${formatViews(video.views)}
+                                <i class="bi bi-eye"></i> ${escapeHtml(formatViews(video.views))}
                             </small>
                             <small class="text-muted d-block">
-                                <i class="bi bi-clock"></i> ${video.publish_time}
+                                <i class="bi bi-clock"></i> ${escapeHtml(video.publish_time)}
                             </small>
                         </div>
                     </div>
                 </div>
             </div>
-        `).join('');
+        `;
     }
     
     // Display channel search results
-    function displayChannelResults(channels, totalResults) {
+    function displayChannelResults(channels, nextCursor) {
         if (channels.length === 0) {
             searchResults.innerHTML = `
                 <div class="col-12">
@@ -717,49 +875,93 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        let resultsHTML = `
+        const resultsHTML = `
             <div class="col-12 mb-3">
                 <div class="d-flex justify-content-between align-items-center">
                     <h3>Channel Results</h3>
-                    <span class="badge bg-secondary">${channels.length} of ${totalResults || channels.length} channels found</span>
+                    <span class="badge bg-secondary" id="resultsCount">${channels.length} channels found</span>
                 </div>
             </div>
         `;
         
-        // Add message for more results if available
-        if (totalResults > channels.length) {
-            resultsHTML += `
-                <div class="col-12 mb-3">
-                    <div class="alert alert-info small" role="alert">
-                        <i class="bi bi-info-circle"></i> 
-                        Showing ${channels.length} of ${totalResults} total channels. YouTube limits how many results we can fetch at once.
-                    </div>
-                </div>
-            `;
-        }
-        
-        searchResults.innerHTML = resultsHTML + channels.map(channel => `
+        searchResults.innerHTML = resultsHTML + channels.map(renderChannelCard).join('');
+        renderLoadMore(nextCursor);
+    }
+
+    function renderChannelCard(channel) {
+        const name = escapeHtml(channel.name);
+        return `
             <div class="col-md-4 mb-4">
                 <div class="card h-100">
                     <div class="channel-result">
                         <div class="channel-image-container text-center mt-3">
-                            <img src="${channel.thumbnail || 'https://via.placeholder.com/100x100.png?text=Channel'}" 
-                                 class="channel-image rounded-circle" alt="${channel.name}"
+                            <img src="${escapeHtml(channel.thumbnail || 'https://via.placeholder.com/100x100.png?text=Channel')}" 
+                                 class="channel-image rounded-circle" alt="${name}"
                                  onerror="this.src='https://via.placeholder.com/100x100.png?text=Channel'">
                         </div>
                         <div class="card-body text-center">
-                            <h5 class="card-title">${channel.name}</h5>
+                            <h5 class="card-title">${name}</h5>
                             <p class="card-text text-muted small">
-                                ${channel.subscriber_count || 'Subscriber count unavailable'}
+                                ${escapeHtml(channel.subscriber_count || 'Subscriber count unavailable')}
                             </p>
                             <p class="card-text description text-muted small">
-                                ${channel.description || 'No description available'}
+                                ${escapeHtml(channel.description || 'No description available')}
                             </p>
-                            <a href="/channel/${channel.id}" class="btn btn-primary btn-sm mt-2">View Channel</a>
+                            <a href="/channel/${encodeURIComponent(channel.id)}" class="btn btn-primary btn-sm mt-2">View Channel</a>
                         </div>
                     </div>
                 </div>
             </div>
-        `).join('');
+        `;
+    }
+
+    // Add a "Load more" button when YouTube has another page of results
+    function renderLoadMore(nextCursor) {
+        const existing = document.getElementById('loadMoreContainer');
+        if (existing) existing.remove();
+        if (!nextCursor) return;
+
+        searchResults.insertAdjacentHTML('beforeend', `
+            <div class="col-12 text-center mt-2 mb-5" id="loadMoreContainer">
+                <button type="button" class="btn btn-outline-primary" id="loadMoreButton">
+                    <i class="bi bi-arrow-down-circle"></i> Load more
+                </button>
+            </div>
+        `);
+        document.getElementById('loadMoreButton').addEventListener('click', () => loadMoreResults(nextCursor));
+    }
+
+    // Fetch the next page through its cursor and append it to the current results
+    async function loadMoreResults(cursor) {
+        const button = document.getElementById('loadMoreButton');
+        if (button) {
+            button.disabled = true;
+            button.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Loading...';
+        }
+
+        try {
+            const response = await fetch(`/search?q=${encodeURIComponent(currentQuery)}&type=${currentQueryType}&cursor=${encodeURIComponent(cursor)}`);
+            const data = await response.json();
+            if (!response.ok || data.error) {
+                throw new Error(data.error || 'Failed to load more results');
+            }
+
+            const items = data.search_type === 'channels' ? (data.channels || []) : (data.results || []);
+            const render = data.search_type === 'channels' ? renderChannelCard : renderVideoCard;
+            document.getElementById('loadMoreContainer').insertAdjacentHTML('beforebegin', items.map(render).join(''));
+
+            const resultsCount = document.getElementById('resultsCount');
+            if (resultsCount) {
+                const shown = searchResults.querySelectorAll('.card').length;
+                resultsCount.textContent = `${shown} ${data.search_type === 'channels' ? 'channels' : 'videos'} found`;
+            }
+            renderLoadMore(items.length ? data.next_cursor : null);
+        } catch (error) {
+            if (button) {
+                button.disabled = false;
+                button.innerHTML = '<i class="bi bi-arrow-clockwise"></i> Retry';
+            }
+            console.error('Error loading more results:', error);
+        }
     }
 });
\ No newline at end of file
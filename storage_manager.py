@@ -0,0 +1,237 @@
+import os
+import json
+import threading
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("lru", "lfu", "size")
+
+# Files modified this recently may still be being written and are never evicted
+WRITE_GRACE_SECONDS = 600
+
+# Seconds between saves of the access index
+ACCESS_FLUSH_INTERVAL = 30
+
+# Bookkeeping files that are not downloads
+IGNORED_SUFFIXES = (".json", ".events", ".lock", ".tmp")
+
+class StorageManager:
+    """Keeps a download folder under a byte quota
+
+    Accesses (``/downloads/<path>`` hits) are counted per file and saved to
+    ``.access.json``. When the folder is over quota, unpinned files are
+    deleted until usage drops to ``low_water`` of the quota, choosing victims
+    by ``policy``: "lru" (least recently accessed), "lfu" (fewest accesses)
+    or "size" (largest first). ``pinned`` returns the paths that must be kept,
+    e.g. files referenced by saved videos.
+    """
+
+    def __init__(self, folder: str, quota_bytes: int, policy: str = "lru", low_water: float = 0.9,
+                 pinned: Optional[Callable[[], Set[str]]] = None,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.folder = os.path.abspath(folder)
+        self.quota_bytes = quota_bytes
+        self.policy = policy
+        self.low_water = low_water
+        self._pinned = pinned
+        self._on_evict = on_evict
+        self._index_path = os.path.join(self.folder, '.access.json')
+        self._lock = threading.Lock()
+        self._enforce_lock = threading.Lock()
+        self._access: Dict[str, List[float]] = {}
+        self._last_flush = 0.0
+        self._stats = {
+            "evictions": 0,
+            "evicted_bytes": 0,
+            "enforcements": 0
+        }
+        os.makedirs(self.folder, exist_ok=True)
+        try:
+            with open(self._index_path) as f:
+                self._access = json.load(f)
+        except (OSError, ValueError):
+            self._access = {}
+
+    @classmethod
+    def from_env(cls, folder: str, **kwargs: Any) -> "StorageManager":
+        """Build a manager configured from DOWNLOADS_* environment variables"""
+        return cls(
+            folder,
+            quota_bytes=int(os.environ.get("DOWNLOADS_QUOTA_BYTES", 5 * 1024 ** 3)),
+            policy=os.environ.get("DOWNLOADS_EVICTION_POLICY", "lru"),
+            **kwargs
+        )
+
+    def _relpath(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.folder)
+
+    def record_access(self, path: str) -> None:
+        """Count a hit on a file (absolute, or relative to the folder)"""
+        rel = self._relpath(os.path.join(self.folder, path))
+        now = time.time()
+        with self._lock:
+            entry = self._access.setdefault(rel, [now, 0])
+            entry[0] = now
+            entry[1] += 1
+            flush = now - self._last_flush >= ACCESS_FLUSH_INTERVAL
+        if flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Save the access index"""
+        with self._lock:
+            snapshot = json.dumps(self._access)
+            self._last_flush = time.time()
+        tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(snapshot)
+            os.replace(tmp_path, self._index_path)
+        except OSError as e:
+            logger.warning(f"Could not save download access index: {str(e)}")
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        """List every download under the folder with its size and access stats"""
+        files = []
+        stack = [self.folder]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False) or entry.name.endswith(IGNORED_SUFFIXES):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                rel = self._relpath(entry.path)
+                last_access, hits = self._access.get(rel, (st.st_mtime, 0))
+                files.append({
+                    'path': rel,
+                    'size': st.st_size,
+                    'modified': st.st_mtime,
+                    'last_access': max(last_access, st.st_mtime),
+                    'hits': hits
+                })
+        return files
+
+    def _pinned_paths(self) -> Set[str]:
+        if self._pinned is None:
+            return set()
+        try:
+            return {self._relpath(path) for path in self._pinned() if path}
+        except Exception as e:
+            # Without knowing what is pinned nothing can be safely evicted
+            logger.error(f"Could not load pinned downloads: {str(e)}")
+            raise
+
+    def _victim_order(self, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.policy == "lfu":
+            return sorted(files, key=lambda f: (f['hits'], f['last_access']))
+        if self.policy == "size":
+            return sorted(files, key=lambda f: f['size'], reverse=True)
+        return sorted(files, key=lambda f: f['last_access'])
+
+    def enforce(self) -> Dict[str, Any]:
+        """Evict unpinned files until usage is under the low-water mark"""
+        if not self._enforce_lock.acquire(blocking=False):
+            return {'evicted': 0, 'skipped': True}  # Another thread is already at it
+        try:
+            with self._lock:
+                self._stats["enforcements"] += 1
+                files = self._scan()
+            used = sum(f['size'] for f in files)
+            if used <= self.quota_bytes:
+                return {'evicted': 0, 'used_bytes': used}
+
+            try:
+                pinned = self._pinned_paths()
+            except Exception:
+                return {'evicted': 0, 'used_bytes': used, 'error': 'pinned files unavailable'}
+
+            target = int(self.quota_bytes * self.low_water)
+            now = time.time()
+            candidates = [f for f in files
+                          if f['path'] not in pinned and now - f['modified'] > WRITE_GRACE_SECONDS]
+            evicted = 0
+            for victim in self._victim_order(candidates):
+                if used <= target:
+                    break
+                path = os.path.join(self.folder, victim['path'])
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not evict {path}: {str(e)}")
+                    continue
+                used -= victim['size']
+                evicted += 1
+                with self._lock:
+                    self._access.pop(victim['path'], None)
+                    self._stats["evictions"] += 1
+                    self._stats["evicted_bytes"] += victim['size']
+                if self._on_evict is not None:
+                    self._on_evict(path)
+                logger.info(f"Evicted download {victim['path']} ({victim['size']} bytes, policy {self.policy})")
+
+            if used > self.quota_bytes:
+                logger.warning(f"Downloads still over quota after eviction: {used} > {self.quota_bytes} bytes")
+            self.flush()
+            return {'evicted': evicted, 'used_bytes': used}
+        finally:
+            self._enforce_lock.release()
+
+    def get_usage(self, top: int = 10) -> Dict[str, Any]:
+        """Usage summary: totals, bytes per kind of file and the largest files"""
+        with self._lock:
+            files = self._scan()
+            stats = dict(self._stats)
+        try:
+            pinned = self._pinned_paths()
+        except Exception:
+            pinned = set()
+
+        kinds: Dict[str, Dict[str, int]] = {}
+        for f in files:
+            name = os.path.basename(f['path'])
+            if f['path'].startswith('store' + os.sep):
+                kind = 'store'
+            elif name.startswith('fallback_'):
+                kind = 'fallback'
+            elif '_thumbnail.' in name:
+                kind = 'thumbnail'
+            elif '_pytube.' in name:
+                kind = 'pytube'
+            elif name.endswith('.part'):
+                kind = 'partial'
+            else:
+                kind = 'other'
+            bucket = kinds.setdefault(kind, {'files': 0, 'bytes': 0})
+            bucket['files'] += 1
+            bucket['bytes'] += f['size']
+
+        used = sum(f['size'] for f in files)
+        return {
+            **stats,
+            'used_bytes': used,
+            'quota_bytes': self.quota_bytes,
+            'used_percent': round(used * 100 / self.quota_bytes, 1) if self.quota_bytes else None,
+            'files': len(files),
+            'pinned_files': sum(1 for f in files if f['path'] in pinned),
+            'pinned_bytes': sum(f['size'] for f in files if f['path'] in pinned),
+            'policy': self.policy,
+            'kinds': kinds,
+            'largest': [
+                dict(f, pinned=f['path'] in pinned)
+                for f in sorted(files, key=lambda f: f['size'], reverse=True)[:top]
+            ]
+        }
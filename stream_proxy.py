@@ -0,0 +1,354 @@
+import os
+import re
+import threading
+import logging
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import Response, request, stream_with_context
+from werkzeug.wsgi import wrap_file
+
+from http_client import UpstreamClient, upstream_client
+from segment_cache import INFLIGHT_WAIT_SECONDS, SegmentCache
+
+logger = logging.getLogger(__name__)
+
+# Read sizes for upstream bodies: start small so playback starts fast, grow
+# while the upstream keeps every read full and quick
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 1024 * 1024
+FAST_READ_SECONDS = 0.05
+SLOW_READ_SECONDS = 0.5
+
+# Block size handed to the server's file wrapper for files on disk
+FILE_BLOCK_SIZE = 1024 * 1024
+
+# Finished streams kept for /admin/stats
+RECENT_STREAMS = 20
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class _StreamStats:
+    """Counters for one proxied stream"""
+    __slots__ = ("id", "video_id", "source", "started", "finished", "bytes", "chunk_size", "error")
+
+    def __init__(self, video_id: str, source: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.video_id = video_id
+        self.source = source
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.bytes = 0
+        self.chunk_size = MIN_CHUNK
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            'id': self.id,
+            'video_id': self.video_id,
+            'source': self.source,
+            'seconds': round(elapsed, 2),
+            'bytes': self.bytes,
+            'throughput_bps': round(self.bytes / elapsed) if elapsed > 0 else None,
+            'chunk_size': self.chunk_size,
+            'error': self.error
+        }
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Resolve a single ``bytes=`` Range header to inclusive (start, end), or None for the whole file
+
+    Raises ValueError for ranges that cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None  # Multiple or malformed ranges: serve the whole file
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = min(int(last), size)
+        return size - length, size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+class StreamProxy:
+    """Relays video bytes to the browser from pooled upstream connections or from disk
+
+    Upstream bodies are read straight from the pooled connection's socket in
+    chunks that grow from MIN_CHUNK to MAX_CHUNK while the upstream keeps up
+    and shrink when it stalls. The response is a generator, so the next read
+    only happens once the server has written the previous chunk to the client:
+    a slow viewer throttles its upstream read instead of buffering in memory.
+
+    Files already on disk are handed to the server's ``wsgi.file_wrapper``,
+    which gunicorn sends with sendfile(2) without copying through Python.
+
+    With a ``segments`` cache, streams with a known format are served block
+    by block from it, fetching only the blocks that are missing.
+    """
+
+    def __init__(self, http: Optional[UpstreamClient] = None, segments: Optional[SegmentCache] = None):
+        self.http = http or upstream_client
+        self.segments = segments
+        self._lock = threading.Lock()
+        self._active: Dict[str, _StreamStats] = {}
+        self._recent = []
+        self._stats = {
+            "streams": 0,
+            "upstream_streams": 0,
+            "disk_streams": 0,
+            "cache_streams": 0,
+            "async_streams": 0,
+            "bytes": 0,
+            "errors": 0,
+            "peak_concurrent": 0
+        }
+
+    def track(self, video_id: str, source: str) -> _StreamStats:
+        """Start counting a stream; pass it to finish() when it ends"""
+        stream = _StreamStats(video_id, source)
+        with self._lock:
+            self._active[stream.id] = stream
+            self._stats["streams"] += 1
+            self._stats[f"{source}_streams"] += 1
+            self._stats["peak_concurrent"] = max(self._stats["peak_concurrent"], len(self._active))
+        return stream
+
+    def finish(self, stream: _StreamStats) -> None:
+        stream.finished = time.monotonic()
+        with self._lock:
+            if self._active.pop(stream.id, None) is None:
+                return
+            self._stats["bytes"] += stream.bytes
+            if stream.error:
+                self._stats["errors"] += 1
+            self._recent.append(stream.to_dict())
+            del self._recent[:-RECENT_STREAMS]
+
+    def _relay(self, upstream: Any, stream: _StreamStats) -> Iterator[bytes]:
+        chunk_size = MIN_CHUNK
+        try:
+            while True:
+                started = time.monotonic()
+                # Read the raw socket: no content decoding and no per-chunk iterator layers
+                chunk = upstream.raw.read(chunk_size, decode_content=False)
+                if not chunk:
+                    break
+                elapsed = time.monotonic() - started
+                if len(chunk) == chunk_size and elapsed < FAST_READ_SECONDS:
+                    chunk_size = min(chunk_size * 2, MAX_CHUNK)
+                elif elapsed > SLOW_READ_SECONDS:
+                    chunk_size = max(chunk_size // 2, MIN_CHUNK)
+                stream.chunk_size = chunk_size
+                stream.bytes += len(chunk)
+                yield chunk
+        except Exception as e:
+            stream.error = str(e)
+            logger.error(f"Stream {stream.id} for {stream.video_id} failed: {str(e)}")
+        finally:
+            # Hand the keep-alive connection back to the pool
+            upstream.close()
+            self.finish(stream)
+
+    def proxy(self, video_id: str, url: str, headers: Dict[str, str]) -> Response:
+        """Relay ``url`` (honouring the request's Range header) from upstream"""
+        headers = dict(headers)
+        range_header = request.headers.get('Range')
+        if range_header:
+            headers['Range'] = range_header
+        upstream = self.http.get(url, headers=headers, stream=True)
+        if upstream.status_code >= 400:
+            upstream.close()
+            return Response(f"Upstream returned {upstream.status_code}", status=502)
+
+        response_headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Type': upstream.headers.get('Content-Type', 'video/mp4'),
+        }
+        for h in ['Content-Length', 'Content-Range', 'Accept-Ranges']:
+            if h in upstream.headers:
+                response_headers[h] = upstream.headers[h]
+
+        stream = self.track(video_id, "upstream")
+        return Response(stream_with_context(self._relay(upstream, stream)),
+                        status=upstream.status_code,
+                        headers=response_headers,
+                        direct_passthrough=True)
+
+    def _probe(self, url: str, headers: Dict[str, str]) -> Optional[Tuple[int, str]]:
+        """Ask upstream for a stream's total size and content type"""
+        upstream = self.http.get(url, headers={**headers, 'Range': 'bytes=0-0'}, stream=True)
+        try:
+            content_range = upstream.headers.get('Content-Range', '')
+            if upstream.status_code != 206 or '/' not in content_range:
+                return None
+            total = content_range.rsplit('/', 1)[1]
+            if not total.isdigit():
+                return None
+            return int(total), upstream.headers.get('Content-Type', 'video/mp4')
+        finally:
+            upstream.close()
+
+    def _fetch_blocks(self, video_id: str, format_id: str, url: str, headers: Dict[str, str],
+                      blocks: List[int], size: int) -> Iterator[Tuple[int, bytes]]:
+        """Fetch a run of claimed blocks with one upstream request, storing and yielding each"""
+        segments = self.segments
+        first = blocks[0] * segments.block_size
+        last = min((blocks[-1] + 1) * segments.block_size, size) - 1
+        pending = list(blocks)
+        upstream = self.http.get(url, headers={**headers, 'Range': f"bytes={first}-{last}"}, stream=True)
+        try:
+            if upstream.status_code != 206:
+                raise IOError(f"Upstream returned {upstream.status_code} for bytes {first}-{last}")
+            buffer = bytearray()
+            while pending:
+                index = pending[0]
+                needed = segments.block_length(size, index)
+                chunk = upstream.raw.read(min(MAX_CHUNK, needed - len(buffer)), decode_content=False)
+                if not chunk:
+                    raise IOError(f"Upstream ended early in block {index} of {video_id}/{format_id}")
+                buffer += chunk
+                if len(buffer) == needed:
+                    block = bytes(buffer)
+                    buffer.clear()
+                    pending.pop(0)
+                    segments.store(video_id, format_id, index, block)
+                    yield index, block
+        finally:
+            upstream.close()
+            if pending:
+                segments.release(video_id, format_id, pending)
+
+    def _relay_segments(self, video_id: str, format_id: str, url: str, headers: Dict[str, str],
+                        size: int, start: int, end: int, stream: _StreamStats) -> Iterator[bytes]:
+        segments = self.segments
+        block_size = segments.block_size
+        index, last = start // block_size, end // block_size
+
+        def window(i: int) -> Tuple[int, int]:
+            """The requested part of block i, relative to the block"""
+            block_start = i * block_size
+            return max(start - block_start, 0), min(end + 1 - block_start, segments.block_length(size, i))
+
+        try:
+            while index <= last:
+                lo, hi = window(index)
+                data = segments.read(video_id, format_id, index, lo, hi)
+                if data is not None:
+                    stream.bytes += len(data)
+                    yield data
+                    index += 1
+                    continue
+
+                claimed, event = segments.claim(video_id, format_id, index, last)
+                if event is not None:
+                    # Another request is fetching this block; read it once it lands
+                    event.wait(INFLIGHT_WAIT_SECONDS)
+                    continue
+                for fetched, block in self._fetch_blocks(video_id, format_id, url, headers, claimed, size):
+                    lo, hi = window(fetched)
+                    stream.bytes += hi - lo
+                    yield block[lo:hi]
+                    index = fetched + 1
+        except Exception as e:
+            stream.error = str(e)
+            logger.error(f"Stream {stream.id} for {video_id}/{format_id} failed: {str(e)}")
+        finally:
+            self.finish(stream)
+
+    def proxy_cached(self, video_id: str, format_id: Optional[str], url: str, headers: Dict[str, str]) -> Response:
+        """Relay ``url`` through the segment cache, falling back to a plain proxy"""
+        if self.segments is None or not format_id:
+            return self.proxy(video_id, url, headers)
+        meta = self.segments.get_meta(video_id, format_id)
+        if meta is None:
+            probed = self._probe(url, headers)
+            if probed is None:
+                return self.proxy(video_id, url, headers)
+            meta = self.segments.set_meta(video_id, format_id, *probed)
+        size = meta['size']
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            return Response(status=416, headers={'Content-Range': f"bytes */{size}"})
+        start, end = byte_range if byte_range is not None else (0, size - 1)
+
+        response_headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Type': meta['content_type'],
+            'Content-Length': str(end - start + 1)
+        }
+        if byte_range is not None:
+            response_headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+        stream = self.track(video_id, "cache")
+        body = self._relay_segments(video_id, format_id, url, headers, size, start, end, stream)
+        return Response(stream_with_context(body), status=206 if byte_range is not None else 200,
+                        headers=response_headers, direct_passthrough=True)
+
+    def _read_file(self, f: Any, remaining: int, stream: _StreamStats) -> Iterator[bytes]:
+        try:
+            while remaining > 0:
+                chunk = f.read(min(FILE_BLOCK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                stream.bytes += len(chunk)
+                yield chunk
+        finally:
+            f.close()
+            self.finish(stream)
+
+    def serve_file(self, video_id: str, path: str, mime_type: str) -> Response:
+        """Serve a file on disk (honouring the request's Range header)"""
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            return Response(status=416, headers={'Content-Range': f"bytes */{size}"})
+        start, end = byte_range if byte_range is not None else (0, size - 1)
+        length = end - start + 1
+
+        f = open(path, 'rb')
+        f.seek(start)
+        stream = self.track(video_id, "disk")
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Type': mime_type,
+            'Content-Length': str(length)
+        }
+        if byte_range is not None:
+            headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+
+        if end == size - 1:
+            # Runs to the end of the file, so the server's file wrapper
+            # (sendfile under gunicorn) can send it from the current offset
+            stream.bytes = length
+            body = wrap_file(request.environ, f, FILE_BLOCK_SIZE)
+            self.finish(stream)
+        else:
+            body = self._read_file(f, length, stream)
+        return Response(body, status=206 if byte_range is not None else 200,
+                        headers=headers, direct_passthrough=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = [stream.to_dict() for stream in self._active.values()]
+            stats = {
+                **self._stats,
+                "active": len(active),
+                "active_streams": active,
+                "recent_streams": list(self._recent)
+            }
+        stats["segments"] = self.segments.get_stats() if self.segments is not None else None
+        return stats
+
+# Process-wide proxy used by /video/stream, caching stream blocks under
+# STREAM_CACHE_DIR (default ./stream_cache)
+stream_proxy = StreamProxy(segments=SegmentCache.from_env(os.path.join(os.getcwd(), 'stream_cache')))
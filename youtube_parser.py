@@ -0,0 +1,231 @@
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Markers YouTube uses to assign the initial page state. The blob is located
+# with a plain substring search and decoded with a single raw_decode call, so
+# the multi-megabyte HTML is only scanned once.
+INITIAL_DATA_MARKERS = (
+    'var ytInitialData = ',
+    'window["ytInitialData"] = ',
+    'ytInitialData = ',
+)
+
+class YouTubeDataParser:
+    """Extracts structured search/channel data from the ytInitialData blob"""
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+
+    def extract_initial_data(self, html_content: str) -> Optional[Dict[str, Any]]:
+        """Locate and decode the ytInitialData object embedded in a page"""
+        for marker in INITIAL_DATA_MARKERS:
+            start = html_content.find(marker)
+            if start == -1:
+                continue
+            brace = html_content.find('{', start + len(marker))
+            if brace == -1:
+                continue
+            try:
+                data, _ = self._decoder.raw_decode(html_content, brace)
+            except ValueError as e:
+                logger.debug(f"Failed to decode ytInitialData after {marker!r}: {e}")
+                continue
+            if isinstance(data, dict):
+                return data
+        logger.warning("ytInitialData not found in page")
+        return None
+
+    def iter_renderers(self, data: Any, *renderer_keys: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Walk the data tree in document order yielding (key, renderer) pairs
+
+        Matched renderers are not descended into, so nested renderers of the
+        same kind (e.g. channel links inside a video) are never reported twice.
+        """
+        wanted = set(renderer_keys)
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                children = []
+                for key, value in node.items():
+                    if key in wanted and isinstance(value, dict):
+                        yield key, value
+                    elif isinstance(value, (dict, list)):
+                        children.append(value)
+                stack.extend(reversed(children))
+            elif isinstance(node, list):
+                stack.extend(reversed([item for item in node if isinstance(item, (dict, list))]))
+
+    def find_first(self, data: Any, key: str) -> Optional[Any]:
+        """Return the first value stored under ``key`` anywhere in the tree"""
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                if key in node:
+                    return node[key]
+                stack.extend(reversed([v for v in node.values() if isinstance(v, (dict, list))]))
+            elif isinstance(node, list):
+                stack.extend(reversed([item for item in node if isinstance(item, (dict, list))]))
+        return None
+
+    @staticmethod
+    def text(value: Any, default: str = "") -> str:
+        """Flatten a YouTube text object ({simpleText} or {runs: [...]})"""
+        if not value:
+            return default
+        if isinstance(value, str):
+            return value
+        if 'simpleText' in value:
+            return value['simpleText']
+        runs = value.get('runs')
+        if runs:
+            return ''.join(run.get('text', '') for run in runs)
+        return value.get('content', default)
+
+    @staticmethod
+    def _thumbnail_url(value: Any) -> str:
+        thumbnails = (value or {}).get('thumbnails') or []
+        if not thumbnails:
+            return ""
+        url = thumbnails[-1].get('url', "")
+        return f"https:{url}" if url.startswith('//') else url
+
+    def parse_video_renderer(self, renderer: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Build a video result dict from a videoRenderer/gridVideoRenderer node"""
+        video_id = renderer.get('videoId')
+        if not video_id:
+            return None
+
+        owner_runs = (renderer.get('ownerText') or renderer.get('shortBylineText') or {}).get('runs') or [{}]
+        owner = owner_runs[0]
+        channel_id = (owner.get('navigationEndpoint') or {}).get('browseEndpoint', {}).get('browseId', "")
+
+        description = self.text(renderer.get('descriptionSnippet'))
+        if not description:
+            snippets = renderer.get('detailedMetadataSnippets') or [{}]
+            description = self.text(snippets[0].get('snippetText'))
+
+        duration = self.text(renderer.get('lengthText'))
+        if not duration:
+            for overlay in renderer.get('thumbnailOverlays') or []:
+                status = overlay.get('thumbnailOverlayTimeStatusRenderer')
+                if status:
+                    duration = self.text(status.get('text'))
+                    break
+
+        return {
+            'id': video_id,
+            'title': self.text(renderer.get('title'), "Untitled"),
+            'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            'channel': owner.get('text') or "Unknown Channel",
+            'channel_id': channel_id,
+            'views': self.text(renderer.get('viewCountText'), "No view count"),
+            'duration': duration or "Unknown duration",
+            'publish_time': self.text(renderer.get('publishedTimeText')),
+            'description': description
+        }
+
+    def parse_channel_renderer(self, renderer: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Build a channel result dict from a channelRenderer node"""
+        channel_id = renderer.get('channelId')
+        if not channel_id:
+            return None
+
+        channel_data = {
+            'id': channel_id,
+            'name': self.text(renderer.get('title'), "Unknown Channel"),
+            'thumbnail': self._thumbnail_url(renderer.get('thumbnail')),
+            'subscriber_count': self.text(renderer.get('subscriberCountText'), "Unknown subscribers"),
+            'description': self.text(renderer.get('descriptionSnippet'))
+        }
+
+        # Add handle if available (for better channel navigation)
+        browse = (renderer.get('navigationEndpoint') or {}).get('browseEndpoint', {})
+        base_url = browse.get('canonicalBaseUrl', "")
+        if base_url.startswith('/@'):
+            channel_data['handle'] = base_url[1:]
+
+        return channel_data
+
+    def parse_videos(self, data: Any, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Collect unique videos from every video renderer in the tree"""
+        videos = []
+        seen_videos = set()
+        for _, renderer in self.iter_renderers(data, 'videoRenderer', 'gridVideoRenderer'):
+            try:
+                video_data = self.parse_video_renderer(renderer)
+            except Exception as e:
+                logger.error(f"Error extracting video data: {str(e)}")
+                continue
+            if not video_data or video_data['id'] in seen_videos:
+                continue
+            seen_videos.add(video_data['id'])
+            videos.append(video_data)
+            if limit and len(videos) >= limit:
+                break
+        return videos
+
+    def parse_channels(self, data: Any, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Collect unique channels from every channelRenderer in the tree"""
+        channels = []
+        seen_channels = set()
+        for _, renderer in self.iter_renderers(data, 'channelRenderer'):
+            try:
+                channel_data = self.parse_channel_renderer(renderer)
+            except Exception as e:
+                logger.error(f"Error extracting channel data: {str(e)}")
+                continue
+            if not channel_data or channel_data['id'] in seen_channels:
+                continue
+            seen_channels.add(channel_data['id'])
+            channels.append(channel_data)
+            if limit and len(channels) >= limit:
+                break
+        return channels
+
+    def parse_channel_metadata(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract channel title and subscriber count from a channel page"""
+        metadata = (data.get('metadata') or {}).get('channelMetadataRenderer') or {}
+        title = metadata.get('title')
+        if not title:
+            title = self.text(self.find_first(data.get('header') or {}, 'title')) or None
+
+        subscriber_count = self.text(self.find_first(data.get('header') or {}, 'subscriberCountText'))
+        return {
+            'title': title,
+            'subscriber_count': subscriber_count or "Unknown subscribers"
+        }
+
+    def extract_continuation(self, data: Any) -> Optional[str]:
+        """Return the token for the next results page, if there is one"""
+        token = None
+        for _, renderer in self.iter_renderers(data, 'continuationItemRenderer'):
+            command = (renderer.get('continuationEndpoint') or {}).get('continuationCommand') or {}
+            if command.get('token'):
+                # The paging token is the last continuation item on the page
+                token = command['token']
+        return token
+
+    def extract_innertube_config(self, html_content: str) -> Dict[str, Any]:
+        """Pull the InnerTube API key and client context out of ytcfg"""
+        config = {}
+        start = html_content.find('"INNERTUBE_API_KEY":"')
+        if start != -1:
+            start += len('"INNERTUBE_API_KEY":"')
+            end = html_content.find('"', start)
+            if end != -1:
+                config['api_key'] = html_content[start:end]
+
+        start = html_content.find('"INNERTUBE_CONTEXT":')
+        if start != -1:
+            try:
+                context, _ = self._decoder.raw_decode(html_content, start + len('"INNERTUBE_CONTEXT":'))
+                if isinstance(context, dict) and 'client' in context:
+                    config['context'] = {'client': context['client']}
+            except ValueError as e:
+                logger.debug(f"Failed to decode INNERTUBE_CONTEXT: {e}")
+        return config
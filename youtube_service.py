@@ -1,13 +1,28 @@
 import requests
 
 import logging
-import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
 
+from cache import Cache
+from http_client import upstream_client
+from youtube_parser import YouTubeDataParser
 
 logger = logging.getLogger(__name__)
 
+# Used for continuation requests until a full page has supplied the live value
+DEFAULT_CLIENT_VERSION = "2.20240101.00.00"
+
 class YouTubeService:
-    def __init__(self):
+    def __init__(self, http_client=None, channel_urls: Optional[Cache] = None):
+        # Pooled keep-alive client shared with the rest of the app
+        self.http = http_client or upstream_client
+        # Alternative URLs are probed concurrently; the first to answer wins
+        self._probe_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="probe")
+        # Channel ID -> the channel page URL format that worked for it
+        self.channel_urls = channel_urls or Cache(
+            ttl_seconds=7 * 86400, max_size=10000, refresh_ahead=None, prefix="channel_url"
+        )
         self.base_url = "https://www.youtube.com"
         self.search_url = f"{self.base_url}/results"
         self.video_url = f"{self.base_url}/embed"
@@ -17,175 +32,131 @@ class YouTubeService:
             "watch",
             "shorts"
         ]
-
-    def _extract_video_id(self, html_content):
-        logger.debug("Starting video information extraction")
-        # Try to find the ytInitialData JSON object which contains structured data
-        try:
-            json_data_match = re.search(r'var ytInitialData = ({.*?});', html_content)
-            if json_data_match:
-                import json
-                data = json.loads(json_data_match.group(1))
-                # This is a complex structure, but often results are in:
-                # contents.twoColumnSearchResultsRenderer.primaryContents.sectionListRenderer.contents[0].itemSectionRenderer.contents
-                # For simplicity and robustness, we'll stick to regex if JSON parsing is too specific, 
-                # but we can improve regex patterns.
-        except Exception as e:
-            logger.debug(f"JSON extraction failed: {e}")
-
-        # Enhanced patterns for better metadata extraction
-        patterns = {
-            'video_id': r'\"videoId\":\"([^\"]{11})\"',
-            'title': r'\"title\":\{\"runs\":\[\{\"text\":\"([^\"]+?)\"\}\]',
-            'channel': r'\"ownerText\":\{\"runs\":\[\{\"text\":\"([^\"]+?)\"',
-            'channel_id': r'\"channelId\":\"([^\"]+?)\"',
-            'views': r'\"viewCountText\":\{\"simpleText\":\"([^\"]+?)\"',
-            'duration': r'\"lengthText\":\{\"simpleText\":\"([^\"]+?)\"',
-            'publish_time': r'\"publishedTimeText\":\{\"simpleText\":\"([^\"]+?)\"',
-            'description': r'\"descriptionSnippet\":\{\"runs\":\[\{\"text\":\"([^\"]+?)\"'
+        self.parser = YouTubeDataParser()
+        # InnerTube settings for continuation requests, refreshed from each full page
+        self.innertube_api_key = None
+        self.innertube_context = {
+            'client': {
+                'clientName': 'WEB',
+                'clientVersion': DEFAULT_CLIENT_VERSION,
+                'hl': 'en',
+                'gl': 'US'
+            }
         }
 
-        # Extract all patterns
-        matches = {
-            key: list(re.finditer(pattern, html_content))
-            for key, pattern in patterns.items()
+    def _update_innertube_config(self, html_content):
+        """Remember the InnerTube key/context from a full page for later continuations"""
+        config = self.parser.extract_innertube_config(html_content)
+        if config.get('api_key'):
+            self.innertube_api_key = config['api_key']
+        if config.get('context'):
+            self.innertube_context = config['context']
+
+    def continuation_request(self, endpoint: str, cursor: str) -> dict:
+        """Keyword arguments for the InnerTube continuation POST of ``endpoint``"""
+        params = {'prettyPrint': 'false'}
+        if self.innertube_api_key:
+            params['key'] = self.innertube_api_key
+        payload = {
+            'context': self.innertube_context,
+            'continuation': cursor
         }
-
-        logger.debug(f"Found matches - Videos: {len(matches['video_id'])}")
-
-        videos = []
-        seen_videos = set()
-
-        for i in range(min(len(matches['video_id']), 60)):  # Increased limit to show more videos
-            try:
-                video_id = matches['video_id'][i].group(1)
-
-                # Skip duplicates
-                if video_id in seen_videos:
-                    continue
-                seen_videos.add(video_id)
-
-                # Extract all available metadata
-                video_data = {
-                    'id': video_id,
-                    'title': matches['title'][i].group(1) if i < len(matches['title']) else "Untitled",
-                    'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
-                    'channel': matches['channel'][i].group(1) if i < len(matches['channel']) else "Unknown Channel",
-                    'channel_id': matches['channel_id'][i].group(1) if i < len(matches['channel_id']) else "",
-                    'views': matches['views'][i].group(1) if i < len(matches['views']) else "No view count",
-                    'duration': matches['duration'][i].group(1) if i < len(matches['duration']) else "Unknown duration",
-                    'publish_time': matches['publish_time'][i].group(1) if i < len(matches['publish_time']) else "",
-                    'description': matches['description'][i].group(1) if i < len(matches['description']) else ""
-                }
-                videos.append(video_data)
-                logger.debug(f"Successfully extracted video: {video_data['title']}")
-            except Exception as e:
-                logger.error(f"Error extracting video data: {str(e)}")
-                continue
-
-        return videos
-
-    def _extract_channel_info(self, html_content):
-        """Extract channel information from search results"""
-        logger.debug("Starting channel information extraction")
-        
-        # Enhanced patterns for channel data
-        patterns = {
-            'channel_id': r'\"channelId\":\"([^\"]+?)\"',
-            'channel_name': r'\"title\":\{\"simpleText\":\"([^\"]+?)\"\}',
-            'subscriber_count': r'\"subscriberCountText\":\{\"simpleText\":\"([^\"]+?)\"',
-            'thumbnail': r'\"thumbnail\":\{\"thumbnails\":\[\{\"url\":\"([^\"]+?)\"',
-            'description': r'\"descriptionSnippet\":\{\"runs\":\[\{\"text\":\"([^\"]+?)\"',
-            'handle': r'\"ownerText\":\{\"runs\":\[\{\"text\":\"([^\"]+?)\",\"navigationEndpoint\":\{\"commandMetadata\":\{\"webCommandMetadata\":\{\"url\":\"\\\/(@[^\"]+?)\"'
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        
-        # Extract all patterns
-        matches = {
-            key: list(re.finditer(pattern, html_content))
-            for key, pattern in patterns.items()
+        return {'url': f"{self.base_url}/youtubei/v1/{endpoint}", 'params': params, 'json': payload, 'headers': headers}
+
+    def _fetch_continuation(self, endpoint: str, cursor: str) -> dict:
+        """Fetch the next page of results from the InnerTube continuation API"""
+        request = self.continuation_request(endpoint, cursor)
+        response = self.http.post(request.pop('url'), **request)
+        response.raise_for_status()
+        return response.json()
+
+    def search_request(self, query: str, search_type="videos") -> dict:
+        """Keyword arguments for the GET of a first search results page"""
+        # Set parameters based on search type
+        if search_type == "channels":
+            # Filter for channels
+            sp_param = "EgIQAg%3D%3D"
+        else:
+            # Default filter for videos
+            sp_param = "CAISAhAB"
+
+        # Enhanced search parameters
+        params = {
+            'search_query': query,
+            'sp': sp_param,
+            'app': 'desktop',
         }
-        
-        logger.debug(f"Found matches - Channels: {len(matches['channel_id'])}")
-        
-        channels = []
-        seen_channels = set()
-        
-        for i in range(min(len(matches['channel_id']), 30)):
-            try:
-                channel_id = matches['channel_id'][i].group(1)
-                
-                # Skip duplicates
-                if channel_id in seen_channels:
-                    continue
-                seen_channels.add(channel_id)
-                
-                # Extract channel data
-                channel_data = {
-                    'id': channel_id,
-                    'name': matches['channel_name'][i].group(1) if i < len(matches['channel_name']) else "Unknown Channel",
-                    'thumbnail': matches['thumbnail'][i].group(1) if i < len(matches['thumbnail']) else "",
-                    'subscriber_count': matches['subscriber_count'][i].group(1) if i < len(matches['subscriber_count']) else "Unknown subscribers",
-                    'description': matches['description'][i].group(1) if i < len(matches['description']) else ""
-                }
-                
-                # Add handle if available (for better channel navigation)
-                if 'handle' in matches and i < len(matches['handle']):
-                    try:
-                        channel_data['handle'] = matches['handle'][i].group(2)
-                    except (IndexError, AttributeError):
-                        pass
-                
-                channels.append(channel_data)
-                logger.debug(f"Successfully extracted channel: {channel_data['name']}")
-            except Exception as e:
-                logger.error(f"Error extracting channel data: {str(e)}")
-                continue
-                
-        return channels
-
-    def search(self, query: str, search_type="videos") -> dict:
-        try:
-            logger.debug(f"Searching for query: {query}, type: {search_type}")
-            
-            # Set parameters based on search type
-            if search_type == "channels":
-                # Filter for channels
-                sp_param = "EgIQAg%3D%3D"
-            else:
-                # Default filter for videos
-                sp_param = "CAISAhAB"
-                
-            # Enhanced search parameters
-            params = {
-                'search_query': query,
-                'sp': sp_param,
-                'app': 'desktop',
-            }
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
 
-            response = requests.get(self.search_url, params=params, headers=headers)
-            response.raise_for_status()
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
+        return {'url': self.search_url, 'params': params, 'headers': headers}
+
+    def parse_search_page(self, html_content: str):
+        """Decode the page state of a search results page, remembering its InnerTube config"""
+        self._update_innertube_config(html_content)
+        return self.parser.extract_initial_data(html_content)
+
+    def search_results(self, data, search_type="videos") -> dict:
+        """Shape decoded search data (a full page or a continuation) as a results page"""
+        if data is None:
+            return {'results': [], 'search_type': search_type, 'next_cursor': None}
+
+        next_cursor = self.parser.extract_continuation(data)
+        if search_type == "channels":
+            channels = self.parser.parse_channels(data)
+            logger.debug(f"Found matches - Channels: {len(channels)}")
+            return {'channels': channels, 'search_type': 'channels', 'total_results': len(channels), 'next_cursor': next_cursor}
+        else:
+            videos = self.parser.parse_videos(data)
+            logger.debug(f"Found matches - Videos: {len(videos)}")
+            return {'results': videos, 'search_type': 'videos', 'total_results': len(videos), 'next_cursor': next_cursor}
+
+    def search(self, query: str, search_type="videos", cursor=None) -> dict:
+        try:
+            logger.debug(f"Searching for query: {query}, type: {search_type}, cursor: {bool(cursor)}")
 
-            if response.status_code == 200:
-                logger.debug("Successfully received search results from YouTube")
-                
-                if search_type == "channels":
-                    results = self._extract_channel_info(response.text)
-                    return {'channels': results[:15], 'search_type': 'channels', 'total_results': len(results)}
-                else:
-                    videos = self._extract_video_id(response.text)
-                    return {'results': videos[:20], 'search_type': 'videos', 'total_results': len(videos)}
+            if cursor:
+                # Subsequent pages come from the continuation endpoint, not the HTML page
+                data = self._fetch_continuation('search', cursor)
             else:
-                logger.error(f"YouTube search failed with status code: {response.status_code}")
-                return {'results': [], 'search_type': search_type}
+                request = self.search_request(query, search_type)
+                response = self.http.get(request.pop('url'), **request)
+                response.raise_for_status()
+                logger.debug("Successfully received search results from YouTube")
+                data = self.parse_search_page(response.text)
+
+            return self.search_results(data, search_type)
 
         except requests.RequestException as e:
             logger.error(f"Search request failed: {str(e)}")
             raise
 
+    def _preferred_success(self, candidates: List[Any], probe: Callable[[Any], Optional[Any]]) -> Optional[Any]:
+        """Run ``probe`` on every candidate at once and return the result of the first in list order that succeeds
+
+        A success is only returned once every candidate ahead of it has
+        failed, so the answer does not depend on which probe is fastest.
+        Probes behind it not yet started are cancelled; ones already running
+        finish in the background and their results are dropped.
+        """
+        futures = [self._probe_executor.submit(probe, candidate) for candidate in candidates]
+        try:
+            for future in futures:
+                try:
+                    result = future.result()
+                except Exception:
+                    continue
+                if result is not None:
+                    return result
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
+
     def get_video_url(self, video_id: str) -> dict:
         """Get video URL with availability check and metadata"""
         logger.debug(f"Attempting to get video URL for ID: {video_id}")
@@ -201,39 +172,43 @@ class YouTubeService:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
 
-        # First try to get video info
-        try:
+        def check_info():
             info_url = f"{self.base_url}/watch?v={video_id}"
-            response = requests.get(info_url, headers=headers)
+            return self.http.get(info_url, headers=headers).text.lower()
+
+        def probe(pattern):
+            if pattern == "embed":
+                url = f"{self.base_url}/embed/{video_id}?autoplay=1&rel=0&modestbranding=1"
+            elif pattern == "watch":
+                url = f"{self.base_url}/watch?v={video_id}"
+            else:
+                url = f"{self.base_url}/shorts/{video_id}"
+            try:
+                response = self.http.head(url, headers=headers, allow_redirects=True)
+            except requests.RequestException as e:
+                logger.warning(f"Failed to access {pattern} URL for video {video_id}: {str(e)}")
+                return None
+            if response.status_code == 200:
+                logger.debug(f"Successfully found working URL pattern: {pattern}")
+                return url
+            return None
 
-            if "age-restricted" in response.text.lower():
+        # The info page and the URL patterns are all probed at the same time
+        info_future = self._probe_executor.submit(check_info)
+        working_url = self._preferred_success(self.fallback_patterns, probe)
+
+        try:
+            page = info_future.result()
+            if "age-restricted" in page:
                 video_info['is_restricted'] = True
                 video_info['error_message'] = "This video is age-restricted"
-            elif "unavailable" in response.text.lower():
+            elif "unavailable" in page:
                 video_info['error_message'] = "This video is unavailable"
         except requests.RequestException as e:
             logger.warning(f"Failed to check video info: {str(e)}")
 
-        # Try different URL patterns if video isn't clearly restricted
         if not video_info['is_restricted']:
-            for pattern in self.fallback_patterns:
-                try:
-                    if pattern == "embed":
-                        url = f"{self.base_url}/embed/{video_id}?autoplay=1&rel=0&modestbranding=1"
-                    elif pattern == "watch":
-                        url = f"{self.base_url}/watch?v={video_id}"
-                    else:
-                        url = f"{self.base_url}/shorts/{video_id}"
-
-                    response = requests.head(url, headers=headers, allow_redirects=True)
-                    if response.status_code == 200:
-                        video_info['url'] = url
-                        logger.debug(f"Successfully found working URL pattern: {pattern}")
-                        break
-
-                except requests.RequestException as e:
-                    logger.warning(f"Failed to access {pattern} URL for video {video_id}: {str(e)}")
-                    continue
+            video_info['url'] = working_url
 
         # If no URL was found but no specific error was detected
         if not video_info['url'] and not video_info['error_message']:
@@ -241,98 +216,97 @@ class YouTubeService:
 
         return video_info
 
-    def get_channel_videos(self, channel_id: str) -> dict:
+    def _channel_urls(self, channel_id: str) -> List[str]:
+        """Channel page URL formats that may fit an ID"""
+        # Handle both @ handles and channel IDs
+        if channel_id.startswith('@'):
+            return [f"{self.base_url}/{channel_id}/videos"]
+        if channel_id.startswith('UC'):
+            return [f"{self.base_url}/channel/{channel_id}/videos"]
+        # Try all formats if the channel ID format is unclear
+        return [
+            f"{self.base_url}/c/{channel_id}/videos",
+            f"{self.base_url}/channel/{channel_id}/videos",
+            f"{self.base_url}/@{channel_id}/videos",
+            f"{self.base_url}/user/{channel_id}/videos"
+        ]
+
+    def _fetch_channel_page(self, channel_id: str) -> Optional[str]:
+        """Return the HTML of a channel's videos tab, probing URL formats concurrently
+
+        The URL that worked is remembered per channel ID, so later visits
+        fetch it directly.
+        """
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
+
+        def fetch(url):
+            try:
+                logger.debug(f"Trying channel URL: {url}")
+                response = self.http.get(url, headers=headers)
+            except requests.RequestException as e:
+                logger.warning(f"Failed to access {url}: {str(e)}")
+                return None
+            if response.status_code == 200:
+                logger.debug(f"Successfully received channel page HTML from {url}")
+                return url, response.text
+            return None
+
+        known_url = self.channel_urls.get(channel_id)
+        if known_url:
+            found = fetch(known_url)
+            if found:
+                return found[1]
+            # The channel moved or was renamed; probe again
+            self.channel_urls.delete(channel_id)
+
+        candidates = self._channel_urls(channel_id)
+        found = fetch(candidates[0]) if len(candidates) == 1 else self._preferred_success(candidates, fetch)
+        if not found:
+            return None
+        self.channel_urls.set(channel_id, found[0])
+        return found[1]
+
+    def get_channel_videos(self, channel_id: str, cursor=None) -> dict:
         """Fetch videos for a specific channel"""
         if not channel_id:
             logger.error("Channel ID is required")
             return {'error': 'Channel ID is required'}
 
+        if cursor:
+            return self._get_channel_videos_page(channel_id, cursor)
+
         try:
             logger.debug(f"Fetching videos for channel: {channel_id}")
-            # Try multiple URL formats for channels
-            channel_urls = []
-            
-            # Handle both @ handles and channel IDs
-            if channel_id.startswith('@'):
-                channel_urls.append(f"{self.base_url}/{channel_id}/videos")
-            elif channel_id.startswith('UC'):
-                channel_urls.append(f"{self.base_url}/channel/{channel_id}/videos")
-            else:
-                # Try all formats if the channel ID format is unclear
-                channel_urls = [
-                    f"{self.base_url}/c/{channel_id}/videos",
-                    f"{self.base_url}/channel/{channel_id}/videos",
-                    f"{self.base_url}/@{channel_id}/videos",
-                    f"{self.base_url}/user/{channel_id}/videos"
-                ]
-
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            # Try all URL formats until one works
-            html_content = None
-            for url in channel_urls:
-                try:
-                    logger.debug(f"Trying channel URL: {url}")
-                    response = requests.get(url, headers=headers)
-                    if response.status_code == 200:
-                        html_content = response.text
-                        logger.debug(f"Successfully received channel page HTML from {url}")
-                        break
-                except requests.RequestException as e:
-                    logger.warning(f"Failed to access {url}: {str(e)}")
-                    continue
-
+            html_content = self._fetch_channel_page(channel_id)
             if not html_content:
                 logger.error("All channel URL formats failed")
                 return {'error': 'Channel not found or unavailable'}
 
-            # Extract channel information with multiple patterns
-            channel_title_pattern = r'\"title\":\"([^\"]+?)\"'
-            
-            # Try multiple subscriber count patterns
-            subscriber_patterns = [
-                r'\"subscriberCountText\":\{\"simpleText\":\"([^\"]+?)\"',
-                r'\"subscriberCountText\":\{\"runs\":\[\{\"text\":\"([^\"]+?)\"',
-                r'subscribers\":\{\"simpleText\":\"([^\"]+?)\"',
-                r'\"subCount\":\"([^\"]+?)\"'
-            ]
-
-            channel_title_match = re.search(channel_title_pattern, html_content)
-            
-            # Try all subscriber patterns
-            subscriber_match = None
-            for pattern in subscriber_patterns:
-                subscriber_match = re.search(pattern, html_content)
-                if subscriber_match:
-                    logger.debug(f"Found subscriber count with pattern: {pattern}")
-                    break
+            # Decode the page state once and reuse it for metadata and videos
+            data = self.parser.extract_initial_data(html_content)
+            if data is None:
+                logger.error("Could not find channel data in response")
+                return {'error': 'Channel not found'}
+
+            self._update_innertube_config(html_content)
+            metadata = self.parser.parse_channel_metadata(data)
 
             # Check if we got valid channel data
-            if not channel_title_match:
+            if not metadata['title']:
                 logger.error("Could not find channel title in response")
                 return {'error': 'Channel not found'}
 
-            # Extract videos using the same pattern as search results
-            videos = self._extract_video_id(html_content)
-            
-            # Format videos with consistent metadata for display
-            for video in videos:
-                # Make sure view count is properly formatted
-                if 'views' in video and video['views']:
-                    if not any(substring in video['views'].lower() for substring in ['views', 'view']):
-                        video['views'] = f"{video['views']} views"
-            
-            # Get as many videos as we can extract, up to 50
-            max_videos = 50
-            
+            videos = self._format_channel_videos(self.parser.parse_videos(data), metadata['title'])
+
             channel_data = {
                 'id': channel_id,
-                'title': channel_title_match.group(1) if channel_title_match else "Unknown Channel",
-                'subscriber_count': subscriber_match.group(1) if subscriber_match else "Unknown subscribers",
-                'videos': videos[:max_videos],  # Show more videos for better channel browsing
-                'video_count': len(videos)  # Store the total number of videos we found
+                'title': metadata['title'],
+                'subscriber_count': metadata['subscriber_count'],
+                'videos': videos,
+                'video_count': len(videos),  # Number of videos on this page
+                'next_cursor': self.parser.extract_continuation(data)
             }
 
             if not channel_data['videos']:
@@ -344,4 +318,35 @@ class YouTubeService:
 
         except Exception as e:
             logger.error(f"Channel fetch request failed: {str(e)}")
-            return {'error': f'Failed to fetch channel data: {str(e)}'}
\ No newline at end of file
+            return {'error': f'Failed to fetch channel data: {str(e)}'}
+
+    def _get_channel_videos_page(self, channel_id: str, cursor: str) -> dict:
+        """Fetch a further page of channel videos from a continuation cursor"""
+        try:
+            logger.debug(f"Fetching next page of videos for channel: {channel_id}")
+            return self.channel_page_results(channel_id, self._fetch_continuation('browse', cursor))
+        except Exception as e:
+            logger.error(f"Channel continuation request failed: {str(e)}")
+            return {'error': f'Failed to fetch channel data: {str(e)}'}
+
+    def channel_page_results(self, channel_id: str, data: dict) -> dict:
+        """Shape a decoded channel continuation as a page of videos"""
+        videos = self._format_channel_videos(self.parser.parse_videos(data))
+        return {
+            'id': channel_id,
+            'videos': videos,
+            'video_count': len(videos),
+            'next_cursor': self.parser.extract_continuation(data)
+        }
+
+    def _format_channel_videos(self, videos, channel_title=None):
+        """Format videos with consistent metadata for display"""
+        for video in videos:
+            # Make sure view count is properly formatted
+            if 'views' in video and video['views']:
+                if not any(substring in video['views'].lower() for substring in ['views', 'view']):
+                    video['views'] = f"{video['views']} views"
+            # Channel tab renderers omit the owner, so fill it from the page
+            if channel_title and video['channel'] == "Unknown Channel":
+                video['channel'] = channel_title
+        return videos
\ No newline at end of file